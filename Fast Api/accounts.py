@@ -0,0 +1,337 @@
+"""
+Customer accounts: registration, login and saved delivery addresses.
+
+Passwords are hashed with scrypt (hashlib, memory-hard) on a small dedicated
+thread pool, so a burst of logins neither blocks the event loop nor takes
+every threadpool worker (each hash holds ~32 MB while it runs). Stored as
+
+    scrypt$<n>$<r>$<p>$<salt b64>$<hash b64>
+
+so the cost can be raised later; older hashes keep verifying and are
+rehashed at the next login.
+
+A login sets the modesta_session cookie: the user id, name and expiry,
+signed with HMAC-SHA256. Reading it is a signature check, so authenticated
+requests need no store lookup; only pages that show account data (saved
+addresses) read the store. The key comes from MODESTA_SESSION_SECRET or is
+created once in MODESTA_SESSION_SECRET_FILE, shared by all workers;
+changing it signs everybody out.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import settings
+from metrics import REGISTRY, Counter
+
+SESSION_COOKIE = "modesta_session"
+
+LOGINS = REGISTRY.register(Counter("modesta_account_logins_total", "Login attempts by outcome", ("result",)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS addresses (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    label TEXT NOT NULL,
+    name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    governorate TEXT,
+    address TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_addresses_user ON addresses(user_id);
+"""
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s.]{2,}$")
+MIN_PASSWORD_LENGTH = 8
+SCRYPT_R, SCRYPT_P = 8, 1
+
+# Small on purpose: this bounds scrypt's memory, and logins beyond it queue instead of starving other work
+PASSWORD_POOL = ThreadPoolExecutor(settings.PASSWORD_WORKERS, thread_name_prefix="password-hash")
+
+
+class AccountError(ValueError):
+    pass
+
+
+# --- PASSWORDS ---
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # OpenSSL's default memory cap is below what n=2**15 needs
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=256 * r * n, dklen=32)
+
+
+def hash_password(password: str, n: int = settings.PASSWORD_SCRYPT_N) -> str:
+    salt = secrets.token_bytes(16)
+    return f"scrypt${n}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(_scrypt(password, salt, n, SCRYPT_R, SCRYPT_P))}"
+
+
+def verify_password(password: str, stored: str) -> bool:
+    try:
+        scheme, n, r, p, salt, digest = stored.split("$")
+        if scheme != "scrypt":
+            return False
+        return hmac.compare_digest(_scrypt(password, _unb64(salt), int(n), int(r), int(p)), _unb64(digest))
+    except ValueError:
+        return False
+
+
+def needs_rehash(stored: str) -> bool:
+    return not stored.startswith(f"scrypt${settings.PASSWORD_SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
+async def run_hashing(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(PASSWORD_POOL, func, *args)
+
+
+@lru_cache(maxsize=1)
+def _dummy_hash() -> str:
+    # Checked when the email is unknown, so a login takes as long whether or not the account exists
+    return hash_password(secrets.token_urlsafe(16))
+
+
+def verify_login(password: str, stored: Optional[str]) -> bool:
+    """
+    verify_password against the stored hash, or the dummy one when there is no account; runs on PASSWORD_POOL
+    (the dummy is hashed there too, the first time it is needed).
+    """
+    return verify_password(password, stored if stored is not None else _dummy_hash())
+
+
+# --- SESSIONS ---
+
+def _load_secret() -> bytes:
+    if settings.SESSION_SECRET:
+        return settings.SESSION_SECRET.encode("utf-8")
+    path = settings.SESSION_SECRET_FILE
+    try:
+        # O_EXCL: when several workers start together, one creates the key and the rest read it
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(50):
+            with open(path, "rb") as f:
+                key = f.read()
+            if key:
+                return key
+            time.sleep(0.01)
+        raise RuntimeError(f"{path} is empty")
+    key = secrets.token_urlsafe(32).encode("ascii")
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+@dataclass
+class SessionUser:
+    id: int
+    name: str
+    expires: int
+
+
+class SessionSigner:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._key: Optional[bytes] = None
+        self._lock = threading.Lock()
+
+    @property
+    def key(self) -> bytes:
+        if self._key is None:
+            with self._lock:
+                if self._key is None:
+                    self._key = _load_secret()
+        return self._key
+
+    def _sign(self, payload: str) -> str:
+        return _b64(hmac.new(self.key, payload.encode("ascii"), hashlib.sha256).digest())
+
+    def issue(self, user_id: int, name: str) -> str:
+        payload = _b64(json.dumps({"u": user_id, "n": name, "e": int(time.time() + self.ttl_seconds)},
+                                  separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+        return f"{payload}.{self._sign(payload)}"
+
+    def read(self, token: Optional[str]) -> Optional[SessionUser]:
+        """
+        The user a cookie was issued for, or None if it is missing, forged or expired. No store lookup.
+        """
+        if not token or "." not in token:
+            return None
+        payload, signature = token.rsplit(".", 1)
+        try:
+            if not hmac.compare_digest(self._sign(payload), signature):
+                return None
+            data = json.loads(_unb64(payload))
+        except (TypeError, ValueError):  # non-ASCII or malformed tokens
+            return None
+        if data.get("e", 0) < time.time():
+            return None
+        return SessionUser(data["u"], data["n"], data["e"])
+
+
+SESSIONS = SessionSigner(settings.SESSION_TTL_DAYS * 24 * 3600)
+
+
+# --- STORE ---
+
+@dataclass
+class Address:
+    id: int
+    label: str
+    name: str
+    phone: str
+    governorate: Optional[str]
+    address: str
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "label": self.label, "name": self.name, "phone": self.phone,
+                "governorate": self.governorate, "address": self.address}
+
+
+class AccountStore:
+    def __init__(self, path: str, max_addresses: int):
+        self.path = path
+        self.max_addresses = max_addresses
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def create_user(self, email: str, name: str, phone: str, password_hash: str) -> int:
+        try:
+            with self._conn() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO users (email, name, phone, password_hash, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (email, name, phone, password_hash, time.time()))
+        except sqlite3.IntegrityError:
+            raise AccountError("An account with this email already exists")
+        return cursor.lastrowid
+
+    def find_login(self, email: str) -> Optional[tuple]:
+        """
+        (id, name, password_hash) for an email, case-insensitively.
+        """
+        return self._conn().execute("SELECT id, name, password_hash FROM users WHERE email = ?", (email,)).fetchone()
+
+    def set_password_hash(self, user_id: int, password_hash: str):
+        with self._conn() as conn:
+            conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, user_id))
+
+    def profile(self, user_id: int) -> Optional[dict]:
+        row = self._conn().execute("SELECT email, name, phone FROM users WHERE id = ?", (user_id,)).fetchone()
+        return {"email": row[0], "name": row[1], "phone": row[2]} if row else None
+
+    def addresses(self, user_id: int) -> List[Address]:
+        rows = self._conn().execute(
+            "SELECT id, label, name, phone, governorate, address FROM addresses WHERE user_id = ? ORDER BY id",
+            (user_id,)).fetchall()
+        return [Address(*row) for row in rows]
+
+    def address(self, user_id: int, address_id: int) -> Optional[Address]:
+        row = self._conn().execute(
+            "SELECT id, label, name, phone, governorate, address FROM addresses WHERE user_id = ? AND id = ?",
+            (user_id, address_id)).fetchone()
+        return Address(*row) if row else None
+
+    def add_address(self, user_id: int, label: str, name: str, phone: str, governorate: Optional[str],
+                    address: str) -> Address:
+        with self._conn() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM addresses WHERE user_id = ?", (user_id,)).fetchone()[0]
+            if count >= self.max_addresses:
+                raise AccountError(f"At most {self.max_addresses} saved addresses")
+            cursor = conn.execute(
+                "INSERT INTO addresses (user_id, label, name, phone, governorate, address, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (user_id, label, name, phone, governorate, address, time.time()))
+        return Address(cursor.lastrowid, label, name, phone, governorate, address)
+
+    def delete_address(self, user_id: int, address_id: int) -> bool:
+        with self._conn() as conn:
+            return conn.execute("DELETE FROM addresses WHERE user_id = ? AND id = ?",
+                                (user_id, address_id)).rowcount > 0
+
+
+ACCOUNTS = AccountStore(settings.ACCOUNTS_DB, settings.ACCOUNT_MAX_ADDRESSES)
+
+
+# --- FLOWS ---
+# Hashing runs on PASSWORD_POOL, store reads and writes on the default executor; neither on the event loop
+
+async def _in_thread(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+def check_registration(email: str, password: str, name: str, phone: str):
+    if not EMAIL_RE.match(email):
+        raise AccountError("Please enter a valid email")
+    if len(password) < MIN_PASSWORD_LENGTH:
+        raise AccountError(f"Passwords need at least {MIN_PASSWORD_LENGTH} characters")
+    if len(name.strip()) < 2:
+        raise AccountError("Please enter your name")
+    if not phone.strip():
+        raise AccountError("Please enter your phone number")
+
+
+async def register(email: str, password: str, name: str, phone: str) -> Tuple[int, str]:
+    """
+    Creates the account; returns (user id, name) to issue a session for. Raises AccountError.
+    """
+    email, name = email.strip(), name.strip()
+    check_registration(email, password, name, phone)
+    password_hash = await run_hashing(hash_password, password)
+    user_id = await _in_thread(ACCOUNTS.create_user, email, name, phone.strip(), password_hash)
+    return user_id, name
+
+
+async def login(email: str, password: str) -> Optional[Tuple[int, str]]:
+    """
+    (user id, name) when the password matches, else None.
+    """
+    row = await _in_thread(ACCOUNTS.find_login, email.strip())
+    ok = await run_hashing(verify_login, password, row[2] if row else None)
+    if not row or not ok:
+        LOGINS.inc(result="failed")
+        return None
+    LOGINS.inc(result="ok")
+    if needs_rehash(row[2]):
+        await _in_thread(ACCOUNTS.set_password_hash, row[0], await run_hashing(hash_password, password))
+    return row[0], row[1]
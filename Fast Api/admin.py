@@ -0,0 +1,152 @@
+"""
+Admin-only routes. Every route on `router` requires the admin token, sent
+either as the `X-Admin-Token` header or the `token` query parameter.
+"""
+import hmac
+import io
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+import settings
+from catalog import CATALOG
+from catalog_io import detect_format, export_rows, import_feed
+from metrics import InstrumentedTemplates
+from notifications import OUTBOX
+from orders import ORDERS
+from profiling import DEFAULT_FOCUS, SamplingProfiler
+from shipping import SHIPPING
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None), token: Optional[str] = Query(None)):
+    supplied = x_admin_token or token or ""
+    if not settings.ADMIN_TOKEN or not hmac.compare_digest(supplied, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+templates = InstrumentedTemplates(directory="templates")
+
+
+@router.get("/", response_class=HTMLResponse)
+async def dashboard(request: Request, days: int = Query(30, ge=1, le=366), token: Optional[str] = None):
+    """
+    Sales dashboard. Reads only the pre-aggregated rollup tables.
+    """
+    data = await run_in_threadpool(ORDERS.dashboard, days)
+    return templates.TemplateResponse("admin.html", {"request": request, "data": data, "token": token or ""})
+
+
+@router.get("/api/sales")
+async def sales(days: int = Query(30, ge=1, le=366), top: int = Query(10, ge=1, le=100)):
+    return await run_in_threadpool(ORDERS.dashboard, days, top)
+
+
+@router.get("/api/notifications")
+async def notifications():
+    """
+    Outbox counts per provider and status, age of the oldest pending message and recent failures.
+    """
+    return await run_in_threadpool(OUTBOX.status)
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile(seconds: float = Query(10, gt=0, le=settings.PROFILE_MAX_SECONDS), all_threads: bool = False):
+    """
+    Samples every thread for `seconds` and returns collapsed stacks
+    (feed to flamegraph.pl or speedscope). By default only stacks that pass
+    through the store's handlers are kept; `all_threads=1` keeps everything.
+    """
+    profiler = SamplingProfiler(interval=settings.PROFILE_SAMPLE_INTERVAL,
+                                focus=None if all_threads else DEFAULT_FOCUS)
+    # Sleep in a worker thread so the event loop keeps serving the traffic being profiled
+    await run_in_threadpool(profiler.run_for, seconds)
+    return PlainTextResponse(profiler.collapsed(), headers={
+        "Content-Disposition": 'attachment; filename="profile.folded"'
+    })
+
+
+@router.post("/catalog/reload")
+async def reload_catalog():
+    """
+    Rebuilds the catalog snapshot from its source file without restarting workers.
+    """
+    # Parsing and indexing happen in a worker thread; only the final swap touches shared state
+    ok = await run_in_threadpool(CATALOG.reload)
+    snapshot = CATALOG.current()
+    if not ok:
+        raise HTTPException(status_code=422, detail=f"Catalog reload failed, still serving version {snapshot.version}")
+    return {"status": "success", "version": snapshot.version, "products": len(snapshot.products)}
+
+
+@router.post("/catalog/import")
+async def import_catalog(feed: UploadFile = File(...), format: Optional[str] = Query(None, pattern="^(csv|jsonl)$"),
+                         batch: int = Query(5000, ge=1, le=100000)):
+    """
+    Streams an uploaded CSV/JSONL supplier feed into the catalog store and
+    reloads the live catalog if it is served from that store.
+    """
+    fmt = format or detect_format(feed.filename or "")
+    stream = io.TextIOWrapper(feed.file, encoding="utf-8-sig", newline="")
+    stats = await run_in_threadpool(import_feed, stream, fmt, settings.CATALOG_DB, batch)
+    if os.path.abspath(CATALOG.path) == os.path.abspath(settings.CATALOG_DB):
+        await run_in_threadpool(CATALOG.reload)
+        stats["catalog_version"] = CATALOG.current().version
+    return stats
+
+
+@router.get("/catalog/export")
+async def export_catalog(format: str = Query("jsonl", pattern="^(csv|jsonl)$")):
+    if not os.path.exists(settings.CATALOG_DB):
+        raise HTTPException(status_code=404, detail="Catalog store is empty")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(export_rows(settings.CATALOG_DB, format), media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="catalog.{format}"'
+    })
+
+
+class QuoteItem(BaseModel):
+    product_id: int
+    quantity: int
+
+
+class QuoteRequest(BaseModel):
+    ref: Optional[str] = None
+    items: List[QuoteItem]
+    governorate: Optional[str] = None
+    address: Optional[str] = None
+
+
+class BatchQuote(BaseModel):
+    quotes: List[QuoteRequest] = Field(..., max_length=1000)
+
+
+@router.post("/api/shipping/quotes")
+async def shipping_quotes(batch: BatchQuote):
+    """
+    Shipping quotes for many carts at once (e.g. pricing phone orders or a bulk re-quote after a rate change).
+    Entries that can't be quoted get an "error" instead of failing the batch.
+    """
+    snapshot = CATALOG.current()
+    results, pending = [], []
+    for request in batch.quotes:
+        quantities = {}
+        for item in request.items:
+            if item.product_id in snapshot.by_id and item.quantity > 0:
+                quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+            else:
+                quantities = None
+                break
+        results.append({"ref": request.ref})
+        if not quantities:
+            results[-1]["error"] = "invalid items"
+        else:
+            pending.append((results[-1], (quantities, request.governorate, request.address)))
+    quotes = await run_in_threadpool(SHIPPING.quote_many, snapshot, [args for _, args in pending])
+    for (result, _), quote in zip(pending, quotes):
+        result.update(quote.to_dict() if quote else {"error": "unknown zone"})
+    return {"quotes": results, "version": SHIPPING.current().version}
@@ -0,0 +1,291 @@
+"""
+Self-hosted font and icon subsets.
+
+`python assets.py build` replaces the Google Fonts and Font Awesome CDN
+stylesheets with files the app serves itself:
+
+- WOFF2 subsets of Tajawal and Playfair Display, cut down to the Latin and
+  Arabic blocks plus every other character the templates, catalog, product
+  details and UI strings use (so catalog edits in either language keep
+  rendering without a rebuild), and fonts.css with their @font-face rules;
+- icons.svg, a sprite with one <symbol id="fa-NAME"> for each Font Awesome
+  icon the templates and the v3 app reference, instead of the whole icon
+  font and its CSS.
+
+Every file gets a content hash in its name and manifest.json maps logical
+names to them. The app serves the directory under ASSETS_BASE_URL with
+`Cache-Control: immutable`, so browsers never revalidate; a rebuild with
+different content produces new names. Until a build exists, templates fall
+back to the CDNs.
+
+Sources are downloaded into MODESTA_ASSET_SOURCES on first build (or can be
+put there by hand for offline builds). Subsetting needs fontTools with WOFF2
+support: pip install "fonttools[woff]".
+
+Usage:
+    python assets.py build [--out assets] [--sources assets_src]
+"""
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import urllib.request
+from typing import Dict, Iterable, List, Optional, Set
+from xml.etree import ElementTree
+
+from markupsafe import Markup, escape
+from starlette.responses import FileResponse
+
+import settings
+from static_export import PrecompressedStaticFiles
+
+MANIFEST = "manifest.json"
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# (family, CSS weight, source file, download URL); Playfair Display is a variable font covering 400-900
+FONT_SOURCES = [
+    ("Tajawal", "400", "Tajawal-Regular.ttf", "https://github.com/google/fonts/raw/main/ofl/tajawal/Tajawal-Regular.ttf"),
+    ("Tajawal", "500", "Tajawal-Medium.ttf", "https://github.com/google/fonts/raw/main/ofl/tajawal/Tajawal-Medium.ttf"),
+    ("Tajawal", "700", "Tajawal-Bold.ttf", "https://github.com/google/fonts/raw/main/ofl/tajawal/Tajawal-Bold.ttf"),
+    ("Tajawal", "800", "Tajawal-ExtraBold.ttf",
+     "https://github.com/google/fonts/raw/main/ofl/tajawal/Tajawal-ExtraBold.ttf"),
+    ("Playfair Display", "400 700", "PlayfairDisplay[wght].ttf",
+     "https://github.com/google/fonts/raw/main/ofl/playfairdisplay/PlayfairDisplay%5Bwght%5D.ttf"),
+]
+FONT_AWESOME_VERSION = "6.4.0"
+ICON_URL = "https://raw.githubusercontent.com/FortAwesome/Font-Awesome/{version}/svgs/solid/{name}.svg"
+# Font Awesome 4/5 names still used in the markup, and the 6.x file each one lives in
+ICON_FILES = {
+    "shopping-bag": "bag-shopping",
+    "shopping-basket": "basket-shopping",
+    "shipping-fast": "truck-fast",
+    "th-large": "table-cells-large",
+    "check-circle": "circle-check",
+}
+# Class names that change how an icon is drawn rather than naming one
+ICON_MODIFIERS = {"spin", "pulse", "fw", "lg", "xl", "2x", "3x", "solid", "regular", "brands"}
+
+# Always kept: printable ASCII, Latin-1, general punctuation, the Arabic block and Arabic presentation forms
+BASE_UNICODE_RANGES = [(0x20, 0x7E), (0xA0, 0xFF), (0x2000, 0x206F), (0x0600, 0x06FF), (0xFB50, 0xFDFF),
+                       (0xFE70, 0xFEFF)]
+
+ICON_PATTERNS = [re.compile(r"\bfa-([a-z0-9-]+)"), re.compile(r"""\bicon\(\s*['"]([a-z0-9-]+)['"]""")]
+HASHED_NAME = re.compile(r"\.[0-9a-f]{12}\.[a-z0-9]+$")
+
+
+def scan_files() -> List[str]:
+    files = glob.glob(os.path.join("templates", "*.html"))
+    v3 = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "SingleFile", "v3", "main.py")
+    if os.path.exists(v3):
+        files.append(v3)
+    return sorted(files)
+
+
+def used_icons(files: Iterable[str]) -> List[str]:
+    names: Set[str] = set()
+    for path in files:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        for pattern in ICON_PATTERNS:
+            names.update(pattern.findall(text))
+    return sorted(names - ICON_MODIFIERS)
+
+
+def used_characters(files: Iterable[str]) -> Set[int]:
+    """
+    Code points to keep: the base ranges plus anything the templates or store data can show.
+    """
+    from catalog import load_products
+    from i18n import STRINGS
+    from product_details import DETAILS
+
+    texts = []
+    for path in files:
+        with open(path, encoding="utf-8") as f:
+            texts.append(f.read())
+    for strings in STRINGS.values():
+        texts.extend(strings.values())
+    for p in load_products(settings.CATALOG_PATH):
+        details = DETAILS.get(p)
+        texts.extend([p.name, p.name_ar, p.category, p.description or "", details.long_description,
+                      json.dumps(details.size_chart, ensure_ascii=False)])
+    for path in (settings.SHIPPING_PATH, settings.PROMOTIONS_PATH):
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                texts.append(f.read())
+    unicodes = {ord(c) for text in texts for c in text if ord(c) >= 0x20}
+    for first, last in BASE_UNICODE_RANGES:
+        unicodes.update(range(first, last + 1))
+    return unicodes
+
+
+def fetch(url: str, path: str) -> str:
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with urllib.request.urlopen(url, timeout=30) as response:
+            data = response.read()
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def hashed_name(name: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def write_asset(out_dir: str, name: str, data: bytes, compress: bool = False) -> str:
+    """
+    Writes `data` under its content-hashed name (plus a .gz twin for text files); returns that name.
+    """
+    filename = hashed_name(name, data)
+    files = [(filename, data)]
+    if compress:
+        files.append((filename + ".gz", gzip.compress(data, 9, mtime=0)))
+    for target, payload in files:
+        path = os.path.join(out_dir, target)
+        with open(path + ".tmp", "wb") as f:
+            f.write(payload)
+        os.replace(path + ".tmp", path)
+    return filename
+
+
+def subset_font(source: str, unicodes: Set[int]) -> bytes:
+    try:
+        from fontTools import subset
+    except ImportError:
+        raise SystemExit('Font subsetting needs fontTools: pip install "fonttools[woff]"')
+    options = subset.Options()
+    options.flavor = "woff2"
+    # Keep Arabic shaping (joining forms, ligatures) and kerning for the glyphs that stay
+    options.layout_features = ["*"]
+    options.name_IDs = ["*"]
+    font = subset.load_font(source, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=unicodes)
+    subsetter.subset(font)
+    path = source + ".subset.woff2"
+    subset.save_font(font, path, options)
+    with open(path, "rb") as f:
+        data = f.read()
+    os.remove(path)
+    return data
+
+
+def icon_symbol(name: str, svg: bytes) -> str:
+    root = ElementTree.fromstring(svg)
+    paths = "".join(f'<path d="{escape(el.get("d"))}"/>' for el in root.iter() if el.tag.endswith("path"))
+    return f'<symbol id="fa-{name}" viewBox="{escape(root.get("viewBox"))}">{paths}</symbol>'
+
+
+def build(out_dir: str = settings.ASSETS_DIR, sources_dir: str = settings.ASSET_SOURCES_DIR) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    files = scan_files()
+    unicodes = used_characters(files)
+    icons = used_icons(files)
+
+    faces, fonts = [], {}
+    for family, weight, filename, url in FONT_SOURCES:
+        source = fetch(url, os.path.join(sources_dir, "fonts", filename))
+        name = f"{family.lower().replace(' ', '-')}-{weight.split()[0]}.woff2"
+        fonts[name] = write_asset(out_dir, name, subset_font(source, unicodes))
+        faces.append(f"@font-face{{font-family:'{family}';font-style:normal;font-weight:{weight};"
+                     f"font-display:swap;src:url({fonts[name]}) format('woff2')}}")
+    css = "\n".join(faces).encode("utf-8")
+
+    symbols = []
+    for name in icons:
+        file_name = ICON_FILES.get(name, name)
+        url = ICON_URL.format(version=FONT_AWESOME_VERSION, name=file_name)
+        with open(fetch(url, os.path.join(sources_dir, "icons", FONT_AWESOME_VERSION, file_name + ".svg")), "rb") as f:
+            symbols.append(icon_symbol(name, f.read()))
+    sprite = ('<svg xmlns="http://www.w3.org/2000/svg" style="display:none">' + "".join(symbols) + "</svg>").encode("utf-8")
+
+    manifest = {
+        "files": {"fonts.css": write_asset(out_dir, "fonts.css", css, compress=True),
+                  "icons.svg": write_asset(out_dir, "icons.svg", sprite, compress=True), **fonts},
+        "fonts": [{"family": family, "weight": weight, "file": fonts[f"{family.lower().replace(' ', '-')}-{weight.split()[0]}.woff2"]}
+                  for family, weight, _, _ in FONT_SOURCES],
+        "icons": icons,
+        "characters": len(unicodes),
+    }
+    with open(os.path.join(out_dir, MANIFEST + ".tmp"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(os.path.join(out_dir, MANIFEST + ".tmp"), os.path.join(out_dir, MANIFEST))
+    return manifest
+
+
+class AssetManifest:
+    """
+    The last build, as seen by the templates: asset URLs and the icon helper.
+    """
+    def __init__(self, directory: str, base_url: str):
+        self.directory = directory
+        self.base_url = base_url
+        self.files: Dict[str, str] = {}
+        self.icons: Set[str] = set()
+        self.digest = ""
+
+    @property
+    def built(self) -> bool:
+        return bool(self.files)
+
+    def load(self) -> bool:
+        try:
+            with open(os.path.join(self.directory, MANIFEST), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self.files = dict(manifest.get("files", {}))
+        self.icons = set(manifest.get("icons", []))
+        self.digest = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()
+        return True
+
+    def url(self, name: str) -> str:
+        return self.base_url + self.files[name]
+
+    def icon(self, name: str, classes: str = "", style: str = "") -> Markup:
+        """
+        A sprite reference when the icon was built, else the Font Awesome <i> (CDN stylesheet).
+        """
+        style_attr = Markup(' style="{}"').format(style) if style else ""
+        if name in self.icons:
+            return Markup('<svg class="{}" aria-hidden="true"{}><use href="{}#fa-{}"></use></svg>').format(
+                " ".join(["icon", classes.replace("fa-", "icon-")]).strip(), style_attr, self.url("icons.svg"), name)
+        return Markup('<i class="{}"{}></i>').format(" ".join(["fas", "fa-" + name, classes]).strip(), style_attr)
+
+
+class ImmutableStaticFiles(PrecompressedStaticFiles):
+    """
+    Serves built assets; content-hashed files are cached for a year without revalidation.
+    """
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        if isinstance(response, FileResponse) and HASHED_NAME.search(path):
+            response.headers["Cache-Control"] = IMMUTABLE
+        return response
+
+
+ASSETS = AssetManifest(settings.ASSETS_DIR, settings.ASSETS_BASE_URL)
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Build self-hosted font and icon subsets")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build")
+    build_cmd.add_argument("--out", default=settings.ASSETS_DIR)
+    build_cmd.add_argument("--sources", default=settings.ASSET_SOURCES_DIR, help="cache for downloaded sources")
+    args = parser.parse_args(argv)
+
+    manifest = build(args.out, args.sources)
+    sizes = {name: os.path.getsize(os.path.join(args.out, filename)) for name, filename in manifest["files"].items()}
+    print(f"Built {len(manifest['fonts'])} font subsets ({manifest['characters']} characters) and "
+          f"{len(manifest['icons'])} icons into {args.out}: {sum(sizes.values()) // 1024} KB")
+
+
+if __name__ == "__main__":
+    main()
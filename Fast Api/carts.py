@@ -0,0 +1,205 @@
+"""
+Server-side carts, synced from the browser as deltas.
+
+A cart is identified by an opaque id in the modesta_cart cookie, so every tab
+of a browser shares it. Each change is a batch of operations with short-key
+JSON, sent to POST /api/cart/sync:
+
+    {"v": 4, "o": [["a", 12, 1], ["s", 3, 2], ["r", 7]]}
+
+"a" adds a quantity (delta), "s" sets a quantity, "r" removes the line; "v"
+is the cart version the tab last saw. The store applies the batch in one
+transaction and bumps the version. When the tab was current the answer is
+just {"v": 5}. When another tab changed the cart in between, the batch is
+still applied on top (adds commute, sets and removes are last-writer-wins
+per product), and the answer carries the merged cart so the tab can rebase:
+{"v": 5, "i": [[product_id, quantity], ...], "p": {...}}. No change is lost
+and no tab has to resend its whole cart.
+
+Carts live in SQLite (MODESTA_CARTS_DB), shared by all workers; carts idle
+for MODESTA_CART_TTL_DAYS are dropped.
+"""
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import settings
+from metrics import REGISTRY, Counter
+
+CART_COOKIE = "modesta_cart"
+
+CART_SYNC = REGISTRY.register(Counter(
+    "modesta_cart_sync_total", "Cart sync batches by outcome (applied on the latest version or rebased)", ("result",)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS carts (
+    cart_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_carts_updated ON carts(updated_at);
+
+CREATE TABLE IF NOT EXISTS cart_items (
+    cart_id TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (cart_id, product_id)
+) WITHOUT ROWID;
+"""
+
+ADD, SET, REMOVE = "a", "s", "r"
+
+Op = Tuple[str, int, int]
+
+
+class CartError(ValueError):
+    pass
+
+
+def new_cart_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def parse_ops(raw: Iterable[list], max_ops: int) -> List[Op]:
+    """
+    [["a", id, qty] | ["s", id, qty] | ["r", id]] -> (op, product_id, quantity); raises CartError.
+    """
+    ops = []
+    for entry in raw:
+        if not isinstance(entry, (list, tuple)) or not entry or entry[0] not in (ADD, SET, REMOVE):
+            raise CartError(f"Invalid cart operation: {entry!r}")
+        if len(ops) == max_ops:
+            raise CartError(f"At most {max_ops} operations per sync")
+        try:
+            product_id = int(entry[1])
+            quantity = 0 if entry[0] == REMOVE else int(entry[2])
+        except (IndexError, TypeError, ValueError):
+            raise CartError(f"Invalid cart operation: {entry!r}")
+        if (entry[0] == SET and quantity < 0) or (entry[0] == ADD and quantity == 0):
+            raise CartError(f"Invalid cart operation: {entry!r}")
+        ops.append((entry[0], product_id, quantity))
+    return ops
+
+
+class CartState:
+    def __init__(self, version: int, items: List[Tuple[int, int]]):
+        self.version = version
+        self.items = items  # (product_id, quantity) in the order they were added
+
+    def quantities(self) -> Dict[int, int]:
+        return dict(self.items)
+
+
+class CartStore:
+    def __init__(self, path: str, max_lines: int, max_quantity: int, ttl_seconds: float):
+        self.path = path
+        self.max_lines = max_lines
+        self.max_quantity = max_quantity
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; transactions are explicit (BEGIN IMMEDIATE) so syncs from
+        # several tabs, on any worker, apply one after the other
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def _items(self, conn: sqlite3.Connection, cart_id: str) -> List[Tuple[int, int]]:
+        return conn.execute("SELECT product_id, quantity FROM cart_items WHERE cart_id = ? ORDER BY position",
+                            (cart_id,)).fetchall()
+
+    def state(self, cart_id: Optional[str]) -> CartState:
+        if not cart_id:
+            return CartState(0, [])
+        conn = self._conn()
+        row = conn.execute("SELECT version FROM carts WHERE cart_id = ?", (cart_id,)).fetchone()
+        return CartState(row[0], self._items(conn, cart_id)) if row else CartState(0, [])
+
+    def apply(self, cart_id: str, base_version: int, ops: List[Op]) -> Tuple[CartState, bool]:
+        """
+        Applies one batch; returns the new state and whether the tab's version was behind (rebased).
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT version FROM carts WHERE cart_id = ?", (cart_id,)).fetchone()
+            version = row[0] if row else 0
+            current = dict(self._items(conn, cart_id))
+            for op, product_id, quantity in ops:
+                have = current.get(product_id, 0)
+                want = 0 if op == REMOVE else quantity if op == SET else have + quantity
+                want = min(want, self.max_quantity)
+                if want <= 0:
+                    if product_id in current:
+                        del current[product_id]
+                        conn.execute("DELETE FROM cart_items WHERE cart_id = ? AND product_id = ?", (cart_id, product_id))
+                elif product_id in current:
+                    current[product_id] = want
+                    conn.execute("UPDATE cart_items SET quantity = ? WHERE cart_id = ? AND product_id = ?",
+                                 (want, cart_id, product_id))
+                else:
+                    if len(current) >= self.max_lines:
+                        raise CartError(f"A cart holds at most {self.max_lines} products")
+                    current[product_id] = want
+                    conn.execute("INSERT INTO cart_items (cart_id, product_id, quantity, position) VALUES (?, ?, ?, "
+                                 "(SELECT COALESCE(MAX(position), 0) + 1 FROM cart_items WHERE cart_id = ?))",
+                                 (cart_id, product_id, want, cart_id))
+            now = time.time()
+            if row is None:
+                conn.execute("INSERT INTO carts (cart_id, version, updated_at) VALUES (?, 1, ?)", (cart_id, now))
+            else:
+                conn.execute("UPDATE carts SET version = ?, updated_at = ? WHERE cart_id = ?", (version + 1, now, cart_id))
+            state = CartState(version + 1, self._items(conn, cart_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        rebased = base_version != version
+        CART_SYNC.inc(result="rebased" if rebased else "applied")
+        return state, rebased
+
+    def clear(self, cart_id: str):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cart_items WHERE cart_id = ?", (cart_id,))
+            conn.execute("UPDATE carts SET version = version + 1, updated_at = ? WHERE cart_id = ?", (time.time(), cart_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def purge(self) -> int:
+        """
+        Drops carts idle for longer than the TTL; returns how many.
+        """
+        cutoff = time.time() - self.ttl_seconds
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cart_items WHERE cart_id IN (SELECT cart_id FROM carts WHERE updated_at < ?)",
+                         (cutoff,))
+            removed = conn.execute("DELETE FROM carts WHERE updated_at < ?", (cutoff,)).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return removed
+
+
+CARTS = CartStore(settings.CARTS_DB, settings.CART_MAX_LINES, settings.CART_MAX_QUANTITY,
+                  settings.CART_TTL_DAYS * 24 * 3600)
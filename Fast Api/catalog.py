@@ -0,0 +1,214 @@
+"""
+Product catalog with hot reload.
+
+The catalog lives in an external file: data/catalog.json by default, or a
+SQLite catalog store (*.db, filled by catalog_io.py) or a memory-mapped
+columnar snapshot (*.snap, built by catalog_snapshot.py) for large catalogs. Each
+load builds an immutable, indexed `CatalogSnapshot` off the request path and
+then swaps it in with a single reference assignment, so requests always see
+one complete version. Anything derived from the catalog either keys its cache
+on `snapshot.version` or registers an `on_reload` hook to drop it.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import settings
+from catalog_snapshot import LazyIndex, LazyProducts, MappedCatalog
+
+log = logging.getLogger("modesta.catalog")
+
+
+class Product:
+    def __init__(self, id, name, name_ar, price, category, image_url, badge=None, description=""):
+        self.id = id
+        self.name = name
+        self.name_ar = name_ar
+        self.price = price
+        self.category = category
+        self.image_url = image_url
+        self.badge = badge
+        self.description = description
+
+
+PRODUCT_FIELDS = ("id", "name", "name_ar", "price", "category", "image_url", "badge", "description")
+
+
+def parse_price(value) -> float:
+    # float() accepts "nan" and "inf" (and JSON's NaN/Infinity), which no price can be
+    price = float(value)
+    if not math.isfinite(price):
+        raise ValueError(f"price must be a finite number, got {value!r}")
+    return price
+
+
+def product_from_dict(row: dict) -> Product:
+    return Product(
+        int(row["id"]), row["name"], row.get("name_ar", ""), parse_price(row["price"]), row["category"],
+        row.get("image_url", ""), row.get("badge") or None, row.get("description", ""),
+    )
+
+
+def product_to_dict(p: Product) -> dict:
+    return {field: getattr(p, field) for field in PRODUCT_FIELDS}
+
+
+class CatalogSnapshot:
+    """
+    One immutable version of the catalog plus its lookup indexes.
+    """
+    def __init__(self, version: int, products: List[Product]):
+        self.version = version
+        self.products: Tuple[Product, ...] = tuple(products)
+        self.by_id: Dict[int, Product] = {p.id: p for p in self.products}
+        by_category: Dict[str, List[Product]] = {}
+        for p in self.products:
+            by_category.setdefault(p.category, []).append(p)
+        self.by_category: Dict[str, Tuple[Product, ...]] = {c: tuple(ps) for c, ps in by_category.items()}
+        # Keeps the order categories first appear in the file
+        self.categories: List[str] = list(self.by_category)
+
+    def in_category(self, category: Optional[str]) -> Tuple[Product, ...]:
+        if category and category != "All":
+            return self.by_category.get(category, ())
+        return self.products
+
+
+class MappedCatalogSnapshot(CatalogSnapshot):
+    """
+    Snapshot served straight from a mapped *.snap file. Same interface as
+    CatalogSnapshot, but products are materialized on access.
+    """
+    def __init__(self, version: int, path: str):
+        mapped = MappedCatalog(path, Product)
+        self.version = version
+        self.products = LazyProducts(mapped)
+        self.by_id = LazyIndex(mapped)
+        self.by_category = {c: LazyProducts(mapped, mapped.category_rows(c)) for c in mapped.categories}
+        self.categories = list(mapped.categories)
+
+
+PRODUCTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_ar TEXT NOT NULL DEFAULT '',
+    price REAL NOT NULL,
+    category TEXT NOT NULL,
+    image_url TEXT NOT NULL DEFAULT '',
+    badge TEXT,
+    description TEXT NOT NULL DEFAULT ''
+)
+"""
+PRODUCTS_INDEXES = {
+    "idx_products_category": "CREATE INDEX IF NOT EXISTS idx_products_category ON products(category)",
+}
+
+
+def is_store(path: str) -> bool:
+    return path.endswith((".db", ".sqlite", ".sqlite3"))
+
+
+def is_mapped_snapshot(path: str) -> bool:
+    return path.endswith(".snap")
+
+
+def load_products(path: str) -> List[Product]:
+    if is_store(path):
+        if not os.path.exists(path):
+            raise OSError(f"{path}: catalog store not found")
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(PRODUCT_FIELDS)} FROM products ORDER BY id")
+            return [Product(*row) for row in cursor]
+        except sqlite3.Error as exc:
+            raise ValueError(f"{path}: {exc}") from exc
+        finally:
+            conn.close()
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    products = [product_from_dict(row) for row in data["products"]]
+    ids = [p.id for p in products]
+    if len(ids) != len(set(ids)):
+        raise ValueError(f"{path}: duplicate product ids")
+    return products
+
+
+class Catalog:
+    def __init__(self, path: str):
+        self.path = path
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._mtime: Optional[float] = None
+        self._failed_mtime: Optional[float] = None
+        self._reload_lock = threading.Lock()
+        self._hooks: List[Callable[[CatalogSnapshot], None]] = []
+
+    def current(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.reload()
+            snapshot = self._snapshot
+        return snapshot
+
+    def on_reload(self, hook: Callable[[CatalogSnapshot], None]):
+        """
+        Registers a callback run after every successful swap (e.g. to drop derived caches).
+        """
+        self._hooks.append(hook)
+        return hook
+
+    def reload(self) -> bool:
+        """
+        Loads the file into a new snapshot and swaps it in. On any error the
+        current snapshot stays active and False is returned.
+        """
+        with self._reload_lock:
+            mtime = None
+            version = self._snapshot.version + 1 if self._snapshot else 1
+            try:
+                mtime = os.path.getmtime(self.path)
+                if is_mapped_snapshot(self.path):
+                    snapshot = MappedCatalogSnapshot(version, self.path)
+                else:
+                    snapshot = CatalogSnapshot(version, load_products(self.path))
+            except (OSError, ValueError, KeyError, TypeError) as exc:
+                # Remember the broken version so the watcher doesn't retry it every poll
+                self._failed_mtime = mtime
+                log.error("catalog_reload_failed", extra={"fields": {"path": self.path, "error": str(exc)}})
+                if self._snapshot is None:
+                    raise
+                return False
+            self._snapshot = snapshot
+            self._mtime = mtime
+        for hook in self._hooks:
+            try:
+                hook(snapshot)
+            except Exception:
+                log.exception("catalog_reload_hook_failed")
+        log.info("catalog_reloaded", extra={"fields": {"version": version, "products": len(snapshot.products)}})
+        return True
+
+    def changed_on_disk(self) -> bool:
+        try:
+            return os.path.getmtime(self.path) not in (self._mtime, self._failed_mtime)
+        except OSError:
+            return False
+
+    async def watch(self, interval: float):
+        """
+        Polls the file's mtime and reloads in a worker thread when it changes.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if self.changed_on_disk():
+                await loop.run_in_executor(None, self.reload)
+
+
+CATALOG = Catalog(settings.CATALOG_PATH)
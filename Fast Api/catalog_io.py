@@ -0,0 +1,233 @@
+"""
+Streaming bulk import/export for the SQLite catalog store.
+
+Feeds are read one row at a time (CSV or JSONL), validated, and upserted in
+batched transactions, so memory stays flat regardless of feed size. The
+secondary indexes are dropped for the load and rebuilt once at the end.
+
+Usage:
+    python catalog_io.py import supplier_feed.csv [--db data/catalog.db] [--batch 5000]
+    python catalog_io.py export catalog.jsonl [--db data/catalog.db]
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import math
+import os
+import sqlite3
+import sys
+import time
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+import settings
+from catalog import PRODUCT_FIELDS, PRODUCTS_INDEXES, PRODUCTS_SCHEMA
+
+log = logging.getLogger("modesta.catalog_io")
+
+UPSERT_SQL = (
+    f"INSERT INTO products ({', '.join(PRODUCT_FIELDS)}) VALUES ({', '.join('?' * len(PRODUCT_FIELDS))}) "
+    "ON CONFLICT(id) DO UPDATE SET "
+    + ", ".join(f"{f} = excluded.{f}" for f in PRODUCT_FIELDS if f != "id")
+)
+MAX_REPORTED_ERRORS = 100
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(name: str) -> str:
+    return "csv" if name.lower().endswith(".csv") else "jsonl"
+
+
+def iter_rows(stream: IO[str], fmt: str) -> Iterator[Tuple[int, dict]]:
+    """
+    Yields (line number, raw row) pairs without reading the whole feed.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as exc:
+            yield line_no, RowError(f"invalid JSON: {exc.msg}")
+
+
+def validate_row(row) -> tuple:
+    """
+    Returns the row as a tuple in PRODUCT_FIELDS order, or raises RowError.
+    """
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError("row is not an object")
+
+    def text(field, required=False):
+        value = row.get(field)
+        value = "" if value is None else str(value).strip()
+        if required and not value:
+            raise RowError(f"missing {field}")
+        return value
+
+    try:
+        product_id = int(text("id", required=True))
+    except ValueError:
+        raise RowError("id is not an integer")
+    if product_id <= 0:
+        raise RowError("id must be positive")
+    try:
+        price = float(text("price", required=True))
+    except ValueError:
+        raise RowError("price is not a number")
+    if not math.isfinite(price):
+        raise RowError("price must be a finite number")
+    if price < 0:
+        raise RowError("price must not be negative")
+
+    return (
+        product_id, text("name", required=True), text("name_ar"), price,
+        text("category", required=True), text("image_url"), text("badge") or None, text("description"),
+    )
+
+
+def connect_store(db_path: str) -> sqlite3.Connection:
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute(PRODUCTS_SCHEMA)
+    return conn
+
+
+def _drop_indexes(conn: sqlite3.Connection):
+    for name in PRODUCTS_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def import_feed(stream: IO[str], fmt: str, db_path: str = settings.CATALOG_DB,
+                batch_size: int = 5000, progress=None) -> dict:
+    """
+    Streams `stream` into the catalog store. Each batch is one transaction;
+    rejected rows are skipped and reported (first MAX_REPORTED_ERRORS only).
+    """
+    conn = connect_store(db_path)
+    stats = {"rows": 0, "imported": 0, "rejected": 0, "errors": []}
+    start = time.perf_counter()
+    try:
+        _drop_indexes(conn)
+        conn.commit()
+        batch: List[tuple] = []
+        for line_no, row in iter_rows(stream, fmt):
+            stats["rows"] += 1
+            try:
+                batch.append(validate_row(row))
+            except RowError as exc:
+                stats["rejected"] += 1
+                if len(stats["errors"]) < MAX_REPORTED_ERRORS:
+                    stats["errors"].append({"line": line_no, "error": str(exc)})
+            if len(batch) >= batch_size:
+                _write_batch(conn, batch)
+                stats["imported"] += len(batch)
+                batch = []
+                if progress:
+                    progress(stats, time.perf_counter() - start)
+        if batch:
+            _write_batch(conn, batch)
+            stats["imported"] += len(batch)
+    finally:
+        # Indexes are rebuilt once, even if the feed failed half way
+        for sql in PRODUCTS_INDEXES.values():
+            conn.execute(sql)
+        conn.commit()
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["rows_per_sec"] = round(stats["rows"] / elapsed) if elapsed > 0 else stats["rows"]
+    log.info("catalog_import", extra={"fields": {k: v for k, v in stats.items() if k != "errors"}})
+    return stats
+
+
+def _write_batch(conn: sqlite3.Connection, batch: List[tuple]):
+    with conn:
+        conn.executemany(UPSERT_SQL, batch)
+
+
+def export_rows(db_path: str = settings.CATALOG_DB, fmt: str = "jsonl", chunk_size: int = 1000) -> Iterator[str]:
+    """
+    Yields the catalog as CSV or JSONL text chunks, reading the store with a cursor.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(f"SELECT {', '.join(PRODUCT_FIELDS)} FROM products ORDER BY id")
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(PRODUCT_FIELDS)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield "".join(json.dumps(dict(zip(PRODUCT_FIELDS, row)), ensure_ascii=False) + "\n" for row in rows)
+    finally:
+        conn.close()
+
+
+def _print_progress(stats, elapsed):
+    rate = stats["rows"] / elapsed if elapsed > 0 else 0
+    print(f"  {stats['rows']:>10,} rows  {stats['rejected']:>8,} rejected  {rate:>10,.0f} rows/s", file=sys.stderr)
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Bulk catalog import/export")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="upsert a CSV/JSONL feed into the catalog store")
+    imp.add_argument("feed")
+    imp.add_argument("--format", choices=["csv", "jsonl"])
+    imp.add_argument("--batch", type=int, default=5000)
+    imp.add_argument("--db", default=settings.CATALOG_DB)
+    exp = sub.add_parser("export", help="stream the catalog store to CSV/JSONL ('-' for stdout)")
+    exp.add_argument("output")
+    exp.add_argument("--format", choices=["csv", "jsonl"])
+    exp.add_argument("--db", default=settings.CATALOG_DB)
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        fmt = args.format or detect_format(args.feed)
+        with open(args.feed, encoding="utf-8-sig", newline="") as f:
+            stats = import_feed(f, fmt, args.db, args.batch, progress=_print_progress)
+        for error in stats["errors"]:
+            print(f"  line {error['line']}: {error['error']}", file=sys.stderr)
+        print(f"Imported {stats['imported']:,} of {stats['rows']:,} rows ({stats['rejected']:,} rejected) "
+              f"in {stats['seconds']}s, {stats['rows_per_sec']:,} rows/s")
+    else:
+        fmt = args.format or detect_format(args.output)
+        out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+        try:
+            for chunk in export_rows(args.db, fmt):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Columnar, memory-mapped catalog snapshot (*.snap).
+
+The file holds one section per column: fixed-width arrays for numeric
+columns, offsets + UTF-8 blob for strings, small JSON dictionaries for
+categories and badges, and a precomputed category -> rows index. Workers map
+it read-only, so startup costs O(1) regardless of catalog size and all
+workers share the same physical pages through the OS page cache. Product
+objects are only built when a row is actually read (e.g. a card is rendered).
+
+Snapshots are written to a temporary file and renamed into place, so a
+mapped file is never modified under a running worker.
+
+Usage:
+    python catalog_snapshot.py build [--source data/catalog.db] [--out data/catalog.snap]
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+from typing import Callable, Dict, Iterable, List, Optional
+
+MAGIC = b"MODCAT\x00\x01"
+HEADER = struct.Struct("<8sQI")  # magic, row count, section count
+SECTION = struct.Struct("<24sQQ")  # name, offset, length
+STRING_COLUMNS = ("name", "name_ar", "image_url", "description")
+NO_BADGE = 0xFFFF
+
+
+def write_snapshot(products: Iterable, path: str):
+    """
+    Writes `products` (anything with the Product attributes) as a snapshot file.
+    """
+    products = sorted(products, key=lambda p: p.id)
+    categories: Dict[str, int] = {}
+    badges: Dict[str, int] = {}
+    sections: Dict[str, bytes] = {}
+
+    sections["id"] = array("q", (p.id for p in products)).tobytes()
+    sections["price"] = array("d", (float(p.price) for p in products)).tobytes()
+    sections["category"] = array("H", (categories.setdefault(p.category, len(categories)) for p in products)).tobytes()
+    sections["badge"] = array("H", (badges.setdefault(p.badge, len(badges)) if p.badge else NO_BADGE
+                                    for p in products)).tobytes()
+    for column in STRING_COLUMNS:
+        offsets = array("Q", [0])
+        blob = bytearray()
+        for p in products:
+            blob += (getattr(p, column) or "").encode("utf-8")
+            offsets.append(len(blob))
+        sections[column + ".off"] = offsets.tobytes()
+        sections[column + ".dat"] = bytes(blob)
+    sections["dict.category"] = json.dumps(list(categories), ensure_ascii=False).encode("utf-8")
+    sections["dict.badge"] = json.dumps(list(badges), ensure_ascii=False).encode("utf-8")
+
+    # Row numbers grouped by category code, with per-category start offsets
+    rows_by_category: List[List[int]] = [[] for _ in categories]
+    for row, p in enumerate(products):
+        rows_by_category[categories[p.category]].append(row)
+    category_rows = array("I")
+    category_offsets = array("Q", [0])
+    for rows in rows_by_category:
+        category_rows.extend(rows)
+        category_offsets.append(len(category_rows))
+    sections["index.category.rows"] = category_rows.tobytes()
+    sections["index.category.off"] = category_offsets.tobytes()
+
+    # Sections start 8-byte aligned so they can be cast to typed memoryviews
+    offset = HEADER.size + SECTION.size * len(sections)
+    directory = []
+    for name, data in sections.items():
+        offset = (offset + 7) & ~7
+        directory.append((name, offset, len(data)))
+        offset += len(data)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(products), len(sections)))
+        for name, section_offset, length in directory:
+            f.write(SECTION.pack(name.encode("ascii"), section_offset, length))
+        for (name, section_offset, _), data in zip(directory, sections.values()):
+            f.write(b"\0" * (section_offset - f.tell()))
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+class MappedCatalog:
+    """
+    Read-only view over a snapshot file. Columns are typed memoryviews into the mapping.
+    """
+    def __init__(self, path: str, factory: Callable):
+        self.factory = factory
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mm)
+        magic, self.rows, count = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a catalog snapshot")
+        sections = {}
+        for i in range(count):
+            name, offset, length = SECTION.unpack_from(view, HEADER.size + i * SECTION.size)
+            sections[name.rstrip(b"\0").decode("ascii")] = view[offset:offset + length]
+
+        self.ids = sections["id"].cast("q")
+        self.prices = sections["price"].cast("d")
+        self.category_codes = sections["category"].cast("H")
+        self.badge_codes = sections["badge"].cast("H")
+        self.strings = {c: (sections[c + ".off"].cast("Q"), sections[c + ".dat"]) for c in STRING_COLUMNS}
+        self.categories: List[str] = json.loads(bytes(sections["dict.category"]))
+        self.badges: List[str] = json.loads(bytes(sections["dict.badge"]))
+        self._category_rows = sections["index.category.rows"].cast("I")
+        self._category_offsets = sections["index.category.off"].cast("Q")
+
+    def __len__(self):
+        return self.rows
+
+    def string(self, column: str, row: int) -> str:
+        offsets, data = self.strings[column]
+        return str(data[offsets[row]:offsets[row + 1]], "utf-8")
+
+    def product_at(self, row: int):
+        badge = self.badge_codes[row]
+        return self.factory(
+            self.ids[row], self.string("name", row), self.string("name_ar", row), self.prices[row],
+            self.categories[self.category_codes[row]], self.string("image_url", row),
+            None if badge == NO_BADGE else self.badges[badge], self.string("description", row),
+        )
+
+    def row_of(self, product_id: int) -> Optional[int]:
+        row = bisect_left(self.ids, product_id)
+        if row < self.rows and self.ids[row] == product_id:
+            return row
+        return None
+
+    def category_rows(self, category: str):
+        code = self.categories.index(category)
+        return self._category_rows[self._category_offsets[code]:self._category_offsets[code + 1]]
+
+
+class LazyProducts(Sequence):
+    """
+    Sequence of products that builds each Product only when it is accessed.
+    """
+    def __init__(self, catalog: MappedCatalog, rows=None):
+        self._catalog = catalog
+        self._rows = rows
+
+    def __len__(self):
+        return len(self._catalog) if self._rows is None else len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            rows = range(len(self))[index] if self._rows is None else self._rows[index]
+            return LazyProducts(self._catalog, rows)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._catalog.product_at(index if self._rows is None else self._rows[index])
+
+
+class LazyIndex(Mapping):
+    """
+    Product-id mapping backed by binary search over the sorted id column.
+    """
+    def __init__(self, catalog: MappedCatalog):
+        self._catalog = catalog
+
+    def __getitem__(self, product_id):
+        row = self._catalog.row_of(product_id)
+        if row is None:
+            raise KeyError(product_id)
+        return self._catalog.product_at(row)
+
+    def __contains__(self, product_id):
+        return self._catalog.row_of(product_id) is not None
+
+    def __iter__(self):
+        return iter(self._catalog.ids)
+
+    def __len__(self):
+        return len(self._catalog)
+
+
+def main(argv=None):
+    import settings
+    from catalog import load_products
+
+    parser = argparse.ArgumentParser(description="Build a memory-mapped catalog snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("--source", default=settings.CATALOG_DB if os.path.exists(settings.CATALOG_DB)
+                       else os.path.join("data", "catalog.json"))
+    build.add_argument("--out", default=settings.CATALOG_SNAPSHOT)
+    args = parser.parse_args(argv)
+
+    products = load_products(args.source)
+    write_snapshot(products, args.out)
+    print(f"Wrote {len(products):,} products from {args.source} to {args.out} ({os.path.getsize(args.out):,} bytes)")
+
+
+if __name__ == "__main__":
+    main()
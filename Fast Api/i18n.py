@@ -0,0 +1,142 @@
+"""
+English/Arabic interface strings and the per-visitor locale and currency choice.
+
+The choice comes from `?lang=` / `?currency=` when given (and is then kept
+in cookies), otherwise from the cookies, otherwise from Accept-Language.
+"""
+from typing import Callable, Dict, Tuple
+
+from fastapi import Request
+from starlette.responses import Response
+
+from money import BASE_CURRENCY, CURRENCIES, LOCALES
+
+LOCALE_COOKIE = "modesta_locale"
+CURRENCY_COOKIE = "modesta_currency"
+COOKIE_MAX_AGE = 365 * 24 * 3600
+
+STRINGS: Dict[str, Dict[str, str]] = {
+    "en": {
+        "tagline": "Where Modesty Meets Elegance",
+        "cart": "Cart",
+        "all": "All",
+        "sort": "Sort",
+        "featured": "Featured",
+        "trending": "Trending",
+        "often_bought_with": "Often bought with",
+        "add_to_cart": "Add to Cart",
+        "cancel": "Cancel",
+        "your_cart": "Your Cart",
+        "total": "Total",
+        "shipping_info": "Shipping Info",
+        "full_name": "Full Name",
+        "phone": "Phone Number",
+        "email_optional": "Email (optional, for your receipt)",
+        "address": "Full Address",
+        "confirm_order": "Confirm Order",
+        "close": "Close",
+        "checkout": "Checkout",
+        "cart_empty": "Cart is empty",
+        "you_may_also_like": "You may also like",
+        "size_chart": "Size chart",
+        "added": "Added!",
+        "continue_shopping": "Continue shopping",
+        "coupon": "Coupon code",
+        "apply": "Apply",
+        "coupon_not_applicable": "This code doesn't apply to your cart",
+        "governorate": "Governorate",
+        "shipping": "Shipping",
+        "free": "Free",
+        "days": "days",
+        "saved": "Saved",
+        "save_for_later": "Save for later",
+        "saved_empty": "Nothing saved yet",
+        "account": "Account",
+        "sign_in": "Sign in",
+        "sign_out": "Sign out",
+        "register": "Create account",
+        "email": "Email",
+        "password": "Password",
+        "no_account": "New here? Create an account",
+        "have_account": "Already have an account? Sign in",
+        "saved_addresses": "Saved addresses",
+        "new_address": "New address",
+        "save_address": "Save this address to my account",
+        "hello": "Hi",
+    },
+    "ar": {
+        "tagline": "حيث تلتقي الحشمة بالأناقة",
+        "cart": "السلة",
+        "all": "الكل",
+        "sort": "ترتيب",
+        "featured": "المميز",
+        "trending": "الأكثر رواجاً",
+        "often_bought_with": "يُشترى غالباً مع",
+        "add_to_cart": "أضف إلى السلة",
+        "cancel": "إلغاء",
+        "your_cart": "سلة التسوق",
+        "total": "الإجمالي",
+        "shipping_info": "بيانات الشحن",
+        "full_name": "الاسم بالكامل",
+        "phone": "رقم الهاتف",
+        "email_optional": "البريد الإلكتروني (اختياري، لإرسال الإيصال)",
+        "address": "العنوان بالكامل",
+        "confirm_order": "تأكيد الطلب",
+        "close": "إغلاق",
+        "checkout": "إتمام الشراء",
+        "cart_empty": "السلة فارغة",
+        "you_may_also_like": "قد يعجبك أيضاً",
+        "size_chart": "جدول المقاسات",
+        "added": "تمت الإضافة!",
+        "continue_shopping": "متابعة التسوق",
+        "coupon": "كود الخصم",
+        "apply": "تطبيق",
+        "coupon_not_applicable": "هذا الكود لا ينطبق على سلتك",
+        "governorate": "المحافظة",
+        "shipping": "الشحن",
+        "free": "مجاني",
+        "days": "أيام",
+        "saved": "المحفوظات",
+        "save_for_later": "احفظ لوقت لاحق",
+        "saved_empty": "لا توجد منتجات محفوظة بعد",
+        "account": "حسابي",
+        "sign_in": "تسجيل الدخول",
+        "sign_out": "تسجيل الخروج",
+        "register": "إنشاء حساب",
+        "email": "البريد الإلكتروني",
+        "password": "كلمة المرور",
+        "no_account": "جديد هنا؟ أنشئ حساباً",
+        "have_account": "لديك حساب؟ سجّل الدخول",
+        "saved_addresses": "العناوين المحفوظة",
+        "new_address": "عنوان جديد",
+        "save_address": "احفظ هذا العنوان في حسابي",
+        "hello": "أهلاً",
+    },
+}
+
+
+def translator(locale: str) -> Callable[[str], str]:
+    strings = STRINGS.get(locale, STRINGS["en"])
+    return lambda key: strings.get(key, STRINGS["en"].get(key, key))
+
+
+def preferences(request: Request) -> Tuple[str, str]:
+    """
+    (locale, currency) for this visitor.
+    """
+    locale = request.query_params.get("lang") or request.cookies.get(LOCALE_COOKIE)
+    if locale not in LOCALES:
+        accept = request.headers.get("accept-language", "")
+        locale = "ar" if accept.lower().startswith("ar") else "en"
+    currency = (request.query_params.get("currency") or request.cookies.get(CURRENCY_COOKIE) or "").upper()
+    if currency not in CURRENCIES:
+        currency = BASE_CURRENCY
+    return locale, currency
+
+
+def remember_preferences(request: Request, response: Response, locale: str, currency: str):
+    # Only an explicit choice in the URL is stored; the header-based default stays implicit
+    if "lang" in request.query_params:
+        response.set_cookie(LOCALE_COOKIE, locale, max_age=COOKIE_MAX_AGE, samesite="lax")
+    if "currency" in request.query_params:
+        response.set_cookie(CURRENCY_COOKIE, currency, max_age=COOKIE_MAX_AGE, samesite="lax")
@@ -0,0 +1,167 @@
+"""
+Structured JSON logging that never blocks the event loop.
+
+Request code only puts records on an in-memory queue (QueueHandler); a
+QueueListener thread formats them and does the file/stdout I/O. Every record
+carries the id of the request that produced it, so an order can be traced
+back to its request in the access log.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+import settings
+
+request_id: ContextVar = ContextVar("request_id", default=None)
+
+access_log = logging.getLogger("modesta.access")
+order_log = logging.getLogger("modesta.orders")
+
+_listener = None
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Stamps the current request id on the record in the calling thread,
+    before it crosses the queue.
+    """
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SizeAndTimeRotatingFileHandler(TimedRotatingFileHandler):
+    """
+    Rotates at the configured time interval or once the file reaches max_bytes.
+    """
+    def __init__(self, filename, max_bytes=0, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes > 0 and self.stream is not None:
+            self.stream.seek(0, os.SEEK_END)
+            return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+        return False
+
+    def rotation_filename(self, default_name):
+        # Several size rollovers can happen within one time period; don't overwrite earlier files
+        name, n = default_name, 0
+        while os.path.exists(name):
+            n += 1
+            name = f"{default_name}.{n}"
+        return name
+
+
+def setup_logging():
+    """
+    Routes every "modesta.*" logger through a queue. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter()
+    handlers = []
+    if settings.LOG_DIR:
+        os.makedirs(settings.LOG_DIR, exist_ok=True)
+        file_handler = SizeAndTimeRotatingFileHandler(
+            os.path.join(settings.LOG_DIR, "modesta.log"),
+            max_bytes=settings.LOG_MAX_BYTES,
+            when=settings.LOG_ROTATE_WHEN,
+            backupCount=settings.LOG_BACKUPS,
+            encoding="utf-8",
+        )
+        handlers.append(file_handler)
+    if settings.LOG_TO_STDOUT:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger("modesta")
+    root.setLevel(settings.LOG_LEVEL)
+    root.addHandler(queue_handler)
+    root.propagate = False
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """
+    Flushes whatever is still queued.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestContextMiddleware:
+    """
+    Assigns each request an id (reusing an incoming X-Request-ID), echoes it
+    in the response and writes one access log line per request.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers") or []).get(b"x-request-id", b"").decode("latin-1")
+        rid = incoming[:64] or uuid.uuid4().hex
+        token = request_id.set(rid)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", rid.encode("latin-1"))]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            access_log.info("request", extra={"fields": {
+                "method": scope.get("method"),
+                "path": scope.get("path"),
+                "status": status,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                "client": (scope.get("client") or ("", 0))[0],
+            }})
+            request_id.reset(token)
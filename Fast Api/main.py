@@ -1,55 +1,100 @@
 import uvicorn
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Request, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
+
+import admin
+import settings
+from accounts import ACCOUNTS, EMAIL_RE, SESSION_COOKIE, SESSIONS, AccountError, login, register
+from assets import ASSETS, ImmutableStaticFiles
+from carts import CART_COOKIE, CARTS, CartError, new_cart_id, parse_ops
+from catalog import CATALOG
+from i18n import preferences, remember_preferences, translator
+from logs import RequestContextMiddleware, order_log, request_id, setup_logging, shutdown_logging
+from metrics import REGISTRY, InstrumentedTemplates, MetricsMiddleware
+from notifications import OUTBOX, order_notifications
+from money import CURRENCIES, FX, PRICES, money_sum, to_money
+from orders import ORDERS, OrderLine, new_order_id
+from product_details import DETAILS
+from promotions import PROMOTIONS, cart_lines
+from shipping import SHIPPING
+from recommendations import RECOMMENDER
+from profiling import ProfileRequestMiddleware
+from ratelimit import RateLimitMiddleware
+from static_export import PrecompressedStaticFiles, dynamic_urls
+from trending import TRENDING
+from wishlists import WISHLIST_COOKIE, WISHLISTS, WishlistError, new_owner_id
 
 app = FastAPI()
+# Innermost, but still ahead of routing and body parsing; 429s are counted and logged by the outer layers
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(ProfileRequestMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestContextMiddleware)
+app.include_router(admin.router)
+# Prerendered pages from `python static_export.py build`; served precompressed when the client accepts gzip
+app.mount(settings.STATIC_BASE_URL.rstrip("/"), PrecompressedStaticFiles(directory=settings.STATIC_DIR, html=True,
+                                                                         check_dir=False), name="store")
+# Font and icon subsets from `python assets.py build`; content-hashed, so cached as immutable
+app.mount(settings.ASSETS_BASE_URL.rstrip("/"), ImmutableStaticFiles(directory=settings.ASSETS_DIR, check_dir=False),
+          name="assets")
+
+_background_tasks = []
+
+@app.on_event("startup")
+async def on_startup():
+    setup_logging()
+    ASSETS.load()
+    CATALOG.current()
+    FX.reload()
+    PROMOTIONS.reload()
+    SHIPPING.reload()
+    await run_in_threadpool(CARTS.purge)
+    await run_in_threadpool(WISHLISTS.purge)
+    # Offline pass over the order history; new orders update the model incrementally
+    await run_in_threadpool(RECOMMENDER.load_order_history, settings.ORDERS_DB)
+    await run_in_threadpool(TRENDING.load_order_history, settings.ORDERS_DB)
+    _background_tasks.append(asyncio.create_task(TRENDING.run(settings.TRENDING_REFRESH_INTERVAL)))
+    if settings.CATALOG_WATCH_INTERVAL > 0:
+        _background_tasks.append(asyncio.create_task(CATALOG.watch(settings.CATALOG_WATCH_INTERVAL)))
+        _background_tasks.append(asyncio.create_task(FX.watch(settings.CATALOG_WATCH_INTERVAL)))
+        _background_tasks.append(asyncio.create_task(PROMOTIONS.watch(settings.CATALOG_WATCH_INTERVAL)))
+        _background_tasks.append(asyncio.create_task(SHIPPING.watch(settings.CATALOG_WATCH_INTERVAL)))
+    if settings.NOTIFY_ENABLED:
+        _background_tasks.append(asyncio.create_task(OUTBOX.run(settings.NOTIFY_INTERVAL)))
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    for task in _background_tasks:
+        task.cancel()
+    shutdown_logging()
 
 # Setup Templates (looks for HTML files in 'templates' folder)
-templates = Jinja2Templates(directory="templates")
+# Render time is timed separately from handler time for /metrics
+templates = InstrumentedTemplates(directory="templates")
+templates.env.globals.update(dynamic_urls(), static=False, assets=ASSETS, icon=ASSETS.icon)
+
+def localized(request: Request, snapshot) -> dict:
+    """
+    Template context for the visitor's language and currency; prices come from the per-currency table.
+    """
+    locale, currency = preferences(request)
+    prices = PRICES.get(snapshot, currency, locale)
+    return {
+        "locale": locale,
+        "t": translator(locale),
+        "prices": prices,
+        "currencies": PRICES.currencies(),
+        # The cart is priced client-side from catalog (EGP) prices with the same rate
+        "money_js": {"rate": str(prices.rate), "locale": locale, "pattern": CURRENCIES[prices.currency][locale]},
+    }
 
 # --- DATA MODELS ---
-# Same data structure as before
-class Product:
-    def __init__(self, id, name, name_ar, price, category, image_url, badge=None, description=""):
-        self.id = id
-        self.name = name
-        self.name_ar = name_ar
-        self.price = price
-        self.category = category
-        self.image_url = image_url
-        self.badge = badge
-        self.description = description
-
-PRODUCTS_DB = [
-    Product(1, "Classic Black Abaya", "عباية كلاسيك سوداء", 450, "Abayas", 
-            "https://placehold.co/300x380/1a1a2e/white?text=Classic+Abaya", "Bestseller", "Elegant classic black abaya"),
-    Product(2, "Butterfly Abaya", "عباية فراشة", 520, "Abayas", 
-            "https://placehold.co/300x380/16213e/white?text=Butterfly+Abaya", "New", "Modern butterfly cut"),
-    Product(3, "Embroidered Silk Abaya", "عباية حرير مطرزة", 680, "Abayas", 
-            "https://placehold.co/300x380/0f3460/white?text=Silk+Abaya", "Premium", "Luxurious silk abaya"),
-    Product(4, "Chiffon Khimar", "خمار شيفون", 180, "Khimars", 
-            "https://placehold.co/300x380/b8a9c9/white?text=Chiffon+Khimar", None, "Lightweight chiffon khimar"),
-    Product(5, "Premium Crepe Khimar", "خمار كريب فاخر", 220, "Khimars", 
-            "https://placehold.co/300x380/9c88b8/white?text=Crepe+Khimar", "Popular", "High-quality crepe fabric"),
-    Product(6, "French Khimar", "خمار فرنسي", 250, "Khimars", 
-            "https://placehold.co/300x380/7b68a6/white?text=French+Khimar", "New", "Elegant French style"),
-    Product(7, "Saudi Niqab", "نقاب سعودي", 120, "Niqabs", 
-            "https://placehold.co/300x380/2f4858/white?text=Saudi+Niqab", None, "Traditional Saudi style"),
-    Product(8, "Butterfly Niqab", "نقاب فراشة", 90, "Niqabs", 
-            "https://placehold.co/300x380/34495e/white?text=Butterfly+Niqab", "Bestseller", "Comfortable butterfly niqab"),
-    Product(9, "Single Layer Niqab", "نقاب طبقة واحدة", 75, "Niqabs", 
-            "https://placehold.co/300x380/2c3e50/white?text=Single+Layer", None, "Simple single layer niqab"),
-    Product(10, "Hijab Magnetic Pins Set", "طقم دبابيس مغناطيسية", 45, "Accessories", 
-            "https://placehold.co/300x380/f8a5c2/white?text=Magnetic+Pins", "Popular", "Set of 12 magnetic hijab pins"),
-    Product(11, "Silk Headband Collection", "مجموعة باندانا حرير", 65, "Accessories", 
-            "https://placehold.co/300x380/ff6b81/white?text=Silk+Headband", None, "Pack of 3 silk headbands"),
-    Product(12, "Premium Underscarves Pack", "طقم بطانات فاخرة", 85, "Accessories", 
-            "https://placehold.co/300x380/f78fb3/white?text=Underscarves", "New", "Set of 5 premium cotton underscarves"),
-]
+# Products come from the hot-reloadable catalog (data/catalog.json)
 
 # Order Model for API
 class OrderItem(BaseModel):
@@ -57,42 +102,411 @@ class OrderItem(BaseModel):
     quantity: int
 
 class Order(BaseModel):
+    # Signed-in customers may send a saved address_id instead of name, phone and address
+    name: Optional[str] = None
+    phone: Optional[str] = None
+    address: Optional[str] = None
+    address_id: Optional[int] = None
+    save_address: bool = False
+    email: Optional[str] = None
+    # Without items the server-side cart is ordered; cart_version guards against a change from another tab
+    items: List[OrderItem] = []
+    cart_version: Optional[int] = None
+    coupon: Optional[str] = None
+    governorate: Optional[str] = None
+
+class Registration(BaseModel):
+    email: str
+    password: str
     name: str
     phone: str
+
+class Credentials(BaseModel):
+    email: str
+    password: str
+
+class SavedAddress(BaseModel):
+    label: str = "Home"
+    name: str
+    phone: str
+    governorate: Optional[str] = None
     address: str
+
+class CartQuote(BaseModel):
     items: List[OrderItem]
+    coupon: Optional[str] = None
+
+class CartSync(BaseModel):
+    # Short keys keep a sync to a few dozen bytes: v = version the tab last saw, o = operations (see carts.py)
+    v: int = 0
+    o: List[list] = []
+
+class ShippingQuote(BaseModel):
+    items: List[OrderItem]
+    governorate: Optional[str] = None
+    address: Optional[str] = None
+
+def cart_quantities(snapshot, items: List[OrderItem]) -> dict:
+    """
+    Quantity per product id in cart order; an unknown product or a quantity below 1 is a 400.
+    """
+    quantities = {}
+    for item in items:
+        if item.product_id not in snapshot.by_id or item.quantity < 1:
+            raise HTTPException(status_code=400, detail=f"Invalid item: product {item.product_id} x {item.quantity}")
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    if not quantities:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    return quantities
+
+def session_user(request: Request):
+    """
+    The signed-in customer from the session cookie: a signature check, no store lookup.
+    """
+    return SESSIONS.read(request.cookies.get(SESSION_COOKIE))
+
+def start_session(response: Response, user_id: int, name: str) -> dict:
+    response.set_cookie(SESSION_COOKIE, SESSIONS.issue(user_id, name), max_age=int(SESSIONS.ttl_seconds),
+                        httponly=True, samesite="lax")
+    return {"id": user_id, "name": name}
+
+def cart_payload(snapshot, state) -> dict:
+    """
+    Full short-key cart for a tab to rebase on: items plus the display fields of their products.
+    """
+    items = [[pid, qty] for pid, qty in state.items if pid in snapshot.by_id]
+    products = {pid: [snapshot.by_id[pid].name, snapshot.by_id[pid].price, snapshot.by_id[pid].image_url]
+                for pid, _ in items}
+    return {"v": state.version, "i": items, "p": products}
 
 # --- ROUTES ---
 
 @app.get("/", response_class=HTMLResponse)
-async def read_root(request: Request, category: Optional[str] = None):
+async def read_root(request: Request, category: Optional[str] = None, sort: Optional[str] = None):
     """
     Renders the HTML page. 
-    If a category is selected, it filters the products.
+    If a category is selected, it filters the products; sort=trending orders them by live demand.
     """
-    if category and category != "All":
-        filtered_products = [p for p in PRODUCTS_DB if p.category == category]
-    else:
-        filtered_products = PRODUCTS_DB
-        
-    categories = ["Abayas", "Khimars", "Niqabs", "Accessories"]
-    
-    return templates.TemplateResponse("index.html", {
+    snapshot = CATALOG.current()
+    rankings = TRENDING.rankings
+    filtered_products = snapshot.in_category(category)
+    if sort == "trending":
+        filtered_products = rankings.sort(filtered_products)
+    related = {}
+    for p in filtered_products:
+        ids = RECOMMENDER.related(p.id)
+        if ids:
+            related[p.id] = [snapshot.by_id[r] for r in ids if r in snapshot.by_id]
+
+    # One read for the whole page; each card's heart is then a bit test
+    wishlist = await run_in_threadpool(WISHLISTS.get, request.cookies.get(WISHLIST_COOKIE))
+
+    context = localized(request, snapshot)
+    response = templates.TemplateResponse("index.html", {
         "request": request,
         "products": filtered_products,
-        "categories": categories,
-        "current_category": category or "All"
+        "wishlist": wishlist,
+        "user": session_user(request),
+        "related": related,
+        "rankings": rankings,
+        "categories": snapshot.categories,
+        "current_category": category or "All",
+        "current_sort": sort or "featured",
+        "governorates": SHIPPING.current().governorates(),
+        **context,
     })
+    remember_preferences(request, response, context["locale"], context["prices"].currency)
+    return response
+
+@app.get("/product/{product_id}", response_class=HTMLResponse)
+async def product_page(request: Request, product_id: int):
+    """
+    Product detail page
+    """
+    snapshot = CATALOG.current()
+    product = snapshot.by_id.get(product_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    # Gallery, size chart and long description are loaded on demand and cached per product
+    details = await run_in_threadpool(DETAILS.get, product)
+    wishlist = await run_in_threadpool(WISHLISTS.get, request.cookies.get(WISHLIST_COOKIE))
+    context = localized(request, snapshot)
+    response = templates.TemplateResponse("product.html", {
+        "request": request,
+        "product": product,
+        "wishlist": wishlist,
+        "details": details,
+        "badge": TRENDING.rankings.badge_for(product),
+        **context,
+    })
+    remember_preferences(request, response, context["locale"], context["prices"].currency)
+    return response
 
 @app.post("/api/checkout")
-async def checkout(order: Order):
+async def checkout(order: Order, request: Request):
     """
     API endpoint to receive order data from JavaScript
     """
-    order_id = f"MOD-{abs(hash(order.name)) % 100000:05d}"
-    print(f"New Order Received: {order_id}")
-    print(f"Customer: {order.name}, Items: {len(order.items)}")
-    return {"status": "success", "order_id": order_id}
+    # Prices always come from the catalog, never from the browser; orders are charged in EGP, exactly
+    snapshot = CATALOG.current()
+    user = session_user(request)
+    name, phone, address, governorate = order.name, order.phone, order.address, order.governorate
+    if order.address_id is not None:
+        if user is None:
+            raise HTTPException(status_code=401, detail="Please sign in to use a saved address")
+        saved = await run_in_threadpool(ACCOUNTS.address, user.id, order.address_id)
+        if saved is None:
+            raise HTTPException(status_code=404, detail="Unknown address")
+        name, phone, address, governorate = saved.name, saved.phone, saved.address, governorate or saved.governorate
+    elif not (name and phone and address):
+        raise HTTPException(status_code=400, detail="Name, phone and address are required")
+    # The address ends up in an email header, so anything that isn't one plain address is refused here
+    email = order.email.strip() if order.email else None
+    if email and not EMAIL_RE.match(email):
+        raise HTTPException(status_code=400, detail="Please enter a valid email")
+    cart_id = None
+    if order.items:
+        quantities = cart_quantities(snapshot, order.items)
+    else:
+        cart_id = request.cookies.get(CART_COOKIE)
+        state = await run_in_threadpool(CARTS.state, cart_id)
+        if order.cart_version is not None and order.cart_version != state.version:
+            raise HTTPException(status_code=409, detail="Your cart was changed in another tab, please review it")
+        quantities = cart_quantities(snapshot, [OrderItem(product_id=pid, quantity=qty) for pid, qty in state.items])
+    pricing = PROMOTIONS.current().price(cart_lines(snapshot, quantities.items()), order.coupon)
+    shipping = SHIPPING.quote(snapshot, quantities, governorate, address)
+    if shipping is None and governorate:
+        raise HTTPException(status_code=400, detail=f"We don't deliver to {governorate} yet")
+    lines = []
+    for product_id, quantity in quantities.items():
+        product = snapshot.by_id[product_id]
+        lines.append(OrderLine(product.id, product.name, product.category, quantity, to_money(product.price),
+                               pricing.product_discount(product.id)))
+
+    order_id = new_order_id()
+    await run_in_threadpool(ORDERS.record, order_id, name, phone, address, lines, request_id.get(),
+                            email=email, discounts=[(d.label, d.amount) for d in pricing.discounts])
+    if cart_id:
+        await run_in_threadpool(CARTS.clear, cart_id)
+    await run_in_threadpool(RECOMMENDER.add_basket, [line.product_id for line in lines])
+    for line in lines:
+        TRENDING.record_sale(line.product_id, line.quantity)
+    # The request id is attached by the logging filter, tying this order to its access log line
+    order_log.info("order_created", extra={"fields": {
+        "order_id": order_id,
+        "customer": name,
+        "user_id": user.id if user else None,
+        "items": len(lines),
+        "quantity": sum(line.quantity for line in lines),
+        "total": str(money_sum(line.line_total for line in lines)),
+        "discount": str(pricing.discount_total),
+        "coupon": order.coupon if pricing.coupon_applied else None,
+        # An address without a known zone is still accepted; shipping is then confirmed by phone
+        "shipping_zone": shipping.zone.id if shipping else None,
+        "shipping": str(shipping.cost) if shipping else None,
+    }})
+    total = pricing.total + (shipping.cost if shipping else 0)
+    # Only queued here; the outbox dispatcher sends them in the background
+    try:
+        await run_in_threadpool(OUTBOX.enqueue_many,
+                                order_notifications(order_id, name, phone, email, str(total)))
+    except Exception as exc:
+        order_log.error("notification_enqueue_failed", extra={"fields": {"order_id": order_id, "error": str(exc)}})
+    if user and order.save_address and order.address_id is None:
+        try:
+            await run_in_threadpool(ACCOUNTS.add_address, user.id, "Home", name, phone, governorate, address)
+        except AccountError:
+            pass  # address book full; the order itself went through
+    return {"status": "success", "order_id": order_id, "total": str(total),
+            "shipping": str(shipping.cost) if shipping else None}
+
+@app.get("/api/cart")
+async def get_cart(request: Request, v: Optional[int] = None):
+    """
+    The visitor's cart; just {"v": ...} when the tab already has this version
+    """
+    state = await run_in_threadpool(CARTS.state, request.cookies.get(CART_COOKIE))
+    if v == state.version:
+        return {"v": state.version}
+    return cart_payload(CATALOG.current(), state)
+
+@app.post("/api/cart/sync")
+async def sync_cart(sync: CartSync, request: Request, response: Response):
+    """
+    Applies a batch of cart changes from one tab; the merged cart comes back only if another tab changed it first
+    """
+    snapshot = CATALOG.current()
+    try:
+        ops = parse_ops(sync.o, settings.CART_MAX_OPS)
+    except CartError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    unknown = [pid for op, pid, _ in ops if op != "r" and pid not in snapshot.by_id]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown product {unknown[0]}")
+    cart_id = request.cookies.get(CART_COOKIE)
+    if not cart_id:
+        cart_id = new_cart_id()
+        response.set_cookie(CART_COOKIE, cart_id, max_age=int(settings.CART_TTL_DAYS * 24 * 3600),
+                            httponly=True, samesite="lax")
+    try:
+        state, rebased = await run_in_threadpool(CARTS.apply, cart_id, sync.v, ops)
+    except CartError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return cart_payload(snapshot, state) if rebased else {"v": state.version}
+
+@app.post("/api/account/register", status_code=201)
+async def register_account(registration: Registration, response: Response):
+    """
+    Creates an account and signs it in
+    """
+    try:
+        user_id, name = await register(registration.email, registration.password, registration.name,
+                                       registration.phone)
+    except AccountError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return start_session(response, user_id, name)
+
+@app.post("/api/account/login")
+async def login_account(credentials: Credentials, response: Response):
+    """
+    Checks the password (hashed off the event loop) and sets the signed session cookie
+    """
+    user = await login(credentials.email, credentials.password)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Wrong email or password")
+    return start_session(response, *user)
+
+@app.post("/api/account/logout", status_code=204)
+async def logout_account():
+    response = Response(status_code=204)
+    response.delete_cookie(SESSION_COOKIE)
+    return response
+
+@app.get("/api/account")
+async def get_account(request: Request):
+    """
+    Profile and saved addresses of the signed-in customer
+    """
+    user = session_user(request)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Not signed in")
+    profile = await run_in_threadpool(ACCOUNTS.profile, user.id)
+    if profile is None:
+        raise HTTPException(status_code=401, detail="Not signed in")
+    addresses = await run_in_threadpool(ACCOUNTS.addresses, user.id)
+    return {"id": user.id, **profile, "addresses": [a.to_dict() for a in addresses]}
+
+@app.post("/api/account/addresses", status_code=201)
+async def add_address(saved: SavedAddress, request: Request):
+    user = session_user(request)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Not signed in")
+    if not (saved.name.strip() and saved.phone.strip() and saved.address.strip()):
+        raise HTTPException(status_code=400, detail="Name, phone and address are required")
+    try:
+        address = await run_in_threadpool(ACCOUNTS.add_address, user.id, saved.label.strip() or "Home",
+                                          saved.name.strip(), saved.phone.strip(), saved.governorate,
+                                          saved.address.strip())
+    except AccountError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return address.to_dict()
+
+@app.delete("/api/account/addresses/{address_id}", status_code=204)
+async def delete_address(address_id: int, request: Request):
+    user = session_user(request)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Not signed in")
+    if not await run_in_threadpool(ACCOUNTS.delete_address, user.id, address_id):
+        raise HTTPException(status_code=404, detail="Unknown address")
+    return Response(status_code=204)
+
+@app.get("/api/wishlist")
+async def get_wishlist(request: Request, ids: Optional[str] = None):
+    """
+    Which of the given products (comma separated ids, e.g. every card on a page) are saved;
+    without ids, the whole wishlist with the display fields of its products
+    """
+    wishlist = await run_in_threadpool(WISHLISTS.get, request.cookies.get(WISHLIST_COOKIE))
+    if ids is not None:
+        try:
+            product_ids = [int(i) for i in ids.split(",") if i.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="ids must be comma separated integers")
+        return {"v": wishlist.version, "n": len(wishlist), "ids": wishlist.saved(product_ids[:500])}
+    snapshot = CATALOG.current()
+    saved = [snapshot.by_id[pid] for pid in wishlist if pid in snapshot.by_id]
+    return {"v": wishlist.version, "n": len(saved), "ids": [p.id for p in saved],
+            "p": {p.id: [p.name, p.price, p.image_url] for p in saved}}
+
+@app.put("/api/wishlist/{product_id}")
+@app.delete("/api/wishlist/{product_id}")
+async def change_wishlist(product_id: int, request: Request, response: Response):
+    """
+    Saves (PUT) or unsaves (DELETE) one product for the visitor
+    """
+    saved = request.method == "PUT"
+    if saved and product_id not in CATALOG.current().by_id:
+        raise HTTPException(status_code=404, detail="Unknown product")
+    owner_id = request.cookies.get(WISHLIST_COOKIE)
+    if not owner_id:
+        owner_id = new_owner_id()
+        response.set_cookie(WISHLIST_COOKIE, owner_id, max_age=int(settings.WISHLIST_TTL_DAYS * 24 * 3600),
+                            httponly=True, samesite="lax")
+    try:
+        wishlist = await run_in_threadpool(WISHLISTS.set_saved, owner_id, product_id, saved)
+    except WishlistError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"v": wishlist.version, "n": len(wishlist)}
+
+@app.post("/api/shipping/quote")
+async def shipping_quote(request: ShippingQuote):
+    """
+    Shipping cost (EGP), zone and delivery estimate for a cart and a governorate or address
+    """
+    snapshot = CATALOG.current()
+    quote = SHIPPING.quote(snapshot, cart_quantities(snapshot, request.items), request.governorate, request.address)
+    if quote is None:
+        raise HTTPException(status_code=422, detail="Unknown governorate or address")
+    return quote.to_dict()
+
+@app.post("/api/cart/price")
+async def price_cart(quote: CartQuote):
+    """
+    Subtotal, promotion discounts and total (EGP) for a cart and optional coupon code
+    """
+    snapshot = CATALOG.current()
+    quantities = cart_quantities(snapshot, quote.items)
+    return PROMOTIONS.current().price(cart_lines(snapshot, quantities.items()), quote.coupon).to_dict()
+
+@app.post("/api/products/{product_id}/view", status_code=204)
+async def product_view(product_id: int):
+    """
+    View beacon sent when a shopper opens a product; feeds the trending counters
+    """
+    if product_id not in CATALOG.current().by_id:
+        raise HTTPException(status_code=404, detail="Unknown product")
+    TRENDING.record_view(product_id)
+    return Response(status_code=204)
+
+@app.get("/api/related")
+async def related_products(ids: str = ""):
+    """
+    "Frequently bought together" suggestions for the products in a cart (comma separated ids)
+    """
+    try:
+        product_ids = [int(i) for i in ids.split(",") if i.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma separated integers")
+    snapshot = CATALOG.current()
+    suggestions = [snapshot.by_id[pid] for pid in RECOMMENDER.related_to_many(product_ids[:50]) if pid in snapshot.by_id]
+    return [{"id": p.id, "name": p.name, "price": p.price, "image_url": p.image_url} for p in suggestions]
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Prometheus scrape endpoint
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
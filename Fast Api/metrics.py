@@ -0,0 +1,207 @@
+"""
+Minimal Prometheus-style metrics for the FastAPI store.
+
+Counters, gauges and histograms are kept in process memory and rendered in
+the Prometheus text exposition format by `REGISTRY.render()`.
+"""
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+from fastapi.templating import Jinja2Templates
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., +Inf count, sum]
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[bisect_left(self.buckets, value)] += 1
+            state[-1] += value
+
+    def _render_sample(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+            cumulative += count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state[-1])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    "modesta_http_requests_total", "HTTP requests handled", ("method", "route", "status")))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "modesta_http_requests_in_flight", "HTTP requests currently being handled"))
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "modesta_http_request_duration_seconds", "Total request latency", ("method", "route")))
+HANDLER_TIME = REGISTRY.register(Histogram(
+    "modesta_http_handler_duration_seconds", "Request latency excluding template rendering", ("method", "route")))
+RENDER_TIME = REGISTRY.register(Histogram(
+    "modesta_template_render_duration_seconds", "Jinja2 template render time", ("template",)))
+RESPONSE_SIZE = REGISTRY.register(Histogram(
+    "modesta_http_response_size_bytes", "Response body size", ("method", "route"), buckets=SIZE_BUCKETS))
+
+# Template render time spent inside the current request, filled by InstrumentedTemplates
+_render_seconds: ContextVar = ContextVar("render_seconds", default=None)
+
+
+class InstrumentedTemplates(Jinja2Templates):
+    """
+    Jinja2Templates that times rendering so it can be reported apart from handler time.
+    """
+    def TemplateResponse(self, *args, **kwargs):
+        name = kwargs.get("name") or next((a for a in args if isinstance(a, str)), "unknown")
+        start = perf_counter()
+        try:
+            return super().TemplateResponse(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            RENDER_TIME.observe(elapsed, template=name)
+            acc = _render_seconds.get()
+            if acc is not None:
+                acc[0] += elapsed
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, in-flight count and response size per route.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        acc = [0.0]
+        token = _render_seconds.set(acc)
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        IN_FLIGHT.inc()
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = perf_counter() - start
+            IN_FLIGHT.dec()
+            _render_seconds.reset(token)
+            # FastAPI stores the matched route in the scope; use its template to keep cardinality low
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope.get("method", "")
+            REQUESTS.inc(method=method, route=route, status=status)
+            REQUEST_LATENCY.observe(elapsed, method=method, route=route)
+            HANDLER_TIME.observe(max(elapsed - acc[0], 0.0), method=method, route=route)
+            RESPONSE_SIZE.observe(size, method=method, route=route)
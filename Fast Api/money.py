@@ -0,0 +1,188 @@
+"""
+Decimal money, FX rates and precomputed per-currency price tables.
+
+Catalog prices are in the base currency (EGP) and become `Decimal`s quantized
+to the minor unit before any arithmetic, so totals are exact. Display
+currencies convert with rates from data/fx_rates.json, which is reloaded when
+the file changes. Converted and formatted prices are kept per (catalog version,
+rates version, currency, locale) in a `PriceTable`: each product's label is
+formatted the first time a page shows it, and after that rendering a price is
+a dict lookup.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Dict, Iterable, Optional, Tuple
+
+import settings
+from catalog import CatalogSnapshot
+
+log = logging.getLogger("modesta.money")
+
+BASE_CURRENCY = "EGP"
+CENT = Decimal("0.01")
+LOCALES = ("en", "ar")
+
+# Display pattern per locale; amounts always use two decimals, trimmed when whole
+CURRENCIES: Dict[str, Dict[str, str]] = {
+    "EGP": {"en": "{amount} EGP", "ar": "{amount} ج.م"},
+    "USD": {"en": "${amount}", "ar": "{amount} US$"},
+    "SAR": {"en": "{amount} SAR", "ar": "{amount} ر.س"},
+    "AED": {"en": "{amount} AED", "ar": "{amount} د.إ"},
+}
+ARABIC_DIGITS = str.maketrans("0123456789,.", "٠١٢٣٤٥٦٧٨٩٬٫")
+
+
+def to_money(value) -> Decimal:
+    """
+    Exact amount from a catalog price. Floats go through their shortest repr, so 520.1 stays 520.10.
+    """
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def money_sum(amounts: Iterable[Decimal]) -> Decimal:
+    return sum(amounts, Decimal("0.00"))
+
+
+def format_money(amount: Decimal, currency: str = BASE_CURRENCY, locale: str = "en") -> str:
+    text = f"{amount:,.2f}"
+    if text.endswith(".00"):
+        text = text[:-3]
+    if locale == "ar":
+        text = text.translate(ARABIC_DIGITS)
+    return CURRENCIES[currency][locale].format(amount=text)
+
+
+class FxRates:
+    """
+    One immutable set of rates: units of each currency per unit of the base currency.
+    """
+    def __init__(self, version: int, rates: Dict[str, Decimal], updated: str = ""):
+        self.version = version
+        self.rates = rates
+        self.updated = updated
+
+    def convert(self, amount: Decimal, currency: str) -> Decimal:
+        return (amount * self.rates[currency]).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def load_rates(path: str) -> Tuple[Dict[str, Decimal], str]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("base", BASE_CURRENCY) != BASE_CURRENCY:
+        raise ValueError(f"{path}: rates must be quoted against {BASE_CURRENCY}")
+    rates = {BASE_CURRENCY: Decimal(1)}
+    for code, rate in data["rates"].items():
+        if code not in CURRENCIES:
+            continue
+        try:
+            rates[code] = Decimal(str(rate))
+        except InvalidOperation:
+            raise ValueError(f"{path}: invalid rate for {code}")
+        if rates[code] <= 0:
+            raise ValueError(f"{path}: invalid rate for {code}")
+    return rates, str(data.get("updated", ""))
+
+
+class FxStore:
+    """
+    Current FX rates with hot reload; a broken file keeps the previous rates.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._rates = FxRates(1, {BASE_CURRENCY: Decimal(1)})
+        self._mtime: Optional[float] = None
+        self._failed_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def current(self) -> FxRates:
+        return self._rates
+
+    def reload(self) -> bool:
+        with self._lock:
+            mtime = None
+            try:
+                mtime = os.path.getmtime(self.path)
+                rates, updated = load_rates(self.path)
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as exc:
+                # Same as the catalog: don't retry a broken file on every poll
+                self._failed_mtime = mtime
+                log.error("fx_reload_failed", extra={"fields": {"path": self.path, "error": str(exc)}})
+                return False
+            self._rates = FxRates(self._rates.version + 1, rates, updated)
+            self._mtime = mtime
+        log.info("fx_reloaded", extra={"fields": {"currencies": sorted(rates), "updated": updated}})
+        return True
+
+    def changed_on_disk(self) -> bool:
+        try:
+            return os.path.getmtime(self.path) not in (self._mtime, self._failed_mtime)
+        except OSError:
+            return False
+
+    async def watch(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if self.changed_on_disk():
+                await loop.run_in_executor(None, self.reload)
+
+
+class PriceTable:
+    """
+    Product prices in one currency, exact and formatted for one locale, filled in per product as pages
+    render them; creating one costs nothing, however large the catalog (or a .snap that builds products lazily).
+    """
+    def __init__(self, rates: FxRates, currency: str, locale: str):
+        self.currency = currency
+        self.locale = locale
+        self.rates = rates
+        self.rate = rates.rates[currency]
+        self.labels: Dict[int, str] = {}
+
+    def amount(self, product) -> Decimal:
+        return self.rates.convert(to_money(product.price), self.currency)
+
+    def label(self, product) -> str:
+        label = self.labels.get(product.id)
+        if label is None:
+            # Two threads may format the same price at once; both store the same string
+            label = self.labels[product.id] = format_money(self.amount(product), self.currency, self.locale)
+        return label
+
+
+class PriceTables:
+    """
+    One table per (currency, locale), dropped when the catalog or rates change.
+    """
+    def __init__(self, fx: FxStore):
+        self.fx = fx
+        self._tables: Dict[Tuple[str, str], PriceTable] = {}
+        self._key: Tuple[int, int] = (0, 0)
+        self._lock = threading.Lock()
+
+    def get(self, snapshot: CatalogSnapshot, currency: str, locale: str) -> PriceTable:
+        rates = self.fx.current()
+        if currency not in rates.rates:
+            currency = BASE_CURRENCY
+        key = (snapshot.version, rates.version)
+        with self._lock:
+            if key != self._key:
+                self._tables = {}
+                self._key = key
+            table = self._tables.get((currency, locale))
+            if table is None:
+                table = self._tables[(currency, locale)] = PriceTable(rates, currency, locale)
+        return table
+
+    def currencies(self):
+        return sorted(self.fx.current().rates)
+
+
+FX = FxStore(settings.FX_RATES_PATH)
+PRICES = PriceTables(FX)
@@ -0,0 +1,518 @@
+"""
+Customer notifications (order emails and SMS) through a SQLite outbox.
+
+Checkout only inserts rows into the outbox table (MODESTA_NOTIFY_DB); nothing
+is sent on the request path. A dispatcher task in each worker claims due
+messages in batches (a lease, renewed while the batch is being sent, keeps
+two workers from taking the same rows), groups them per provider ("email",
+"sms") and hands each group to that provider's transport in one call, so an
+SMTP connection or an HTTP request is shared by the whole batch. Failed messages are retried with
+exponential backoff and jitter, up to MODESTA_NOTIFY_MAX_ATTEMPTS; a
+permanent failure (e.g. a rejected recipient) stops at once.
+
+Transports are pluggable (see TRANSPORTS): "file" writes JSON lines for
+development and tests, "smtp" sends email, "webhook" posts each batch to a
+gateway URL. For a local SMTP stand-in run `python notifications.py sink`
+and point MODESTA_SMTP_HOST/PORT at it.
+
+Usage:
+    python notifications.py status
+    python notifications.py sink [--port 8025] [--out outbox/smtp]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import smtplib
+import socketserver
+import sqlite3
+import threading
+import time
+import urllib.request
+from email.message import EmailMessage
+from typing import Callable, Dict, List, Optional
+
+import settings
+from metrics import REGISTRY, Counter
+
+log = logging.getLogger("modesta.notifications")
+
+NOTIFICATIONS = REGISTRY.register(Counter(
+    "modesta_notifications_total", "Notification send attempts by provider and result", ("provider", "result")))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedupe_key TEXT UNIQUE,
+    provider TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL DEFAULT '',
+    body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at);
+"""
+
+PENDING, SENT, FAILED = "pending", "sent", "failed"
+# Claimed rows are leased to one worker; the lease is renewed every LEASE_RENEW_SECONDS while the
+# batch is being sent, so it only lapses when that worker is gone, however slow the provider is
+LEASE_SECONDS = 60
+LEASE_RENEW_SECONDS = LEASE_SECONDS / 3
+
+
+class Message:
+    def __init__(self, id: int, provider: str, recipient: str, subject: str, body: str, attempts: int):
+        self.id = id
+        self.provider = provider
+        self.recipient = recipient
+        self.subject = subject
+        self.body = body
+        self.attempts = attempts
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "to": self.recipient, "subject": self.subject, "text": self.body}
+
+
+class Failure:
+    def __init__(self, error: str, permanent: bool = False):
+        self.error = error
+        self.permanent = permanent
+
+
+# --- TRANSPORTS ---
+# send_batch(messages) returns one entry per message: None when it was sent, else a Failure.
+# Raising fails the whole batch (temporarily), e.g. when the provider can't be reached, so a transport
+# that can tell which messages went out before an error reports them one by one instead.
+
+class FileTransport:
+    """
+    Appends each message as a JSON line to <directory>/<provider>.jsonl.
+    """
+    def __init__(self, provider: str, directory: str):
+        self.path = os.path.join(directory, f"{provider}.jsonl")
+        self.directory = directory
+
+    def send_batch(self, messages: List[Message]) -> List[Optional[Failure]]:
+        os.makedirs(self.directory, exist_ok=True)
+        lines = "".join(json.dumps({**m.to_dict(), "sent_at": time.time()}, ensure_ascii=False) + "\n"
+                        for m in messages)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        return [None] * len(messages)
+
+
+class SmtpTransport:
+    """
+    One SMTP connection per batch; a refused recipient or a malformed header fails only its own
+    message, for good, and a dropped connection fails only the messages not sent yet.
+    """
+    def __init__(self, host: str, port: int, user: str = "", password: str = "", starttls: bool = False,
+                 sender: str = settings.MAIL_FROM, timeout: float = 30):
+        self.host, self.port, self.user, self.password = host, port, user, password
+        self.starttls = starttls
+        self.sender = sender
+        self.timeout = timeout
+
+    def send_batch(self, messages: List[Message]) -> List[Optional[Failure]]:
+        results: List[Optional[Failure]] = []
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+            for message in messages:
+                try:
+                    email = EmailMessage()
+                    email["From"] = self.sender
+                    email["To"] = message.recipient
+                    email["Subject"] = message.subject
+                    email.set_content(message.body)
+                    smtp.send_message(email)
+                    results.append(None)
+                except ValueError as exc:
+                    # A header the email package refuses (a newline in the address, say) never gets better
+                    results.append(Failure(str(exc), permanent=True))
+                except smtplib.SMTPRecipientsRefused as exc:
+                    results.append(Failure(str(exc), permanent=True))
+                except smtplib.SMTPResponseException as exc:
+                    # 5xx is final, 4xx (greylisting, mailbox busy) is worth retrying
+                    results.append(Failure(f"{exc.smtp_code} {exc.smtp_error!r}", permanent=exc.smtp_code >= 500))
+                except (smtplib.SMTPException, OSError) as exc:
+                    # The connection is gone: what was already sent stays sent, the rest is retried
+                    failure = Failure(str(exc) or type(exc).__name__)
+                    results.extend([failure] * (len(messages) - len(results)))
+                    break
+        finally:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                smtp.close()
+        return results
+
+
+class WebhookTransport:
+    """
+    POSTs {"provider", "messages": [{id, to, subject, text}]} to a gateway; it answers
+    {"results": [{"id", "ok", "error", "permanent"}]} or a 2xx without a body when all were accepted.
+    """
+    def __init__(self, provider: str, url: str, token: str = "", timeout: float = 30):
+        self.provider = provider
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+
+    def send_batch(self, messages: List[Message]) -> List[Optional[Failure]]:
+        body = json.dumps({"provider": self.provider, "messages": [m.to_dict() for m in messages]}).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        if self.token:
+            request.add_header("Authorization", f"Bearer {self.token}")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            payload = response.read()
+        results = {r.get("id"): r for r in (json.loads(payload).get("results", []) if payload.strip() else [])}
+        failures: List[Optional[Failure]] = []
+        for message in messages:
+            r = results.get(message.id)
+            ok = r is None or r.get("ok", True)
+            failures.append(None if ok else Failure(str(r.get("error", "rejected")), bool(r.get("permanent"))))
+        return failures
+
+
+def file_transport(provider: str):
+    return FileTransport(provider, settings.NOTIFY_FILE_DIR)
+
+
+def smtp_transport(provider: str):
+    return SmtpTransport(settings.SMTP_HOST, settings.SMTP_PORT, settings.SMTP_USER, settings.SMTP_PASSWORD,
+                         settings.SMTP_STARTTLS)
+
+
+def webhook_transport(provider: str):
+    return WebhookTransport(provider, settings.NOTIFY_WEBHOOK_URL, settings.NOTIFY_WEBHOOK_TOKEN)
+
+
+TRANSPORTS: Dict[str, Callable[[str], object]] = {
+    "file": file_transport,
+    "smtp": smtp_transport,
+    "webhook": webhook_transport,
+}
+
+
+def configured_transports() -> Dict[str, object]:
+    return {"email": TRANSPORTS[settings.NOTIFY_EMAIL_TRANSPORT]("email"),
+            "sms": TRANSPORTS[settings.NOTIFY_SMS_TRANSPORT]("sms")}
+
+
+def retry_delay(attempts: int, base: float = settings.NOTIFY_RETRY_BASE, cap: float = settings.NOTIFY_RETRY_MAX) -> float:
+    # The delay doubles per attempt; jitter keeps the retries from one outage from arriving together
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+class Outbox:
+    def __init__(self, path: str, transports: Optional[Dict[str, object]] = None,
+                 batch_size: int = settings.NOTIFY_BATCH_SIZE, max_attempts: int = settings.NOTIFY_MAX_ATTEMPTS):
+        self.path = path
+        self._transports = transports
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    @property
+    def transports(self) -> Dict[str, object]:
+        if self._transports is None:
+            self._transports = configured_transports()
+        return self._transports
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; claims use BEGIN IMMEDIATE so workers never take the same rows
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, provider: str, recipient: str, body: str, subject: str = "", dedupe_key: Optional[str] = None) -> bool:
+        """
+        Queues one message; a repeated dedupe_key is ignored. Returns whether it was queued.
+        """
+        return self.enqueue_many([(provider, recipient, subject, body, dedupe_key)]) == 1
+
+    def enqueue_many(self, rows: List[tuple]) -> int:
+        """
+        rows: (provider, recipient, subject, body, dedupe_key); one transaction for all of them.
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox (dedupe_key, provider, recipient, subject, body, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(key, provider, recipient, subject, body, now, now) for provider, recipient, subject, body, key in rows])
+            queued = conn.total_changes - before
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return queued
+
+    def claim(self, now: float) -> List[Message]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, provider, recipient, subject, body, attempts FROM outbox "
+                "WHERE status = ? AND next_attempt_at <= ? AND lease_until <= ? ORDER BY next_attempt_at LIMIT ?",
+                (PENDING, now, now, self.batch_size)).fetchall()
+            conn.executemany("UPDATE outbox SET lease_until = ? WHERE id = ?", [(now + LEASE_SECONDS, r[0]) for r in rows])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [Message(*row) for row in rows]
+
+    def renew(self, ids: List[int], now: float):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("UPDATE outbox SET lease_until = ? WHERE id = ? AND status = ?",
+                             [(now + LEASE_SECONDS, i, PENDING) for i in ids])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @contextlib.contextmanager
+    def holding_lease(self, messages: List[Message]):
+        """
+        Keeps the lease on `messages` alive from a helper thread until the block exits.
+        """
+        ids = [m.id for m in messages]
+        stop = threading.Event()
+
+        def keep_alive():
+            while not stop.wait(LEASE_RENEW_SECONDS):
+                try:
+                    self.renew(ids, time.time())
+                except sqlite3.Error as exc:
+                    log.warning("notification_lease_renew_failed", extra={"fields": {"error": str(exc)}})
+
+        thread = threading.Thread(target=keep_alive, name="outbox-lease", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def dispatch_once(self) -> int:
+        """
+        Claims one batch and sends it, one transport call per provider; returns how many messages were handled.
+        """
+        messages = self.claim(time.time())
+        if not messages:
+            return 0
+        groups: Dict[str, List[Message]] = {}
+        for message in messages:
+            groups.setdefault(message.provider, []).append(message)
+
+        sends: Dict[str, List[Optional[Failure]]] = {}
+        with self.holding_lease(messages):
+            for provider, group in groups.items():
+                transport = self.transports.get(provider)
+                try:
+                    if transport is None:
+                        raise LookupError(f"No transport for provider {provider!r}")
+                    sends[provider] = transport.send_batch(group)
+                except Exception as exc:
+                    log.warning("notification_batch_failed", extra={"fields": {"provider": provider, "messages": len(group),
+                                                                               "error": str(exc)}})
+                    sends[provider] = [Failure(str(exc) or type(exc).__name__)] * len(group)
+
+        # Backoff counts from the end of the batch, which can take a while with a slow provider
+        now = time.time()
+        updates = []
+        for provider, group in groups.items():
+            for message, failure in zip(group, sends[provider]):
+                attempts = message.attempts + 1
+                if failure is None:
+                    updates.append((SENT, attempts, now, 0, None, now, message.id))
+                    NOTIFICATIONS.inc(provider=provider, result="sent")
+                elif failure.permanent or attempts >= self.max_attempts:
+                    updates.append((FAILED, attempts, now, 0, failure.error, None, message.id))
+                    NOTIFICATIONS.inc(provider=provider, result="failed")
+                    log.error("notification_failed", extra={"fields": {"id": message.id, "provider": provider,
+                                                                       "attempts": attempts, "error": failure.error}})
+                else:
+                    updates.append((PENDING, attempts, now + retry_delay(attempts), 0, failure.error, None, message.id))
+                    NOTIFICATIONS.inc(provider=provider, result="retry")
+
+        if updates:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, lease_until = ?, "
+                                 "last_error = ?, sent_at = ? WHERE id = ?", updates)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return len(messages)
+
+    def drain(self) -> int:
+        """
+        Dispatches until nothing is due; returns the number of messages handled.
+        """
+        handled = 0
+        while True:
+            count = self.dispatch_once()
+            handled += count
+            if count < self.batch_size:
+                return handled
+
+    async def run(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                # Sends block (sockets, files), so they run in a worker thread, never on the event loop
+                handled = await loop.run_in_executor(None, self.drain)
+            except Exception as exc:
+                log.error("notification_dispatch_failed", extra={"fields": {"error": str(exc)}})
+                handled = 0
+            if not handled:
+                await asyncio.sleep(interval)
+
+    def status(self) -> dict:
+        rows = self._conn().execute(
+            "SELECT provider, status, COUNT(*), MIN(created_at) FROM outbox GROUP BY provider, status").fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        oldest_pending = None
+        for provider, status, count, oldest in rows:
+            counts.setdefault(provider, {})[status] = count
+            if status == PENDING:
+                oldest_pending = oldest if oldest_pending is None else min(oldest_pending, oldest)
+        failures = self._conn().execute(
+            "SELECT id, provider, recipient, attempts, last_error FROM outbox WHERE status = ? ORDER BY id DESC LIMIT 20",
+            (FAILED,)).fetchall()
+        return {
+            "counts": counts,
+            "oldest_pending_age_s": round(time.time() - oldest_pending, 1) if oldest_pending else None,
+            "recent_failures": [{"id": i, "provider": p, "to": r, "attempts": a, "error": e} for i, p, r, a, e in failures],
+        }
+
+
+def order_notifications(order_id: str, name: str, phone: str, email: Optional[str], total: str) -> List[tuple]:
+    """
+    Outbox rows for a new order: an SMS to the phone and, when given, an email.
+    """
+    text = (f"Hi {name}, your Modesta order {order_id} is confirmed. Total: {total} EGP. "
+            f"We'll call you to arrange delivery.")
+    rows = [("sms", phone, "", text, f"{order_id}:confirmed:sms")]
+    if email:
+        rows.append(("email", email, f"Your Modesta order {order_id}", text, f"{order_id}:confirmed:email"))
+    return rows
+
+
+OUTBOX = Outbox(settings.NOTIFY_DB)
+
+
+# --- LOCAL SMTP STAND-IN ---
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP for smtplib: accepts every message and writes it to the sink directory.
+    """
+    def reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self.reply("220 modesta-sink ready")
+        envelope: Dict[str, object] = {"to": []}
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            if verb in ("HELO", "EHLO"):
+                self.reply("250 modesta-sink")
+            elif verb == "MAIL":
+                envelope = {"from": command[10:].strip(), "to": []}
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                envelope["to"].append(command[8:].strip())
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for raw in iter(self.rfile.readline, b""):
+                    if raw in (b".\r\n", b".\n"):
+                        break
+                    data.append(raw[1:] if raw.startswith(b"..") else raw)
+                self.server.deliver(envelope, b"".join(data))
+                self.reply("250 OK queued")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:  # RSET, NOOP and anything else
+                self.reply("250 OK")
+
+
+class LocalSmtpSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int = 8025, directory: Optional[str] = None):
+        super().__init__(("127.0.0.1", port), _SinkHandler)
+        self.directory = directory
+        self.received = 0
+        self._lock = threading.Lock()
+
+    def deliver(self, envelope: dict, data: bytes):
+        with self._lock:
+            self.received += 1
+            number = self.received
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{time.time():.6f}-{number}.eml"), "wb") as f:
+                f.write(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Notification outbox tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status")
+    sink = sub.add_parser("sink", help="run a local SMTP stand-in that stores every message as .eml")
+    sink.add_argument("--port", type=int, default=8025)
+    sink.add_argument("--out", default=os.path.join(settings.NOTIFY_FILE_DIR, "smtp"))
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        print(json.dumps(OUTBOX.status(), indent=1))
+    else:
+        server = LocalSmtpSink(args.port, args.out)
+        print(f"SMTP sink on 127.0.0.1:{args.port}, writing to {args.out} "
+              f"(MODESTA_NOTIFY_EMAIL=smtp MODESTA_SMTP_HOST=127.0.0.1 MODESTA_SMTP_PORT={args.port})")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
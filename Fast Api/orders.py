@@ -0,0 +1,209 @@
+"""
+Order log with incrementally maintained sales rollups.
+
+Orders and their line items go into SQLite (data/orders.db). SQLite triggers
+update the rollup tables (per day, per day+category, per SKU) in the same
+transaction as the insert, so the admin dashboard only ever reads a few
+small pre-aggregated rows, never the order log itself.
+"""
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Iterable, List, Optional, Tuple
+
+import settings
+
+# Amounts are exact Decimals in Python; the REAL columns take them via their text form
+sqlite3.register_adapter(Decimal, str)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    day TEXT NOT NULL,
+    customer TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    address TEXT NOT NULL,
+    request_id TEXT,
+    total REAL NOT NULL,
+    item_count INTEGER NOT NULL,
+    email TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_orders_order_id ON orders(order_id);
+
+-- One row per promotion that discounted the order, so invoices can be rebuilt line for line
+CREATE TABLE IF NOT EXISTS order_discounts (
+    order_pk INTEGER NOT NULL REFERENCES orders(id),
+    label TEXT NOT NULL,
+    amount REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_order_discounts_order ON order_discounts(order_pk);
+
+CREATE TABLE IF NOT EXISTS order_items (
+    order_pk INTEGER NOT NULL REFERENCES orders(id),
+    day TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    category TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    unit_price REAL NOT NULL,
+    line_total REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_pk);
+
+CREATE TABLE IF NOT EXISTS sales_daily (
+    day TEXT PRIMARY KEY,
+    orders INTEGER NOT NULL DEFAULT 0,
+    items INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS sales_category_daily (
+    day TEXT NOT NULL,
+    category TEXT NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, category)
+);
+CREATE TABLE IF NOT EXISTS sales_sku (
+    product_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sales_sku_revenue ON sales_sku(revenue DESC);
+
+CREATE TRIGGER IF NOT EXISTS trg_orders_rollup AFTER INSERT ON orders BEGIN
+    INSERT INTO sales_daily (day, orders) VALUES (NEW.day, 1)
+        ON CONFLICT(day) DO UPDATE SET orders = orders + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_order_items_rollup AFTER INSERT ON order_items BEGIN
+    INSERT INTO sales_daily (day, items, revenue) VALUES (NEW.day, NEW.quantity, NEW.line_total)
+        ON CONFLICT(day) DO UPDATE SET items = items + NEW.quantity, revenue = revenue + NEW.line_total;
+    INSERT INTO sales_category_daily (day, category, quantity, revenue)
+        VALUES (NEW.day, NEW.category, NEW.quantity, NEW.line_total)
+        ON CONFLICT(day, category) DO UPDATE SET quantity = quantity + NEW.quantity, revenue = revenue + NEW.line_total;
+    INSERT INTO sales_sku (product_id, name, quantity, revenue)
+        VALUES (NEW.product_id, NEW.name, NEW.quantity, NEW.line_total)
+        ON CONFLICT(product_id) DO UPDATE SET name = NEW.name, quantity = quantity + NEW.quantity,
+                                              revenue = revenue + NEW.line_total;
+END;
+"""
+
+
+def new_order_id() -> str:
+    """
+    A unique order id; it keys the order log, invoices and notifications, so it must never repeat.
+    """
+    return f"MOD-{uuid.uuid4().hex[:12].upper()}"
+
+
+def migrate(conn: sqlite3.Connection):
+    """
+    Brings a database created by an older version up to SCHEMA (columns CREATE TABLE IF NOT EXISTS can't add).
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(orders)")}
+    if "email" not in columns:
+        conn.execute("ALTER TABLE orders ADD COLUMN email TEXT")
+
+
+class OrderLine:
+    def __init__(self, product_id: int, name: str, category: str, quantity: int, unit_price: Decimal,
+                 discount: Decimal = Decimal("0.00")):
+        self.product_id = product_id
+        self.name = name
+        self.category = category
+        self.quantity = quantity
+        self.unit_price = unit_price
+        # Promotion discount on this line; rollups then count what was actually charged
+        self.discount = discount
+
+    @property
+    def line_total(self) -> Decimal:
+        return self.unit_price * self.quantity - self.discount
+
+
+class OrderStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; SQLite serializes the writers
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    migrate(conn)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def record(self, order_id: str, customer: str, phone: str, address: str, lines: List[OrderLine],
+               request_id: Optional[str] = None, created_at: Optional[datetime] = None,
+               email: Optional[str] = None, discounts: Iterable[Tuple[str, Decimal]] = ()) -> int:
+        """
+        Stores one order and its (label, amount) discounts; the rollups are updated by triggers in the same transaction.
+        """
+        created_at = created_at or datetime.now(timezone.utc)
+        day = created_at.date().isoformat()
+        total = sum((line.line_total for line in lines), Decimal("0.00"))
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO orders (order_id, created_at, day, customer, phone, address, request_id, total, item_count, "
+                "email) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (order_id, created_at.isoformat(), day, customer, phone, address, request_id, total,
+                 sum(line.quantity for line in lines), email or None),
+            )
+            order_pk = cursor.lastrowid
+            conn.executemany("INSERT INTO order_discounts (order_pk, label, amount) VALUES (?, ?, ?)",
+                             [(order_pk, label, amount) for label, amount in discounts])
+            conn.executemany(
+                "INSERT INTO order_items (order_pk, day, product_id, name, category, quantity, unit_price, line_total) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(order_pk, day, l.product_id, l.name, l.category, l.quantity, l.unit_price, l.line_total)
+                 for l in lines],
+            )
+        return order_pk
+
+    def dashboard(self, days: int = 30, top: int = 10) -> dict:
+        """
+        Everything the admin dashboard shows, read from the rollup tables only.
+        """
+        conn = self._conn()
+        daily = conn.execute(
+            "SELECT day, orders, items, revenue FROM sales_daily ORDER BY day DESC LIMIT ?", (days,)
+        ).fetchall()
+        since = daily[-1][0] if daily else ""
+        categories = conn.execute(
+            "SELECT category, SUM(quantity), SUM(revenue) FROM sales_category_daily WHERE day >= ? "
+            "GROUP BY category ORDER BY SUM(revenue) DESC", (since,)
+        ).fetchall()
+        top_skus = conn.execute(
+            "SELECT product_id, name, quantity, revenue FROM sales_sku ORDER BY revenue DESC LIMIT ?", (top,)
+        ).fetchall()
+        orders, revenue = conn.execute(
+            "SELECT COALESCE(SUM(orders), 0), COALESCE(SUM(revenue), 0) FROM sales_daily"
+        ).fetchone()
+        return {
+            "days": days,
+            "daily": [{"day": d, "orders": o, "items": i, "revenue": r} for d, o, i, r in reversed(daily)],
+            "categories": [{"category": c, "quantity": q, "revenue": r} for c, q, r in categories],
+            "top_skus": [{"product_id": p, "name": n, "quantity": q, "revenue": r} for p, n, q, r in top_skus],
+            "total_orders": orders,
+            "total_revenue": revenue,
+            "average_basket": revenue / orders if orders else 0.0,
+        }
+
+
+ORDERS = OrderStore(settings.ORDERS_DB)
@@ -0,0 +1,99 @@
+"""
+Heavy per-product content for the detail pages.
+
+Image galleries, size charts and long descriptions live outside the catalog,
+one JSON file per product (data/products/<id>.json), so catalog snapshots and
+listing pages only ever carry the fields a card needs. A detail is read the
+first time its page is requested and then served from a bounded LRU; the
+file's mtime is checked on each hit so edits show up without a restart.
+"""
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import settings
+from catalog import Product
+from metrics import REGISTRY, Counter
+
+log = logging.getLogger("modesta.catalog")
+
+DETAIL_CACHE = REGISTRY.register(Counter(
+    "modesta_product_detail_cache_total", "Product detail lookups by cache result", ("result",)))
+
+
+class ProductDetails:
+    def __init__(self, images: List[str], long_description: str, size_chart: List[Dict[str, object]]):
+        self.images = images
+        self.long_description = long_description
+        self.size_chart = size_chart
+
+    @property
+    def size_columns(self) -> List[str]:
+        columns: List[str] = []
+        for row in self.size_chart:
+            columns.extend(c for c in row if c not in columns)
+        return columns
+
+    def to_dict(self) -> dict:
+        return {"images": self.images, "long_description": self.long_description, "size_chart": self.size_chart}
+
+
+class DetailStore:
+    def __init__(self, directory: str, max_entries: int):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[int, Tuple[Optional[float], Optional[ProductDetails]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, product_id: int) -> str:
+        return os.path.join(self.directory, f"{product_id}.json")
+
+    def get(self, product: Product) -> ProductDetails:
+        """
+        The product's details; anything missing falls back to the catalog fields.
+        """
+        try:
+            mtime = os.path.getmtime(self._path(product.id))
+        except OSError:
+            mtime = None
+        with self._lock:
+            cached = self._cache.get(product.id)
+            if cached is not None and cached[0] == mtime:
+                self._cache.move_to_end(product.id)
+                DETAIL_CACHE.inc(result="hit")
+                return self._with_fallbacks(product, cached[1])
+
+        DETAIL_CACHE.inc(result="miss")
+        details = self._load(product.id) if mtime is not None else None
+        with self._lock:
+            self._cache[product.id] = (mtime, details)
+            self._cache.move_to_end(product.id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return self._with_fallbacks(product, details)
+
+    @staticmethod
+    def _with_fallbacks(product: Product, details: Optional[ProductDetails]) -> ProductDetails:
+        if details is None:
+            return ProductDetails([product.image_url], product.description, [])
+        return ProductDetails(details.images or [product.image_url], details.long_description or product.description,
+                              details.size_chart)
+
+    def _load(self, product_id: int) -> Optional[ProductDetails]:
+        try:
+            with open(self._path(product_id), encoding="utf-8") as f:
+                data = json.load(f)
+            return ProductDetails(
+                [str(url) for url in data.get("images", [])],
+                str(data.get("long_description", "")),
+                [dict(row) for row in data.get("size_chart", [])],
+            )
+        except (OSError, ValueError, TypeError, AttributeError) as exc:
+            log.error("product_details_invalid", extra={"fields": {"product_id": product_id, "error": str(exc)}})
+            return None
+
+
+DETAILS = DetailStore(settings.PRODUCT_DETAILS_DIR, settings.PRODUCT_DETAILS_CACHE_SIZE)
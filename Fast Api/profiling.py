@@ -0,0 +1,109 @@
+"""
+On-demand sampling profiler.
+
+A background thread periodically snapshots the Python stacks of the other
+threads and counts identical stacks. The result is written in the
+"collapsed stack" format understood by flamegraph.pl, speedscope and inferno:
+
+    outer (file.py:10);inner (file.py:42) 17
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+
+from fastapi.responses import PlainTextResponse
+
+import settings
+
+# Stacks passing through these handlers are kept by the admin profiler
+DEFAULT_FOCUS = frozenset({"read_root", "checkout"})
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, focus=None, thread_ids=None):
+        self.interval = interval
+        self.focus = frozenset(focus) if focus else None
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        me = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me or (self.thread_ids and thread_id not in self.thread_ids):
+                continue
+            names = []
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(code.co_name)
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if self.focus and self.focus.isdisjoint(names):
+                continue
+            stack.reverse()
+            self.stacks[";".join(stack)] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_for(self, seconds: float):
+        self.start()
+        try:
+            time.sleep(seconds)
+        finally:
+            self.stop()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+class ProfileRequestMiddleware:
+    """
+    When MODESTA_PROFILE_REQUESTS is on, `?profile=1` on any request samples
+    the event loop thread while that request is handled and returns the
+    collapsed stacks instead of the normal response. Other requests served
+    concurrently on the same loop show up in the profile too.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not (settings.PROFILE_REQUESTS and scope["type"] == "http" and self._wants_profile(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        async def discard(message):
+            pass
+
+        profiler = SamplingProfiler(interval=0.001, thread_ids=[threading.get_ident()])
+        profiler.start()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.stop()
+        response = PlainTextResponse(profiler.collapsed(), headers={"X-Profile-Samples": str(profiler.samples)})
+        await response(scope, receive, send)
+
+    @staticmethod
+    def _wants_profile(scope) -> bool:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        return query.get("profile", ["0"])[-1] == "1"
@@ -0,0 +1,352 @@
+"""
+Promotions and coupon codes.
+
+Rules live in data/promotions.json (MODESTA_PROMOTIONS) and are compiled once
+per file version: amounts and dates are parsed up front and every rule is
+indexed by the SKUs and categories it can touch, coupon rules by their code.
+Pricing a cart only looks up the rules indexed under the cart's SKUs,
+categories and code, so its cost follows the cart, not the size of the file.
+
+Rule kinds (plus optional id, label, code, starts, ends, min_subtotal, priority):
+    {"kind": "percent", "percent": 20, "categories": ["Abayas"], "skus": [10]}
+        percent off matching units; no categories and no skus means the whole cart
+    {"kind": "buy_x_get_y", "sku": 8, "buy": 2, "get": 1, "percent": 100}
+        in every buy+get units of the SKU, `get` units are discounted by percent
+    {"kind": "bundle", "skus": [5, 12], "price": "260"}
+        one of each SKU together for a fixed price
+
+A unit is discounted by at most one rule. Rules run in priority order
+(bundles, then buy-x-get-y, then percentages unless "priority" says
+otherwise, ties in file order), so the result never depends on lookup order.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import settings
+from metrics import REGISTRY, Histogram
+from money import CENT, money_sum, to_money
+
+log = logging.getLogger("modesta.promotions")
+
+RULES_EVALUATED = REGISTRY.register(Histogram(
+    "modesta_promotion_rules_evaluated", "Promotion rules evaluated per priced cart",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)))
+
+
+class CartLine:
+    def __init__(self, product_id: int, category: str, unit_price: Decimal, quantity: int):
+        self.product_id = product_id
+        self.category = category
+        self.unit_price = unit_price
+        self.quantity = quantity
+
+
+class Discount:
+    def __init__(self, rule_id: str, label: str, per_product: Dict[int, Decimal]):
+        self.rule_id = rule_id
+        self.label = label
+        self.per_product = per_product
+        self.amount = money_sum(per_product.values())
+
+
+class Pricing:
+    def __init__(self, subtotal: Decimal, discounts: List[Discount], coupon: Optional[str], coupon_applied: bool):
+        self.subtotal = subtotal
+        self.discounts = discounts
+        self.discount_total = money_sum(d.amount for d in discounts)
+        self.total = subtotal - self.discount_total
+        self.coupon = coupon
+        self.coupon_applied = coupon_applied
+
+    def product_discount(self, product_id: int) -> Decimal:
+        return money_sum(d.per_product.get(product_id, Decimal("0.00")) for d in self.discounts)
+
+    def to_dict(self) -> dict:
+        return {
+            "subtotal": str(self.subtotal),
+            "discounts": [{"id": d.rule_id, "label": d.label, "amount": str(d.amount)} for d in self.discounts],
+            "discount_total": str(self.discount_total),
+            "total": str(self.total),
+            "coupon": self.coupon,
+            "coupon_applied": self.coupon_applied,
+        }
+
+
+def _percent_of(amount: Decimal, percent: Decimal) -> Decimal:
+    return (amount * percent / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _parse_time(value) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(str(value))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class Rule(ABC):
+    kind = ""
+    default_priority = 0
+
+    def __init__(self, row: dict, position: int):
+        self.id = str(row.get("id") or f"{self.kind}-{position}")
+        self.label = str(row.get("label") or self.id)
+        self.code = str(row["code"]).strip().upper() if row.get("code") else None
+        self.starts = _parse_time(row.get("starts"))
+        self.ends = _parse_time(row.get("ends"))
+        self.min_subtotal = Decimal(str(row.get("min_subtotal", "0")))
+        self.order = (int(row.get("priority", self.default_priority)), position)
+
+    def active(self, now: datetime, subtotal: Decimal) -> bool:
+        return ((self.starts is None or self.starts <= now) and (self.ends is None or now < self.ends)
+                and subtotal >= self.min_subtotal)
+
+    def skus(self) -> Iterable[int]:
+        return ()
+
+    def categories(self) -> Iterable[str]:
+        return ()
+
+    @abstractmethod
+    def apply(self, lines: Dict[int, CartLine], available: Dict[int, int]) -> Dict[int, Decimal]:
+        """
+        Discount per product id; takes the units it discounts out of `available`.
+        """
+
+
+class PercentRule(Rule):
+    kind = "percent"
+    default_priority = 30
+
+    def __init__(self, row: dict, position: int):
+        super().__init__(row, position)
+        self.percent = Decimal(str(row["percent"]))
+        if not 0 < self.percent <= 100:
+            raise ValueError(f"rule {self.id}: percent must be in (0, 100]")
+        self._skus = frozenset(int(s) for s in row.get("skus", ()))
+        self._categories = frozenset(str(c) for c in row.get("categories", ()))
+
+    def skus(self):
+        return self._skus
+
+    def categories(self):
+        return self._categories
+
+    def apply(self, lines, available):
+        everything = not self._skus and not self._categories
+        result = {}
+        for pid, line in lines.items():
+            units = available[pid]
+            if units and (everything or pid in self._skus or line.category in self._categories):
+                result[pid] = _percent_of(line.unit_price * units, self.percent)
+                available[pid] = 0
+        return result
+
+
+class BuyXGetYRule(Rule):
+    kind = "buy_x_get_y"
+    default_priority = 20
+
+    def __init__(self, row: dict, position: int):
+        super().__init__(row, position)
+        self.sku = int(row["sku"])
+        self.buy = int(row["buy"])
+        self.get = int(row.get("get", 1))
+        self.percent = Decimal(str(row.get("percent", 100)))
+        if self.buy < 1 or self.get < 1 or not 0 < self.percent <= 100:
+            raise ValueError(f"rule {self.id}: needs buy >= 1, get >= 1 and percent in (0, 100]")
+
+    def skus(self):
+        return (self.sku,)
+
+    def apply(self, lines, available):
+        line = lines.get(self.sku)
+        groups = available.get(self.sku, 0) // (self.buy + self.get)
+        if line is None or not groups:
+            return {}
+        available[self.sku] -= groups * (self.buy + self.get)
+        return {self.sku: _percent_of(line.unit_price * groups * self.get, self.percent)}
+
+
+class BundleRule(Rule):
+    kind = "bundle"
+    default_priority = 10
+
+    def __init__(self, row: dict, position: int):
+        super().__init__(row, position)
+        self._skus = tuple(dict.fromkeys(int(s) for s in row["skus"]))
+        self.price = Decimal(str(row["price"])).quantize(CENT, rounding=ROUND_HALF_UP)
+        if len(self._skus) < 2 or self.price < 0:
+            raise ValueError(f"rule {self.id}: a bundle needs at least two SKUs and a price")
+
+    def skus(self):
+        return self._skus
+
+    def apply(self, lines, available):
+        if any(s not in lines for s in self._skus):
+            return {}
+        count = min(available[s] for s in self._skus)
+        full = money_sum(lines[s].unit_price for s in self._skus)
+        saving = full - self.price
+        if not count or saving <= 0:
+            return {}
+        # The saving is spread over the SKUs by price so per-product revenue stays meaningful
+        result, allocated = {}, Decimal("0.00")
+        for s in self._skus[:-1]:
+            share = (saving * lines[s].unit_price / full).quantize(CENT, rounding=ROUND_HALF_UP)
+            result[s] = share * count
+            allocated += share
+        result[self._skus[-1]] = (saving - allocated) * count
+        for s in self._skus:
+            available[s] -= count
+        return result
+
+
+RULE_KINDS = {cls.kind: cls for cls in (PercentRule, BuyXGetYRule, BundleRule)}
+
+
+def compile_rules(rows: List[dict]) -> List[Rule]:
+    rules = []
+    for position, row in enumerate(rows):
+        cls = RULE_KINDS.get(row.get("kind"))
+        if cls is None:
+            raise ValueError(f"rule {row.get('id', position)}: unknown kind {row.get('kind')!r}")
+        try:
+            rules.append(cls(row, position))
+        except (KeyError, TypeError, InvalidOperation) as exc:
+            raise ValueError(f"rule {row.get('id', position)}: {exc!r}")
+    return rules
+
+
+class PromotionSet:
+    """
+    One immutable, indexed version of the rules.
+    """
+    def __init__(self, version: int, rules: List[Rule]):
+        self.version = version
+        self.rules = rules
+        self.by_sku: Dict[int, List[Rule]] = {}
+        self.by_category: Dict[str, List[Rule]] = {}
+        self.by_code: Dict[str, List[Rule]] = {}
+        self.everywhere: List[Rule] = []
+        for rule in rules:
+            if rule.code:
+                self.by_code.setdefault(rule.code, []).append(rule)
+                continue
+            skus, categories = tuple(rule.skus()), tuple(rule.categories())
+            if not skus and not categories:
+                self.everywhere.append(rule)
+            for s in skus:
+                self.by_sku.setdefault(s, []).append(rule)
+            for c in categories:
+                self.by_category.setdefault(c, []).append(rule)
+
+    def candidates(self, lines: Iterable[CartLine], code: Optional[str]) -> List[Rule]:
+        found = {id(r): r for r in self.everywhere}
+        for line in lines:
+            for rule in self.by_sku.get(line.product_id, ()):
+                found[id(rule)] = rule
+            for rule in self.by_category.get(line.category, ()):
+                found[id(rule)] = rule
+        for rule in self.by_code.get(code, ()) if code else ():
+            found[id(rule)] = rule
+        return sorted(found.values(), key=lambda r: r.order)
+
+    def price(self, lines: List[CartLine], code: Optional[str] = None, now: Optional[datetime] = None) -> Pricing:
+        now = now or datetime.now(timezone.utc)
+        code = code.strip().upper() if code else None
+        by_product: Dict[int, CartLine] = {}
+        for line in lines:
+            if line.product_id in by_product:
+                line = CartLine(line.product_id, line.category, line.unit_price,
+                                by_product[line.product_id].quantity + line.quantity)
+            by_product[line.product_id] = line
+        subtotal = money_sum(line.unit_price * line.quantity for line in by_product.values())
+        available = {pid: line.quantity for pid, line in by_product.items()}
+
+        discounts, coupon_applied = [], False
+        candidates = self.candidates(by_product.values(), code)
+        RULES_EVALUATED.observe(len(candidates))
+        for rule in candidates:
+            if not rule.active(now, subtotal):
+                continue
+            per_product = {pid: amount for pid, amount in rule.apply(by_product, available).items() if amount > 0}
+            if per_product:
+                discounts.append(Discount(rule.id, rule.label, per_product))
+                coupon_applied = coupon_applied or rule.code is not None
+        return Pricing(subtotal, discounts, code, coupon_applied)
+
+
+def load_rules(path: str) -> List[Rule]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return compile_rules(data["rules"])
+
+
+class PromotionStore:
+    """
+    Current PromotionSet with hot reload; a broken file keeps the previous rules, a missing one means none.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._set = PromotionSet(1, [])
+        self._mtime: Optional[float] = None
+        self._failed_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def current(self) -> PromotionSet:
+        return self._set
+
+    def reload(self) -> bool:
+        with self._lock:
+            if not os.path.exists(self.path):
+                self._set = PromotionSet(self._set.version + 1, [])
+                self._mtime = None
+                return True
+            mtime = None
+            try:
+                mtime = os.path.getmtime(self.path)
+                rules = load_rules(self.path)
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as exc:
+                self._failed_mtime = mtime
+                log.error("promotions_reload_failed", extra={"fields": {"path": self.path, "error": str(exc)}})
+                return False
+            self._set = PromotionSet(self._set.version + 1, rules)
+            self._mtime = mtime
+        log.info("promotions_reloaded", extra={"fields": {"rules": len(rules), "version": self._set.version}})
+        return True
+
+    def changed_on_disk(self) -> bool:
+        try:
+            return os.path.getmtime(self.path) not in (self._mtime, self._failed_mtime)
+        except OSError:
+            # Deleted since the last load
+            return self._mtime is not None
+
+    async def watch(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if self.changed_on_disk():
+                await loop.run_in_executor(None, self.reload)
+
+
+PROMOTIONS = PromotionStore(settings.PROMOTIONS_PATH)
+
+
+def cart_lines(snapshot, items: Iterable[Tuple[int, int]]) -> List[CartLine]:
+    """
+    CartLines for (product_id, quantity) pairs, priced from the catalog; unknown ids are skipped.
+    """
+    lines = []
+    for product_id, quantity in items:
+        product = snapshot.by_id.get(product_id)
+        if product is not None and quantity > 0:
+            lines.append(CartLine(product.id, product.category, to_money(product.price), quantity))
+    return lines
@@ -0,0 +1,209 @@
+"""
+Token-bucket rate limiting for the API endpoints.
+
+Buckets are keyed by rule and client: the signed-in customer when the session
+cookie verifies, else the client IP, so shoppers behind one carrier NAT don't
+share a bucket once they sign in. They are kept in a bounded LRU, so a flood
+of distinct addresses can't grow memory without limit. With
+MODESTA_RATE_LIMIT_DB set, the buckets live in a small SQLite file instead and
+are shared by every worker on the host; those takes run in the threadpool.
+
+The middleware runs before routing, so an over-limit request is answered
+with 429 before any body parsing, model validation or template work.
+"""
+import itertools
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Pattern
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import cookie_parser
+
+import settings
+from accounts import SESSION_COOKIE, SESSIONS
+from metrics import REGISTRY, Counter
+
+RATE_LIMITED = REGISTRY.register(Counter(
+    "modesta_rate_limited_total", "Requests rejected with 429", ("rule",)))
+
+
+class Rule:
+    def __init__(self, name: str, method: Optional[str], pattern: str, rate: float, burst: int):
+        self.name = name
+        self.method = method
+        self.pattern: Pattern = re.compile(pattern)
+        self.rate = rate  # tokens per second
+        self.burst = burst
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.method is None or self.method == method) and self.pattern.match(path) is not None
+
+
+# First matching rule wins; anything unmatched (pages, static files, /metrics) is not limited
+RULES: List[Rule] = [
+    Rule("checkout", "POST", r"^/api/checkout$", rate=5 / 60, burst=5),
+    Rule("search", None, r"^/api/search", rate=2, burst=10),
+    Rule("api", None, r"^/api/", rate=10, burst=30),
+]
+
+
+class MemoryBuckets:
+    # Cheap and not thread-safe: taken on the event loop
+    blocking = False
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: int, now: float) -> float:
+        """
+        Takes one token. Returns 0 when allowed, else the seconds until a token is available.
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(burst), now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+
+class SqliteBuckets:
+    """
+    Same interface as MemoryBuckets, backed by a SQLite file shared between workers.
+    """
+    # BEGIN IMMEDIATE can wait on another worker's lock: taken in the threadpool
+    blocking = True
+
+    def __init__(self, path: str, max_keys: int):
+        self.path = path
+        self.max_keys = max_keys
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self._writes = itertools.count(1)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute("CREATE TABLE IF NOT EXISTS buckets "
+                                 "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_updated ON buckets(updated)")
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, rate: float, burst: int, now: float) -> float:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = float(burst) if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        if next(self._writes) % 1000 == 0:
+            self._evict(conn)
+        return 0.0 if allowed else (1 - tokens) / rate
+
+    def _evict(self, conn: sqlite3.Connection):
+        # Keeps the most recently used keys, like the in-memory LRU
+        conn.execute(
+            "DELETE FROM buckets WHERE updated < (SELECT updated FROM buckets ORDER BY updated DESC LIMIT 1 OFFSET ?)",
+            (self.max_keys,))
+
+
+def client_ip(scope) -> str:
+    if settings.TRUST_PROXY:
+        forwarded = dict(scope.get("headers") or []).get(b"x-forwarded-for")
+        if forwarded:
+            return forwarded.split(b",")[0].strip().decode("latin-1")
+    return (scope.get("client") or ("unknown", 0))[0]
+
+
+def client_key(scope) -> str:
+    """
+    Who a request counts against: "user:<id>" for a valid session cookie, else the client IP.
+
+    Only the signed session is trusted; the cart and wishlist cookies are unsigned random ids, so
+    keying on them would let a client start a fresh bucket with every request.
+    """
+    cookie = dict(scope.get("headers") or []).get(b"cookie")
+    if cookie:
+        user = SESSIONS.read(cookie_parser(cookie.decode("latin-1")).get(SESSION_COOKIE))
+        if user is not None:
+            return f"user:{user.id}"
+    return client_ip(scope)
+
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI middleware applying RULES per client; rejects with 429 and Retry-After.
+    """
+    def __init__(self, app, rules: List[Rule] = RULES, store=None):
+        self.app = app
+        self.rules = rules
+        self.store = store
+
+    def _store(self):
+        # Created lazily so each worker opens its own SQLite connection after forking
+        if self.store is None:
+            if settings.RATE_LIMIT_DB:
+                self.store = SqliteBuckets(settings.RATE_LIMIT_DB, settings.RATE_LIMIT_MAX_KEYS)
+            else:
+                self.store = MemoryBuckets(settings.RATE_LIMIT_MAX_KEYS)
+        return self.store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        method, path = scope["method"], scope["path"]
+        rule = next((r for r in self.rules if r.matches(method, path)), None)
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        store = self._store()
+        args = (f"{rule.name}:{client_key(scope)}", rule.rate, rule.burst, time.time())
+        try:
+            retry_after = await run_in_threadpool(store.take, *args) if store.blocking else store.take(*args)
+        except sqlite3.Error:
+            # A busy or broken shared store must not take the API down with it
+            retry_after = 0.0
+        if not retry_after:
+            await self.app(scope, receive, send)
+            return
+
+        RATE_LIMITED.inc(rule=rule.name)
+        body = json.dumps({"detail": "Too many requests, please try again shortly"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, round(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
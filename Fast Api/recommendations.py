@@ -0,0 +1,112 @@
+"""
+"Frequently bought together" recommendations.
+
+Co-purchase counts are a sparse symmetric matrix stored as one Counter per
+product. The matrix is built offline from the order history at startup and
+then updated incrementally with every new order. Only the rows touched by an
+order have their top-k recomputed, and requests read the precomputed top-k
+table, so a lookup is a single dict access.
+
+Usage:
+    python recommendations.py [product_id ...]   # print the table built from data/orders.db
+"""
+import sqlite3
+import sys
+import threading
+from collections import Counter
+from heapq import nlargest
+from itertools import combinations
+from typing import Dict, Iterable, List, Tuple
+
+import settings
+
+TOP_K = 4
+
+
+class CoPurchaseModel:
+    def __init__(self, k: int = TOP_K):
+        self.k = k
+        self._counts: Dict[int, Counter] = {}
+        self._top: Dict[int, Tuple[int, ...]] = {}
+        self._lock = threading.Lock()
+        self.baskets = 0
+
+    def add_basket(self, product_ids: Iterable[int]):
+        """
+        Counts every pair of distinct products in one order and refreshes their top-k rows.
+        """
+        ids = sorted(set(product_ids))
+        if len(ids) < 2:
+            return
+        with self._lock:
+            self._count(ids)
+            self._refresh(ids)
+            self.baskets += 1
+
+    def _count(self, ids: List[int]):
+        for a, b in combinations(ids, 2):
+            self._counts.setdefault(a, Counter())[b] += 1
+            self._counts.setdefault(b, Counter())[a] += 1
+
+    def _refresh(self, ids: Iterable[int]):
+        # Each row is replaced with one assignment, so readers see the old or the new tuple
+        for pid in ids:
+            row = self._counts[pid]
+            self._top[pid] = tuple(other for other, _ in nlargest(self.k, row.items(), key=lambda kv: (kv[1], -kv[0])))
+
+    def related(self, product_id: int) -> Tuple[int, ...]:
+        return self._top.get(product_id, ())
+
+    def related_to_many(self, product_ids: Iterable[int], k: int = TOP_K) -> List[int]:
+        """
+        Suggestions for a whole cart: merges the precomputed rows, skipping items already in it.
+        """
+        in_cart = set(product_ids)
+        scores = Counter()
+        for pid in in_cart:
+            for rank, other in enumerate(self._top.get(pid, ())):
+                if other not in in_cart:
+                    scores[other] += self.k - rank
+        return [pid for pid, _ in nlargest(k, scores.items(), key=lambda kv: (kv[1], -kv[0]))]
+
+    def load_order_history(self, db_path: str) -> int:
+        """
+        Offline pass over the order store; items arrive grouped by order.
+        """
+        try:
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        except sqlite3.OperationalError:
+            return 0
+        loaded = 0
+        try:
+            cursor = conn.execute("SELECT order_pk, product_id FROM order_items ORDER BY order_pk")
+            with self._lock:
+                current, basket = None, []
+                for order_pk, product_id in cursor:
+                    if order_pk != current:
+                        self._count(sorted(set(basket)))
+                        current, basket = order_pk, []
+                        loaded += 1
+                    basket.append(product_id)
+                self._count(sorted(set(basket)))
+                # Top-k rows are computed once for the whole history
+                self._refresh(list(self._counts))
+                self.baskets += loaded
+        except sqlite3.OperationalError:
+            # No orders table yet
+            pass
+        finally:
+            conn.close()
+        return loaded
+
+
+RECOMMENDER = CoPurchaseModel()
+
+
+if __name__ == "__main__":
+    model = CoPurchaseModel()
+    orders = model.load_order_history(settings.ORDERS_DB)
+    print(f"{orders} orders, {len(model._top)} products with co-purchases")
+    wanted = [int(a) for a in sys.argv[1:]] or sorted(model._top)
+    for pid in wanted:
+        print(f"  {pid}: {', '.join(map(str, model.related(pid))) or '-'}")
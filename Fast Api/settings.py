@@ -0,0 +1,122 @@
+"""
+Runtime configuration, read once from environment variables.
+"""
+import os
+
+
+def _flag(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Admin endpoints are disabled entirely when no token is configured
+ADMIN_TOKEN = os.environ.get("MODESTA_ADMIN_TOKEN", "")
+
+# Allows `?profile=1` on any page to return a sampled profile instead of the page
+PROFILE_REQUESTS = _flag("MODESTA_PROFILE_REQUESTS")
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("MODESTA_PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_SECONDS = 60
+
+# Structured logs are written as JSON lines; files rotate on size or time, whichever comes first
+LOG_DIR = os.environ.get("MODESTA_LOG_DIR", "logs")
+LOG_LEVEL = os.environ.get("MODESTA_LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = int(os.environ.get("MODESTA_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.environ.get("MODESTA_LOG_ROTATE_WHEN", "midnight")
+LOG_BACKUPS = int(os.environ.get("MODESTA_LOG_BACKUPS", "7"))
+LOG_TO_STDOUT = _flag("MODESTA_LOG_STDOUT", True)
+
+# Catalog source file; it is polled for changes every CATALOG_WATCH_INTERVAL seconds (0 disables)
+CATALOG_PATH = os.environ.get("MODESTA_CATALOG", os.path.join("data", "catalog.json"))
+CATALOG_WATCH_INTERVAL = float(os.environ.get("MODESTA_CATALOG_WATCH_INTERVAL", "2"))
+
+# SQLite catalog store used by catalog_io.py imports; point MODESTA_CATALOG at it to serve from it
+CATALOG_DB = os.environ.get("MODESTA_CATALOG_DB", os.path.join("data", "catalog.db"))
+
+# Memory-mapped columnar snapshot written by catalog_snapshot.py; serve it with MODESTA_CATALOG=data/catalog.snap
+CATALOG_SNAPSHOT = os.environ.get("MODESTA_CATALOG_SNAPSHOT", os.path.join("data", "catalog.snap"))
+
+# Order log and sales rollups (SQLite)
+ORDERS_DB = os.environ.get("MODESTA_ORDERS_DB", os.path.join("data", "orders.db"))
+
+# Server-side carts synced from the browser as deltas (SQLite, shared by workers); idle carts expire
+CARTS_DB = os.environ.get("MODESTA_CARTS_DB", os.path.join("data", "carts.db"))
+CART_TTL_DAYS = float(os.environ.get("MODESTA_CART_TTL_DAYS", "30"))
+CART_MAX_LINES = int(os.environ.get("MODESTA_CART_MAX_LINES", "100"))
+CART_MAX_QUANTITY = int(os.environ.get("MODESTA_CART_MAX_QUANTITY", "99"))
+CART_MAX_OPS = int(os.environ.get("MODESTA_CART_MAX_OPS", "200"))
+
+# Saved-for-later products per visitor, stored as compact bitsets / sorted id arrays (SQLite); idle lists expire
+WISHLISTS_DB = os.environ.get("MODESTA_WISHLISTS_DB", os.path.join("data", "wishlists.db"))
+WISHLIST_TTL_DAYS = float(os.environ.get("MODESTA_WISHLIST_TTL_DAYS", "365"))
+WISHLIST_MAX_ITEMS = int(os.environ.get("MODESTA_WISHLIST_MAX_ITEMS", "500"))
+
+# Customer accounts and saved addresses (SQLite). Passwords are hashed with scrypt on PASSWORD_WORKERS threads;
+# sessions are HMAC-signed cookies signed with SESSION_SECRET, or a key created once in SESSION_SECRET_FILE
+ACCOUNTS_DB = os.environ.get("MODESTA_ACCOUNTS_DB", os.path.join("data", "accounts.db"))
+SESSION_SECRET = os.environ.get("MODESTA_SESSION_SECRET", "")
+SESSION_SECRET_FILE = os.environ.get("MODESTA_SESSION_SECRET_FILE", os.path.join("data", "session.key"))
+SESSION_TTL_DAYS = float(os.environ.get("MODESTA_SESSION_TTL_DAYS", "30"))
+# Each scrypt hash holds 128 * 8 * N bytes (32 MB at the default) while it runs
+PASSWORD_SCRYPT_N = int(os.environ.get("MODESTA_PASSWORD_SCRYPT_N", str(2 ** 15)))
+PASSWORD_WORKERS = int(os.environ.get("MODESTA_PASSWORD_WORKERS", "4"))
+ACCOUNT_MAX_ADDRESSES = int(os.environ.get("MODESTA_ACCOUNT_MAX_ADDRESSES", "10"))
+
+# Order notifications: queued in a SQLite outbox at checkout, sent in batches by a background dispatcher
+NOTIFY_DB = os.environ.get("MODESTA_NOTIFY_DB", os.path.join("data", "notifications.db"))
+NOTIFY_ENABLED = _flag("MODESTA_NOTIFY", True)
+# Transport per channel: "file" (JSON lines under NOTIFY_FILE_DIR, for development and tests), "smtp" (email)
+# or "webhook" (POSTs each batch as JSON to NOTIFY_WEBHOOK_URL, e.g. an SMS gateway)
+NOTIFY_EMAIL_TRANSPORT = os.environ.get("MODESTA_NOTIFY_EMAIL", "file")
+NOTIFY_SMS_TRANSPORT = os.environ.get("MODESTA_NOTIFY_SMS", "file")
+NOTIFY_FILE_DIR = os.environ.get("MODESTA_NOTIFY_FILE_DIR", "outbox")
+NOTIFY_WEBHOOK_URL = os.environ.get("MODESTA_NOTIFY_WEBHOOK_URL", "")
+NOTIFY_WEBHOOK_TOKEN = os.environ.get("MODESTA_NOTIFY_WEBHOOK_TOKEN", "")
+NOTIFY_BATCH_SIZE = int(os.environ.get("MODESTA_NOTIFY_BATCH_SIZE", "100"))
+NOTIFY_INTERVAL = float(os.environ.get("MODESTA_NOTIFY_INTERVAL", "1"))
+# Failed sends are retried after NOTIFY_RETRY_BASE seconds, doubling up to NOTIFY_RETRY_MAX, NOTIFY_MAX_ATTEMPTS times
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("MODESTA_NOTIFY_MAX_ATTEMPTS", "6"))
+NOTIFY_RETRY_BASE = float(os.environ.get("MODESTA_NOTIFY_RETRY_BASE", "30"))
+NOTIFY_RETRY_MAX = float(os.environ.get("MODESTA_NOTIFY_RETRY_MAX", "3600"))
+SMTP_HOST = os.environ.get("MODESTA_SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("MODESTA_SMTP_PORT", "25"))
+SMTP_USER = os.environ.get("MODESTA_SMTP_USER", "")
+SMTP_PASSWORD = os.environ.get("MODESTA_SMTP_PASSWORD", "")
+SMTP_STARTTLS = _flag("MODESTA_SMTP_STARTTLS")
+MAIL_FROM = os.environ.get("MODESTA_MAIL_FROM", "Modesta <orders@modesta.com>")
+
+# Bestseller/trending rankings: counters decay with this half-life (seconds) and are re-ranked every interval
+TRENDING_HALF_LIFE = float(os.environ.get("MODESTA_TRENDING_HALF_LIFE", str(3 * 24 * 3600)))
+TRENDING_REFRESH_INTERVAL = float(os.environ.get("MODESTA_TRENDING_REFRESH_INTERVAL", "30"))
+
+# Token buckets for /api/* per customer or IP; set MODESTA_RATE_LIMIT_DB to share them between workers
+RATE_LIMIT_ENABLED = _flag("MODESTA_RATE_LIMIT", True)
+RATE_LIMIT_DB = os.environ.get("MODESTA_RATE_LIMIT_DB", "")
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("MODESTA_RATE_LIMIT_MAX_KEYS", "100000"))
+# Only behind a reverse proxy that sets X-Forwarded-For; otherwise clients could pick their own key
+TRUST_PROXY = _flag("MODESTA_TRUST_PROXY")
+
+# Prerendered storefront written by static_export.py, served by the app under STATIC_BASE_URL
+STATIC_DIR = os.environ.get("MODESTA_STATIC_DIR", "static_site")
+STATIC_BASE_URL = os.environ.get("MODESTA_STATIC_BASE_URL", "/store/")
+
+# Heavy product content (galleries, size charts, long descriptions): one JSON file per product id
+PRODUCT_DETAILS_DIR = os.environ.get("MODESTA_PRODUCT_DETAILS", os.path.join("data", "products"))
+PRODUCT_DETAILS_CACHE_SIZE = int(os.environ.get("MODESTA_PRODUCT_DETAILS_CACHE", "2048"))
+
+# Display currencies: rates per 1 EGP, reloaded when the file changes (catalog prices stay in EGP)
+FX_RATES_PATH = os.environ.get("MODESTA_FX_RATES", os.path.join("data", "fx_rates.json"))
+
+# Promotion and coupon rules, compiled and indexed on load; reloaded when the file changes
+PROMOTIONS_PATH = os.environ.get("MODESTA_PROMOTIONS", os.path.join("data", "promotions.json"))
+
+# Shipping zones (governorates and city aliases), rates and parcel weights; quotes are cached per zone and cart
+SHIPPING_PATH = os.environ.get("MODESTA_SHIPPING", os.path.join("data", "shipping.json"))
+SHIPPING_QUOTE_CACHE_SIZE = int(os.environ.get("MODESTA_SHIPPING_QUOTE_CACHE", "10000"))
+
+# Self-hosted font and icon subsets from `python assets.py build`; pages use the CDNs until a build exists
+ASSETS_DIR = os.environ.get("MODESTA_ASSETS_DIR", "assets")
+ASSETS_BASE_URL = os.environ.get("MODESTA_ASSETS_BASE_URL", "/assets/")
+# Downloaded font files and icon SVGs are kept here, so rebuilds (and offline builds) don't fetch them again
+ASSET_SOURCES_DIR = os.environ.get("MODESTA_ASSET_SOURCES", "assets_src")
@@ -0,0 +1,213 @@
+"""
+Shipping zones, rates and cached quotes.
+
+data/shipping.json (MODESTA_SHIPPING) maps every governorate, in English and
+Arabic, plus common city names to a delivery zone with a base rate (first
+kg), a per-kg rate for each further started kg, an optional free-shipping
+threshold and a delivery estimate. On load all names are normalized into one
+lookup table, so resolving a governorate is a dict hit and resolving a
+free-text address is a few dict hits (its 1-3 word phrases, last match wins).
+
+A quote depends only on the zone and the cart (product ids and quantities),
+so quotes are cached per (rates version, catalog version, zone, cart
+signature); re-rendering the cart or re-submitting the form doesn't price
+the parcel again.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import settings
+from metrics import REGISTRY, Counter
+from money import money_sum, to_money
+
+log = logging.getLogger("modesta.shipping")
+
+QUOTE_CACHE = REGISTRY.register(Counter(
+    "modesta_shipping_quote_cache_total", "Shipping quotes by cache result", ("result",)))
+
+_ARABIC_FOLD = str.maketrans("أإآةى", "اااهي")
+
+
+def normalize_place(text: str) -> str:
+    text = text.casefold().translate(_ARABIC_FOLD)
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+class Zone:
+    def __init__(self, zone_id: str, row: dict):
+        self.id = zone_id
+        self.label = str(row.get("label", zone_id))
+        self.base = to_money(row["base"])
+        self.per_kg = to_money(row.get("per_kg", "0"))
+        self.free_over = to_money(row["free_over"]) if row.get("free_over") else None
+        self.days = str(row.get("days", ""))
+        self.governorates: Dict[str, str] = dict(row.get("governorates", {}))
+        self.aliases: List[str] = list(row.get("aliases", []))
+
+    def rate(self, weight_kg: float, subtotal: Decimal) -> Decimal:
+        if self.free_over is not None and subtotal >= self.free_over:
+            return Decimal("0.00")
+        extra_kg = max(0, math.ceil(weight_kg) - 1)
+        return self.base + self.per_kg * extra_kg
+
+
+class Quote:
+    def __init__(self, zone: Zone, weight_kg: float, subtotal: Decimal, cost: Decimal):
+        self.zone = zone
+        self.weight_kg = weight_kg
+        self.subtotal = subtotal
+        self.cost = cost
+
+    def to_dict(self) -> dict:
+        return {
+            "zone": self.zone.id,
+            "label": self.zone.label,
+            "weight_kg": round(self.weight_kg, 3),
+            "cost": str(self.cost),
+            "free": self.cost == 0,
+            "free_over": str(self.zone.free_over) if self.zone.free_over is not None else None,
+            "days": self.zone.days,
+        }
+
+
+class ShippingTable:
+    """
+    One loaded version of the zones, with the precomputed place-name lookup.
+    """
+    def __init__(self, version: int, zones: Dict[str, Zone], weights: dict):
+        self.version = version
+        self.zones = zones
+        self.default_weight = float(weights.get("default", 0.5))
+        self.category_weights = {str(c): float(w) for c, w in weights.get("categories", {}).items()}
+        self.product_weights = {int(p): float(w) for p, w in weights.get("products", {}).items()}
+        self.places: Dict[str, Zone] = {}
+        for zone in zones.values():
+            for english, arabic in zone.governorates.items():
+                self.places[normalize_place(english)] = zone
+                self.places[normalize_place(arabic)] = zone
+            for alias in zone.aliases:
+                self.places[normalize_place(alias)] = zone
+
+    def governorates(self) -> List[Tuple[str, str]]:
+        return [(english, arabic) for zone in self.zones.values() for english, arabic in zone.governorates.items()]
+
+    def zone_for(self, governorate: Optional[str] = None, address: Optional[str] = None) -> Optional[Zone]:
+        if governorate:
+            zone = self.places.get(normalize_place(governorate))
+            if zone is not None:
+                return zone
+        if address:
+            words = normalize_place(address).split()
+            # Governorates and cities usually close an address, so scan from the end; longer phrases first
+            for end in range(len(words), 0, -1):
+                for size in (3, 2, 1):
+                    if end - size >= 0:
+                        zone = self.places.get(" ".join(words[end - size:end]))
+                        if zone is not None:
+                            return zone
+        return None
+
+    def weight(self, product) -> float:
+        return self.product_weights.get(product.id, self.category_weights.get(product.category, self.default_weight))
+
+
+def load_table(path: str, version: int) -> ShippingTable:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    zones = {str(zone_id): Zone(str(zone_id), row) for zone_id, row in data["zones"].items()}
+    return ShippingTable(version, zones, data.get("weights_kg", {}))
+
+
+def cart_signature(quantities: Dict[int, int]) -> Tuple[Tuple[int, int], ...]:
+    return tuple(sorted(quantities.items()))
+
+
+class ShippingStore:
+    """
+    Current ShippingTable with hot reload, plus the bounded quote cache.
+    """
+    def __init__(self, path: str, cache_size: int):
+        self.path = path
+        self.cache_size = cache_size
+        self._table = ShippingTable(0, {}, {})
+        self._mtime: Optional[float] = None
+        self._failed_mtime: Optional[float] = None
+        self._cache: "OrderedDict[tuple, Quote]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def current(self) -> ShippingTable:
+        return self._table
+
+    def reload(self) -> bool:
+        with self._lock:
+            mtime = None
+            try:
+                mtime = os.path.getmtime(self.path)
+                table = load_table(self.path, self._table.version + 1)
+            except (OSError, ValueError, KeyError, TypeError, AttributeError, ArithmeticError) as exc:
+                self._failed_mtime = mtime
+                log.error("shipping_reload_failed", extra={"fields": {"path": self.path, "error": str(exc)}})
+                return False
+            self._table = table
+            self._mtime = mtime
+            # Keys carry the table version, so old entries would only age out; drop them now
+            self._cache.clear()
+        log.info("shipping_reloaded", extra={"fields": {"zones": len(table.zones), "places": len(table.places)}})
+        return True
+
+    def changed_on_disk(self) -> bool:
+        try:
+            return os.path.getmtime(self.path) not in (self._mtime, self._failed_mtime)
+        except OSError:
+            return False
+
+    async def watch(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if self.changed_on_disk():
+                await loop.run_in_executor(None, self.reload)
+
+    def quote(self, snapshot, quantities: Dict[int, int], governorate: Optional[str] = None,
+              address: Optional[str] = None) -> Optional[Quote]:
+        """
+        Shipping for a cart of {product_id: quantity} (ids already validated); None if no zone matches.
+        """
+        table = self._table
+        zone = table.zone_for(governorate, address)
+        if zone is None:
+            return None
+        key = (table.version, snapshot.version, zone.id, cart_signature(quantities))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        if cached is not None:
+            QUOTE_CACHE.inc(result="hit")
+            return cached
+
+        QUOTE_CACHE.inc(result="miss")
+        products = [(snapshot.by_id[pid], qty) for pid, qty in quantities.items()]
+        weight = sum(table.weight(p) * qty for p, qty in products)
+        # Free-shipping thresholds use the catalog subtotal, before promotions
+        subtotal = money_sum(to_money(p.price) * qty for p, qty in products)
+        quote = Quote(zone, weight, subtotal, zone.rate(weight, subtotal))
+        with self._lock:
+            self._cache[key] = quote
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return quote
+
+    def quote_many(self, snapshot, requests: Iterable[Tuple[Dict[int, int], Optional[str], Optional[str]]]):
+        return [self.quote(snapshot, quantities, governorate, address) for quantities, governorate, address in requests]
+
+
+SHIPPING = ShippingStore(settings.SHIPPING_PATH, settings.SHIPPING_QUOTE_CACHE_SIZE)
@@ -0,0 +1,223 @@
+"""
+Prerendered static storefront.
+
+Renders the store page for "All" and every category, a page per product
+(with its gallery, size chart and long description) and a JSON catalog for
+the client-side cart into MODESTA_STATIC_DIR, each with a gzip-compressed
+twin (.gz) for servers that serve precompressed files (nginx `gzip_static
+on`, or the app's own /store mount).
+
+Builds are incremental: a manifest keeps a hash per category and per
+product, and only pages whose inputs changed are written again. Changing a
+template or the set of categories rebuilds everything.
+
+Usage:
+    python static_export.py build [--out static_site] [--base /store/] [--force]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+from decimal import Decimal
+from typing import Callable, Dict, Iterable
+from urllib.parse import quote
+
+from fastapi.staticfiles import StaticFiles
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from starlette.responses import FileResponse
+
+import settings
+from catalog import CatalogSnapshot, Product, load_products, product_to_dict
+from i18n import translator
+from money import BASE_CURRENCY, CURRENCIES, FxRates, PriceTable
+from product_details import DETAILS
+from shipping import load_table
+
+TEMPLATE_DIR = "templates"
+TEMPLATES = ("index.html", "product.html", "_styles.html", "_cart_sync.html", "_wishlist.html")
+ASSETS_SUBDIR = "assets"
+MANIFEST = "manifest.json"
+CATALOG_JSON_FIELDS = ("id", "name", "name_ar", "price", "category", "image_url", "badge")
+
+
+def slugify(category: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", category.lower()).strip("-")
+    # Non-latin names (e.g. Arabic) get a stable hash instead
+    return slug or hashlib.sha1(category.encode("utf-8")).hexdigest()[:10]
+
+
+def dynamic_urls() -> Dict[str, Callable]:
+    return {
+        "category_url": lambda category: "/?category=" + quote(category),
+        "product_url": lambda product: f"/product/{product.id}",
+    }
+
+
+def static_urls(base: str) -> Dict[str, Callable]:
+    return {
+        "category_url": lambda category: base if category == "All" else f"{base}category/{slugify(category)}/",
+        "product_url": lambda product: f"{base}product/{product.id}/",
+    }
+
+
+class CatalogBadges:
+    """
+    Static pages show the badges typed into the catalog; live rankings need the app.
+    """
+    @staticmethod
+    def badge_for(product: Product):
+        return product.badge
+
+
+def _digest(data) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _write(out_dir: str, relative: str, data: bytes, compress: bool = True):
+    """
+    Writes the file and its .gz twin; each is renamed into place so readers never see a partial page.
+    """
+    path = os.path.join(out_dir, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    files = [(path, data)]
+    if compress:
+        files.append((path + ".gz", gzip.compress(data, 9, mtime=0)))
+    for target, payload in files:
+        with open(target + ".tmp", "wb") as f:
+            f.write(payload)
+        os.replace(target + ".tmp", target)
+
+
+def _remove(out_dir: str, relative_dir: str):
+    shutil.rmtree(os.path.join(out_dir, relative_dir), ignore_errors=True)
+
+
+def build(out_dir: str = settings.STATIC_DIR, base: str = settings.STATIC_BASE_URL,
+          catalog_path: str = settings.CATALOG_PATH, force: bool = False) -> dict:
+    """
+    Renders everything that changed since the last build; returns what was written.
+    """
+    snapshot = CatalogSnapshot(0, load_products(catalog_path))
+    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(["html"]))
+    env.globals.update(static_urls(base), static=True, rankings=CatalogBadges(), related={}, current_sort="featured",
+                       wishlist=(), user=None)
+    # Static pages are English and priced in EGP; currency and language switching need the app
+    prices = PriceTable(FxRates(0, {BASE_CURRENCY: Decimal(1)}), BASE_CURRENCY, "en")
+    env.globals.update(locale="en", t=translator("en"), prices=prices, currencies=[],
+                       money_js={"rate": "1", "locale": "en", "pattern": CURRENCIES[BASE_CURRENCY]["en"]})
+    governorates = load_table(settings.SHIPPING_PATH, 0).governorates()
+    env.globals.update(governorates=governorates)
+    from assets import AssetManifest  # imports this module for PrecompressedStaticFiles
+    assets = AssetManifest(settings.ASSETS_DIR, base + ASSETS_SUBDIR + "/")
+    if assets.load():
+        _copy_assets(assets, out_dir)
+    env.globals.update(assets=assets, icon=assets.icon)
+
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    templates_hash = hashlib.sha256()
+    for name in TEMPLATES:
+        with open(os.path.join(TEMPLATE_DIR, name), "rb") as f:
+            templates_hash.update(f.read())
+    layout = _digest([templates_hash.hexdigest(), snapshot.categories, base, governorates, assets.digest])
+    if manifest.get("layout") != layout:
+        force = True
+    old_categories: Dict[str, str] = {} if force else manifest.get("categories", {})
+    old_products: Dict[str, str] = {} if force else manifest.get("products", {})
+
+    details = {p.id: DETAILS.get(p) for p in snapshot.products}
+    product_hashes = {str(p.id): _digest([product_to_dict(p), details[p.id].to_dict()]) for p in snapshot.products}
+    category_hashes = {c: _digest([product_hashes[str(p.id)] for p in ps]) for c, ps in snapshot.by_category.items()}
+    stats = {"categories": 0, "products": 0, "removed": 0}
+
+    index = env.get_template("index.html")
+    for category, digest in category_hashes.items():
+        if old_categories.get(category) == digest:
+            continue
+        html = index.render(products=snapshot.by_category[category], categories=snapshot.categories,
+                            current_category=category)
+        _write(out_dir, f"category/{slugify(category)}/index.html", html.encode("utf-8"))
+        stats["categories"] += 1
+
+    page = env.get_template("product.html")
+    for p in snapshot.products:
+        if old_products.get(str(p.id)) == product_hashes[str(p.id)]:
+            continue
+        html = page.render(product=p, details=details[p.id], badge=p.badge)
+        _write(out_dir, f"product/{p.id}/index.html", html.encode("utf-8"))
+        stats["products"] += 1
+
+    for category in set(manifest.get("categories", {})) - set(category_hashes):
+        _remove(out_dir, f"category/{slugify(category)}")
+        stats["removed"] += 1
+    for product_id in set(manifest.get("products", {})) - set(product_hashes):
+        _remove(out_dir, f"product/{product_id}")
+        stats["removed"] += 1
+
+    if stats["categories"] or stats["removed"] or not os.path.exists(os.path.join(out_dir, "index.html")):
+        html = index.render(products=snapshot.products, categories=snapshot.categories, current_category="All")
+        _write(out_dir, "index.html", html.encode("utf-8"))
+        rows = [{field: getattr(p, field) for field in CATALOG_JSON_FIELDS} for p in snapshot.products]
+        _write(out_dir, "catalog.json", json.dumps({"products": rows}, ensure_ascii=False).encode("utf-8"))
+
+    manifest = {"layout": layout, "categories": category_hashes, "products": product_hashes}
+    _write(out_dir, MANIFEST, json.dumps(manifest, indent=1).encode("utf-8"), compress=False)
+    return stats
+
+
+def _copy_assets(assets, out_dir: str):
+    """
+    Copies the font and icon build next to the pages; only the current hashed files are kept.
+    """
+    target = os.path.join(out_dir, ASSETS_SUBDIR)
+    os.makedirs(target, exist_ok=True)
+    keep = set()
+    for filename in assets.files.values():
+        for name in (filename, filename + ".gz"):
+            source = os.path.join(assets.directory, name)
+            if os.path.exists(source):
+                keep.add(name)
+                if not os.path.exists(os.path.join(target, name)):
+                    shutil.copyfile(source, os.path.join(target, name))
+    for name in set(os.listdir(target)) - keep:
+        os.remove(os.path.join(target, name))
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that answers with the prebuilt .gz file when the client accepts gzip.
+    """
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        accepts = dict(scope.get("headers") or []).get(b"accept-encoding", b"")
+        if isinstance(response, FileResponse) and b"gzip" in accepts and os.path.exists(response.path + ".gz"):
+            return FileResponse(response.path + ".gz", media_type=response.media_type,
+                                headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+        return response
+
+
+def main(argv: Iterable[str] = None):
+    parser = argparse.ArgumentParser(description="Prerender the storefront to static files")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build")
+    build_cmd.add_argument("--out", default=settings.STATIC_DIR)
+    build_cmd.add_argument("--base", default=settings.STATIC_BASE_URL, help="URL path the site is served under")
+    build_cmd.add_argument("--catalog", default=settings.CATALOG_PATH)
+    build_cmd.add_argument("--force", action="store_true", help="rebuild every page")
+    args = parser.parse_args(argv)
+
+    stats = build(args.out, args.base, args.catalog, args.force)
+    print(f"Rendered {stats['categories']} category pages and {stats['products']} product pages "
+          f"({stats['removed']} removed) into {args.out}")
+
+
+if __name__ == "__main__":
+    main()
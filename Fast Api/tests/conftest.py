@@ -0,0 +1,8 @@
+"""
+The app modules import each other as top-level modules (run from "Fast Api"), so the tests do the same.
+Every store under test is built on a tmp_path database; the module-level stores are never opened.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+import pytest
+
+import accounts
+from accounts import SessionSigner, hash_password, needs_rehash, verify_password
+
+# Cheap scrypt cost for tests; the format is the same as production hashes
+N = 2 ** 10
+
+
+def test_password_hashes_verify():
+    stored = hash_password("longenough1", n=N)
+    assert stored.startswith(f"scrypt${N}$")
+    assert verify_password("longenough1", stored)
+    assert not verify_password("longenough2", stored)
+    assert hash_password("longenough1", n=N) != stored  # salted
+
+
+@pytest.mark.parametrize("stored", ["", "plain", "bcrypt$1$2$3$4$5", "scrypt$x$8$1$salt$digest"])
+def test_unknown_or_malformed_hashes_never_verify(stored):
+    assert not verify_password("longenough1", stored)
+
+
+def test_weaker_hashes_need_a_rehash():
+    assert needs_rehash(hash_password("longenough1", n=N))
+
+
+@pytest.fixture
+def signer(monkeypatch):
+    monkeypatch.setattr(accounts.settings, "SESSION_SECRET", "test-secret")
+    return SessionSigner(ttl_seconds=3600)
+
+
+def test_session_round_trip(signer):
+    user = signer.read(signer.issue(7, "Sara Ali"))
+    assert (user.id, user.name) == (7, "Sara Ali")
+
+
+def test_session_names_may_be_non_ascii(signer):
+    assert signer.read(signer.issue(7, "سارة")).name == "سارة"
+
+
+def test_tampered_sessions_are_rejected(signer):
+    token = signer.issue(7, "Sara Ali")
+    payload, signature = token.rsplit(".", 1)
+    forged = accounts._b64(b'{"u":1,"n":"Admin","e":9999999999}')
+    assert signer.read(f"{forged}.{signature}") is None
+    assert signer.read(f"{payload}.{signature[:-2]}xx") is None
+    assert signer.read(f"{payload}.é") is None
+    assert signer.read(None) is None and signer.read("no-dot") is None
+
+
+def test_sessions_signed_with_another_key_are_rejected(signer, monkeypatch):
+    token = signer.issue(7, "Sara Ali")
+    monkeypatch.setattr(accounts.settings, "SESSION_SECRET", "rotated")
+    assert SessionSigner(ttl_seconds=3600).read(token) is None
+
+
+def test_expired_sessions_are_rejected(monkeypatch):
+    monkeypatch.setattr(accounts.settings, "SESSION_SECRET", "test-secret")
+    signer = SessionSigner(ttl_seconds=-1)
+    assert signer.read(signer.issue(7, "Sara Ali")) is None
+
+
+def test_a_key_file_is_created_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(accounts.settings, "SESSION_SECRET", "")
+    monkeypatch.setattr(accounts.settings, "SESSION_SECRET_FILE", str(tmp_path / "session.key"))
+    token = SessionSigner(ttl_seconds=3600).issue(7, "Sara Ali")
+    # Another worker reads the same key
+    assert SessionSigner(ttl_seconds=3600).read(token).id == 7
+
+
+def test_unknown_emails_hash_the_dummy_off_the_event_loop(tmp_path, monkeypatch):
+    threads = []
+
+    def dummy_hash():
+        threads.append(threading.current_thread().name)
+        return hash_password("dummy-password", n=N)
+
+    monkeypatch.setattr(accounts, "ACCOUNTS", accounts.AccountStore(str(tmp_path / "accounts.db"), max_addresses=3))
+    monkeypatch.setattr(accounts, "_dummy_hash", dummy_hash)
+    assert asyncio.run(accounts.login("nobody@example.com", "longenough1")) is None
+    assert len(threads) == 1 and threads[0].startswith("password-hash")
@@ -0,0 +1,55 @@
+import gzip
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from assets import IMMUTABLE, AssetManifest, ImmutableStaticFiles, icon_symbol, used_icons, write_asset
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 512 512"><path d="M0 0h512v512z"/></svg>'
+
+
+def test_icons_are_found_in_markup_and_code(tmp_path):
+    page = tmp_path / "page.html"
+    page.write_text('<i class="fas fa-heart fa-spin"></i> {{ icon("truck") }} <i class="fa-2x fa-star"></i>')
+    script = tmp_path / "app.py"
+    script.write_text("put_html(icon('heart'))")
+    assert used_icons([str(page), str(script)]) == ["heart", "star", "truck"]
+
+
+def test_assets_get_content_hashed_names(tmp_path):
+    name = write_asset(str(tmp_path), "fonts.css", b"body{}", compress=True)
+    assert name.startswith("fonts.") and name.endswith(".css") and len(name) == len("fonts..css") + 12
+    assert write_asset(str(tmp_path), "fonts.css", b"body{}") == name
+    assert write_asset(str(tmp_path), "fonts.css", b"p{}") != name
+    assert gzip.decompress((tmp_path / (name + ".gz")).read_bytes()) == b"body{}"
+
+
+def test_icon_symbols_keep_the_paths_and_view_box():
+    assert icon_symbol("heart", SVG) == '<symbol id="fa-heart" viewBox="0 0 512 512"><path d="M0 0h512v512z"/></symbol>'
+
+
+def test_icons_fall_back_to_the_icon_font_until_built(tmp_path):
+    manifest = AssetManifest(str(tmp_path), "/assets/")
+    assert not manifest.load() and not manifest.built
+    assert manifest.icon("heart", "fa-lg") == '<i class="fas fa-heart fa-lg"></i>'
+
+    (tmp_path / "manifest.json").write_text(json.dumps({"files": {"icons.svg": "icons.0123456789ab.svg"},
+                                                        "icons": ["heart"]}))
+    assert manifest.load() and manifest.built and manifest.digest
+    assert manifest.icon("heart", "fa-lg", style='color:"red"') == (
+        '<svg class="icon icon-lg" aria-hidden="true" style="color:&#34;red&#34;">'
+        '<use href="/assets/icons.0123456789ab.svg#fa-heart"></use></svg>')
+    # Icons missing from the build still render through the CDN font
+    assert manifest.icon("star") == '<i class="fas fa-star"></i>'
+
+
+def test_hashed_files_are_served_as_immutable(tmp_path):
+    (tmp_path / "fonts.0123456789ab.css").write_text("body{}")
+    (tmp_path / "manifest.json").write_text("{}")
+    app = FastAPI()
+    app.mount("/assets", ImmutableStaticFiles(directory=str(tmp_path)))
+    client = TestClient(app)
+    assert client.get("/assets/fonts.0123456789ab.css").headers["cache-control"] == IMMUTABLE
+    assert "immutable" not in client.get("/assets/manifest.json").headers.get("cache-control", "")
+    assert client.get("/assets/missing.0123456789ab.css").status_code == 404
@@ -0,0 +1,63 @@
+import pytest
+
+from carts import CartError, CartStore, parse_ops
+
+
+@pytest.fixture
+def carts(tmp_path):
+    return CartStore(str(tmp_path / "carts.db"), max_lines=3, max_quantity=10, ttl_seconds=3600)
+
+
+def test_parse_ops():
+    assert parse_ops([["a", "12", 1], ["s", 3, "2"], ["r", 7]], max_ops=10) == [("a", 12, 1), ("s", 3, 2), ("r", 7, 0)]
+
+
+@pytest.mark.parametrize("raw", [[["x", 1, 1]], [["a", 1, 0]], [["s", 1, -1]], [["a", 1]], [["a", "one", 1]], ["a"]])
+def test_parse_ops_rejects_malformed_entries(raw):
+    with pytest.raises(CartError):
+        parse_ops(raw, max_ops=10)
+
+
+def test_parse_ops_caps_the_batch():
+    with pytest.raises(CartError):
+        parse_ops([["a", i, 1] for i in range(4)], max_ops=3)
+
+
+def test_current_tab_is_not_rebased(carts):
+    state, rebased = carts.apply("c1", 0, [("a", 12, 1), ("a", 3, 2)])
+    assert (state.version, state.items, rebased) == (1, [(12, 1), (3, 2)], False)
+    state, rebased = carts.apply("c1", 1, [("s", 12, 4), ("r", 3, 0)])
+    assert (state.version, state.items, rebased) == (2, [(12, 4)], False)
+
+
+def test_stale_tab_is_merged_on_top(carts):
+    carts.apply("c1", 0, [("a", 12, 1), ("a", 5, 1)])
+    # Both tabs saw version 1; the second one's batch still lands
+    carts.apply("c1", 1, [("a", 12, 2), ("s", 5, 3)])
+    state, rebased = carts.apply("c1", 1, [("a", 12, 1), ("s", 5, 1), ("a", 8, 1)])
+    assert rebased
+    # Adds commute (1 + 2 + 1); the set from the later batch wins
+    assert state.quantities() == {12: 4, 5: 1, 8: 1}
+    assert state.version == 3
+
+
+def test_quantities_are_capped_and_zero_removes(carts):
+    state, _ = carts.apply("c1", 0, [("a", 12, 50), ("a", 3, 1)])
+    assert state.quantities() == {12: 10, 3: 1}
+    state, _ = carts.apply("c1", 1, [("a", 3, -1)])
+    assert state.quantities() == {12: 10}
+
+
+def test_line_limit_rolls_the_whole_batch_back(carts):
+    carts.apply("c1", 0, [("a", 1, 1), ("a", 2, 1), ("a", 3, 1)])
+    with pytest.raises(CartError):
+        carts.apply("c1", 1, [("s", 1, 5), ("a", 4, 1)])
+    state = carts.state("c1")
+    assert (state.version, state.quantities()) == (1, {1: 1, 2: 1, 3: 1})
+
+
+def test_clear_bumps_the_version(carts):
+    carts.apply("c1", 0, [("a", 1, 1)])
+    carts.clear("c1")
+    state = carts.state("c1")
+    assert (state.version, state.items) == (2, [])
@@ -0,0 +1,43 @@
+import io
+
+import pytest
+
+from catalog_io import RowError, import_feed, validate_row
+
+ROW = {"id": "12", "name": " Underscarves ", "name_ar": "", "price": "105", "category": "Accessories",
+       "image_url": "", "badge": "", "description": "Cotton"}
+
+
+def test_valid_row():
+    assert validate_row(ROW) == (12, "Underscarves", "", 105.0, "Accessories", "", None, "Cotton")
+
+
+@pytest.mark.parametrize("change, message", [
+    ({"id": "twelve"}, "id is not an integer"),
+    ({"id": "inf"}, "id is not an integer"),
+    ({"id": "0"}, "id must be positive"),
+    ({"name": "  "}, "missing name"),
+    ({"category": None}, "missing category"),
+    ({"price": "cheap"}, "price is not a number"),
+    ({"price": "-1"}, "price must not be negative"),
+    ({"price": "nan"}, "price must be a finite number"),
+    ({"price": "inf"}, "price must be a finite number"),
+    ({"price": float("-inf")}, "price must be a finite number"),
+])
+def test_invalid_rows(change, message):
+    with pytest.raises(RowError, match=message):
+        validate_row({**ROW, **change})
+
+
+def test_non_objects_are_rejected():
+    with pytest.raises(RowError):
+        validate_row(["12", "Underscarves"])
+
+
+def test_import_skips_and_reports_bad_rows(tmp_path):
+    feed = io.StringIO('{"id": 1, "name": "Abaya", "price": 450, "category": "Abayas"}\n'
+                       '{"id": 2, "name": "Khimar", "price": NaN, "category": "Khimars"}\n'
+                       'not json\n')
+    stats = import_feed(feed, "jsonl", str(tmp_path / "catalog.db"))
+    assert (stats["rows"], stats["imported"], stats["rejected"]) == (3, 1, 2)
+    assert [e["line"] for e in stats["errors"]] == [2, 3]
@@ -0,0 +1,86 @@
+import json
+import logging
+import sys
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import logs
+from logs import (JsonFormatter, RequestContextMiddleware, SizeAndTimeRotatingFileHandler, order_log, setup_logging,
+                  shutdown_logging)
+
+
+def record(msg="order_created", **extra):
+    record = logging.LogRecord("modesta.orders", logging.INFO, __file__, 1, msg, (), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_lines_carry_the_request_id_and_fields():
+    entry = json.loads(JsonFormatter().format(record(request_id="abc", fields={"order_id": "MOD-1", "total": 450})))
+    assert entry["msg"] == "order_created" and entry["logger"] == "modesta.orders" and entry["level"] == "INFO"
+    assert (entry["request_id"], entry["order_id"], entry["total"]) == ("abc", "MOD-1", 450)
+    assert entry["ts"].endswith("+00:00")
+
+
+def test_exceptions_are_kept_in_the_entry():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        entry = json.loads(JsonFormatter().format(record(exc_info=sys.exc_info())))
+    assert "ValueError: boom" in entry["exc"]
+
+
+def test_size_rollovers_never_overwrite_earlier_files(tmp_path):
+    handler = SizeAndTimeRotatingFileHandler(str(tmp_path / "modesta.log"), max_bytes=200, when="D", backupCount=0)
+    handler.setFormatter(JsonFormatter())
+    for i in range(20):
+        handler.emit(record(fields={"i": i}))
+    handler.close()
+    files = sorted(p.name for p in tmp_path.iterdir())
+    assert len(files) > 2 and "modesta.log" in files
+    assert all(p.stat().st_size <= 200 for p in tmp_path.iterdir())
+    lines = [json.loads(line) for p in tmp_path.iterdir() for line in p.read_text().splitlines()]
+    assert sorted(entry["i"] for entry in lines) == list(range(20))
+
+
+@pytest.fixture
+def log_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(logs.settings, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(logs.settings, "LOG_TO_STDOUT", False)
+    monkeypatch.setattr(logs.settings, "LOG_LEVEL", "INFO")
+    setup_logging()
+    yield tmp_path
+    shutdown_logging()
+    root = logging.getLogger("modesta")
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.propagate = True
+
+
+def entries(log_dir):
+    shutdown_logging()  # flushes the queue
+    return [json.loads(line) for line in (log_dir / "modesta.log").read_text().splitlines()]
+
+
+def test_requests_are_tagged_and_access_logged(log_dir):
+    app = FastAPI()
+    app.add_middleware(RequestContextMiddleware)
+
+    @app.post("/order")
+    async def order():
+        order_log.info("order_created", extra={"fields": {"order_id": "MOD-1"}})
+        return {"request_id": logs.request_id.get()}
+
+    client = TestClient(app)
+    response = client.post("/order")
+    rid = response.headers["x-request-id"]
+    assert response.json() == {"request_id": rid}
+    assert client.post("/order", headers={"X-Request-ID": "from-proxy"}).headers["x-request-id"] == "from-proxy"
+
+    created, access, *_ = entries(log_dir)
+    assert (created["msg"], created["request_id"], created["order_id"]) == ("order_created", rid, "MOD-1")
+    assert (access["logger"], access["request_id"], access["path"], access["status"]) == (
+        "modesta.access", rid, "/order", 200)
+    assert logs.request_id.get() is None
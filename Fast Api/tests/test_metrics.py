@@ -0,0 +1,71 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import metrics
+from metrics import Counter, Gauge, Histogram, InstrumentedTemplates, MetricsMiddleware, Registry
+
+
+def test_counters_and_gauges_render_per_label_set():
+    registry = Registry()
+    orders = registry.register(Counter("orders_total", "Orders", ("status",)))
+    in_flight = registry.register(Gauge("in_flight", "Busy"))
+    orders.inc(status="ok")
+    orders.inc(2, status="ok")
+    orders.inc(status='say "hi"\n')
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+    assert registry.render().splitlines() == [
+        "# HELP orders_total Orders",
+        "# TYPE orders_total counter",
+        "orders_total{status=\"ok\"} 3",
+        "orders_total{status=\"say \\\"hi\\\"\\n\"} 1",
+        "# HELP in_flight Busy",
+        "# TYPE in_flight gauge",
+        "in_flight 1",
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.render()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 3.65",
+        "latency_seconds_count 4",
+    ]
+
+
+def count(histogram, *key):
+    state = histogram._values.get(key)
+    return sum(state[:-1]) if state else 0
+
+
+def test_middleware_labels_requests_by_route_template(tmp_path):
+    (tmp_path / "page.html").write_text("<p>{{ product_id }}</p>")
+    templates = InstrumentedTemplates(directory=str(tmp_path))
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics-test/{product_id}")
+    async def page(request: Request, product_id: int):
+        return templates.TemplateResponse(request, "page.html", {"product_id": product_id})
+
+    route = "/metrics-test/{product_id}"
+    before = metrics.REQUESTS._values.get(("GET", route, 200), 0)
+    renders = count(metrics.RENDER_TIME, "page.html")
+    client = TestClient(app)
+    assert client.get("/metrics-test/1").text == "<p>1</p>"
+    assert client.get("/metrics-test/2").status_code == 200
+    assert client.get("/no-such-page").status_code == 404
+
+    # Ids in the path don't create new series
+    assert metrics.REQUESTS._values[("GET", route, 200)] - before == 2
+    assert ("GET", "/metrics-test/1", 200) not in metrics.REQUESTS._values
+    assert metrics.REQUESTS._values.get(("GET", "unmatched", 404))
+    assert count(metrics.RENDER_TIME, "page.html") - renders == 2
+    assert count(metrics.RESPONSE_SIZE, "GET", route) >= 2
+    assert metrics.IN_FLIGHT._values[()] == 0
@@ -0,0 +1,117 @@
+import json
+import os
+from decimal import Decimal
+
+import pytest
+
+from catalog import CatalogSnapshot, Product
+from money import FxRates, FxStore, PriceTables, format_money, load_rates, money_sum, to_money
+
+RATES = FxRates(1, {"EGP": Decimal(1), "USD": Decimal("0.0206"), "SAR": Decimal("0.0772")})
+
+
+def product(id, price):
+    return Product(id, f"Product {id}", "", price, "Abayas", "")
+
+
+def write_rates(path, rates, base="EGP"):
+    path.write_text(json.dumps({"base": base, "updated": "2026-10-19", "rates": rates}))
+
+
+def test_to_money_is_exact_and_rounds_half_up():
+    assert to_money(520.1) == Decimal("520.10")
+    assert to_money(0.1) + to_money(0.2) == Decimal("0.30")
+    assert to_money("2.675") == Decimal("2.68")
+    assert to_money(Decimal("2.665")) == Decimal("2.67")
+    assert money_sum([]) == Decimal("0.00")
+
+
+def test_format_money():
+    assert format_money(Decimal("1234.50")) == "1,234.50 EGP"
+    assert format_money(Decimal("450.00")) == "450 EGP"
+    assert format_money(Decimal("9.27"), "USD") == "$9.27"
+    assert format_money(Decimal("1234.50"), "EGP", "ar") == "١٬٢٣٤٫٥٠ ج.م"
+
+
+def test_conversion_rounds_to_the_cent():
+    # 450 * 0.0206 = 9.27; 333.33 * 0.0206 = 6.866598
+    assert RATES.convert(Decimal("450.00"), "USD") == Decimal("9.27")
+    assert RATES.convert(Decimal("333.33"), "USD") == Decimal("6.87")
+    assert RATES.convert(Decimal("333.33"), "EGP") == Decimal("333.33")
+
+
+def test_load_rates_skips_unknown_currencies(tmp_path):
+    path = tmp_path / "fx.json"
+    write_rates(path, {"USD": "0.0206", "XYZ": "3"})
+    rates, updated = load_rates(str(path))
+    assert rates == {"EGP": Decimal(1), "USD": Decimal("0.0206")}
+    assert updated == "2026-10-19"
+
+
+@pytest.mark.parametrize("rates, base", [({"USD": "0"}, "EGP"), ({"USD": "-1"}, "EGP"), ({"USD": "abc"}, "EGP"),
+                                         ({"USD": "0.0206"}, "USD")])
+def test_load_rates_rejects_bad_files(tmp_path, rates, base):
+    path = tmp_path / "fx.json"
+    write_rates(path, rates, base)
+    with pytest.raises(ValueError):
+        load_rates(str(path))
+
+
+def test_a_broken_file_keeps_the_previous_rates(tmp_path):
+    path = tmp_path / "fx.json"
+    write_rates(path, {"USD": "0.0206"})
+    fx = FxStore(str(path))
+    assert fx.reload() and fx.current().version == 2
+    path.write_text("{not json")
+    os.utime(path, (1, 1))
+    assert fx.changed_on_disk()
+    assert not fx.reload()
+    assert fx.current().rates["USD"] == Decimal("0.0206")
+    assert not fx.changed_on_disk()  # not retried on every poll
+
+
+class FixedRates:
+    def __init__(self, rates):
+        self.rates = rates
+
+    def current(self):
+        return self.rates
+
+
+class UnreadSnapshot:
+    """
+    A catalog whose product list must never be walked (like a large .snap).
+    """
+    version = 1
+
+    @property
+    def products(self):
+        raise AssertionError("the whole catalog was read")
+
+
+def test_tables_format_only_the_products_shown():
+    fx = FixedRates(RATES)
+    table = PriceTables(fx).get(UnreadSnapshot(), "USD", "en")
+    assert table.label(product(1, 450)) == "$9.27"
+    assert table.labels == {1: "$9.27"}
+    assert table.amount(product(2, "333.33")) == Decimal("6.87")
+
+
+def test_tables_are_reused_until_the_catalog_or_rates_change():
+    fx = FixedRates(RATES)
+    prices = PriceTables(fx)
+    snapshot = CatalogSnapshot(1, [product(1, 450)])
+    table = prices.get(snapshot, "USD", "en")
+    assert prices.get(snapshot, "USD", "en") is table
+    assert prices.get(snapshot, "USD", "ar") is not table
+
+    fx.rates = FxRates(2, {"EGP": Decimal(1), "USD": Decimal("0.03")})
+    assert prices.get(snapshot, "USD", "en").label(product(1, 450)) == "$13.50"
+    changed = CatalogSnapshot(2, [product(1, 500)])
+    assert prices.get(changed, "USD", "en").label(changed.by_id[1]) == "$15"
+
+
+def test_unknown_currencies_fall_back_to_egp():
+    table = PriceTables(FixedRates(RATES)).get(CatalogSnapshot(1, []), "AED", "en")
+    assert table.currency == "EGP"
+    assert table.label(product(1, 450)) == "450 EGP"
@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+
+import pytest
+
+import notifications
+from notifications import FAILED, PENDING, SENT, Failure, FileTransport, Outbox, SmtpTransport, order_notifications
+
+
+class Recording:
+    """
+    Transport that answers from a script: one list of results (or an exception) per call.
+    """
+    def __init__(self, *script):
+        self.script = list(script)
+        self.batches = []
+
+    def send_batch(self, messages):
+        self.batches.append([m.recipient for m in messages])
+        step = self.script.pop(0) if self.script else None
+        if isinstance(step, Exception):
+            raise step
+        return step or [None] * len(messages)
+
+
+def rows(outbox):
+    return outbox._conn().execute("SELECT recipient, status, attempts, last_error FROM outbox ORDER BY id").fetchall()
+
+
+def make_due(outbox):
+    outbox._conn().execute("UPDATE outbox SET next_attempt_at = 0")
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "notifications.db")
+
+
+def test_repeated_dedupe_keys_are_queued_once(db):
+    outbox = Outbox(db, transports={})
+    assert outbox.enqueue_many(order_notifications("MOD-A", "Sara", "0100", "sara@example.com", "450.00")) == 2
+    assert outbox.enqueue_many(order_notifications("MOD-A", "Sara", "0100", "sara@example.com", "450.00")) == 0
+    assert not outbox.enqueue("sms", "0100", "again", dedupe_key="MOD-A:confirmed:sms")
+    # Another order from the same customer is a different message
+    assert outbox.enqueue_many(order_notifications("MOD-B", "Sara", "0100", None, "90.00")) == 1
+    assert len(rows(outbox)) == 3
+
+
+def test_one_transport_call_per_provider(db):
+    sms, email = Recording(), Recording()
+    outbox = Outbox(db, transports={"sms": sms, "email": email}, batch_size=10)
+    outbox.enqueue_many([("sms", "0100", "", "a", "k1"), ("email", "a@x.io", "s", "b", "k2"),
+                         ("sms", "0101", "", "c", "k3")])
+    assert outbox.drain() == 3
+    assert sms.batches == [["0100", "0101"]] and email.batches == [["a@x.io"]]
+    assert {status for _, status, _, _ in rows(outbox)} == {SENT}
+
+
+def test_file_transport_writes_json_lines(db, tmp_path):
+    outbox = Outbox(db, transports={"sms": FileTransport("sms", str(tmp_path / "out"))})
+    outbox.enqueue("sms", "0100", "Your order is confirmed")
+    outbox.drain()
+    sent = [json.loads(line) for line in (tmp_path / "out" / "sms.jsonl").read_text().splitlines()]
+    assert [(m["to"], m["text"]) for m in sent] == [("0100", "Your order is confirmed")]
+
+
+def test_failures_are_retried_with_backoff(db):
+    transport = Recording(ConnectionError("gateway down"),
+                          [None, Failure("550 no such user", permanent=True), Failure("421 busy")])
+    outbox = Outbox(db, transports={"sms": transport}, batch_size=10)
+    outbox.enqueue_many([("sms", r, "", "hi", r) for r in ("ok", "bad", "busy")])
+
+    outbox.drain()
+    assert rows(outbox) == [(r, PENDING, 1, "gateway down") for r in ("ok", "bad", "busy")]
+    # Not due again until the backoff has passed
+    assert outbox.drain() == 0
+
+    make_due(outbox)
+    outbox.drain()
+    assert rows(outbox) == [("ok", SENT, 2, None), ("bad", FAILED, 2, "550 no such user"),
+                            ("busy", PENDING, 2, "421 busy")]
+
+
+def test_messages_fail_after_max_attempts(db):
+    outbox = Outbox(db, transports={"sms": Recording(*[ConnectionError("down")] * 3)}, max_attempts=3)
+    outbox.enqueue("sms", "0100", "hi")
+    for _ in range(3):
+        make_due(outbox)
+        outbox.drain()
+    assert rows(outbox) == [("0100", FAILED, 3, "down")]
+
+
+def test_unknown_provider_is_retried_not_lost(db):
+    outbox = Outbox(db, transports={})
+    outbox.enqueue("fax", "0100", "hi")
+    outbox.drain()
+    assert rows(outbox)[0][1] == PENDING
+
+
+def test_lease_is_renewed_while_a_slow_batch_is_sent(db, monkeypatch):
+    monkeypatch.setattr(notifications, "LEASE_SECONDS", 0.5)
+    monkeypatch.setattr(notifications, "LEASE_RENEW_SECONDS", 0.1)
+    started, release = threading.Event(), threading.Event()
+
+    class Slow:
+        def send_batch(self, messages):
+            started.set()
+            release.wait(5)
+            return [None] * len(messages)
+
+    first = Outbox(db, transports={"sms": Slow()})
+    first.enqueue("sms", "0100", "hi")
+    worker = threading.Thread(target=first.dispatch_once)
+    worker.start()
+    started.wait(5)
+    time.sleep(1)  # twice the lease
+    assert Outbox(db, transports={}).claim(time.time()) == []
+    release.set()
+    worker.join()
+    assert rows(first) == [("0100", SENT, 1, None)]
+
+
+class DropAfterFirstMessage(notifications._SinkHandler):
+    def reply(self, line):
+        super().reply(line)
+        if line.startswith("250 OK queued"):
+            self.connection.close()
+            raise ConnectionAbortedError
+
+
+def test_smtp_drop_mid_batch_only_fails_unsent_messages(db):
+    sink = notifications.LocalSmtpSink(0)
+    sink.RequestHandlerClass = DropAfterFirstMessage
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    try:
+        transport = SmtpTransport("127.0.0.1", sink.server_address[1], timeout=5)
+        outbox = Outbox(db, transports={"email": transport}, batch_size=10)
+        outbox.enqueue_many([("email", f"u{i}@example.com", "s", "b", f"k{i}") for i in range(3)])
+        outbox.drain()
+    finally:
+        sink.shutdown()
+        sink.server_close()
+    assert sink.received == 1
+    assert [(r, status, attempts) for r, status, attempts, _ in rows(outbox)] == [
+        ("u0@example.com", SENT, 1), ("u1@example.com", PENDING, 1), ("u2@example.com", PENDING, 1),
+    ]
+
+
+def test_smtp_malformed_recipient_fails_only_its_own_message(db):
+    sink = notifications.LocalSmtpSink(0)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    try:
+        transport = SmtpTransport("127.0.0.1", sink.server_address[1], timeout=5)
+        outbox = Outbox(db, transports={"email": transport}, batch_size=10)
+        recipients = ["u0@example.com", "bad@x.com\nBcc: z@z.com", "u2@example.com"]
+        outbox.enqueue_many([("email", r, "s", "b", f"k{i}") for i, r in enumerate(recipients)])
+        outbox.drain()
+    finally:
+        sink.shutdown()
+        sink.server_close()
+    assert sink.received == 2
+    assert [(r, status, attempts) for r, status, attempts, _ in rows(outbox)] == [
+        ("u0@example.com", SENT, 1), ("bad@x.com\nBcc: z@z.com", FAILED, 1), ("u2@example.com", SENT, 1),
+    ]
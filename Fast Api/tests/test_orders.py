@@ -0,0 +1,82 @@
+import sqlite3
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from orders import OrderLine, OrderStore, new_order_id
+
+DAY_1 = datetime(2026, 3, 1, 10, 0, tzinfo=timezone.utc)
+DAY_2 = datetime(2026, 3, 2, 18, 30, tzinfo=timezone.utc)
+
+
+def abaya(quantity, discount="0.00"):
+    return OrderLine(1, "Classic Black Abaya", "Abayas", quantity, Decimal("450.00"), Decimal(discount))
+
+
+def niqab(quantity):
+    return OrderLine(8, "Butterfly Niqab", "Niqabs", quantity, Decimal("90.00"))
+
+
+def test_triggers_roll_up_each_insert(tmp_path):
+    store = OrderStore(str(tmp_path / "orders.db"))
+    store.record(new_order_id(), "Sara", "0100", "Cairo", [abaya(1), niqab(3)], created_at=DAY_1)
+    store.record(new_order_id(), "Mona", "0101", "Giza", [abaya(2, "90.00")], created_at=DAY_1)
+    store.record(new_order_id(), "Huda", "0102", "Alex", [niqab(1)], created_at=DAY_2)
+
+    conn = sqlite3.connect(store.path)
+    assert conn.execute("SELECT day, orders, items, revenue FROM sales_daily ORDER BY day").fetchall() == [
+        ("2026-03-01", 2, 6, 450 + 270 + 810),
+        ("2026-03-02", 1, 1, 90),
+    ]
+    assert conn.execute("SELECT day, category, quantity, revenue FROM sales_category_daily "
+                        "ORDER BY day, category").fetchall() == [
+        ("2026-03-01", "Abayas", 3, 1260),
+        ("2026-03-01", "Niqabs", 3, 270),
+        ("2026-03-02", "Niqabs", 1, 90),
+    ]
+    assert conn.execute("SELECT product_id, quantity, revenue FROM sales_sku ORDER BY product_id").fetchall() == [
+        (1, 3, 1260), (8, 4, 360),
+    ]
+
+
+def test_dashboard_reads_the_rollups(tmp_path):
+    store = OrderStore(str(tmp_path / "orders.db"))
+    store.record(new_order_id(), "Sara", "0100", "Cairo", [abaya(1)], created_at=DAY_1)
+    store.record(new_order_id(), "Mona", "0101", "Giza", [niqab(2)], created_at=DAY_2)
+
+    dashboard = store.dashboard()
+    assert dashboard["total_orders"] == 2
+    assert dashboard["total_revenue"] == 630
+    assert dashboard["average_basket"] == 315
+    assert [d["day"] for d in dashboard["daily"]] == ["2026-03-01", "2026-03-02"]
+    assert dashboard["top_skus"][0]["product_id"] == 1
+
+
+def test_record_keeps_email_and_discount_lines(tmp_path):
+    store = OrderStore(str(tmp_path / "orders.db"))
+    order_id = new_order_id()
+    store.record(order_id, "Sara", "0100", "Cairo", [niqab(3)], email="sara@example.com",
+                 discounts=[("Butterfly Niqab: 3 for 2", Decimal("90.00"))], created_at=DAY_1)
+
+    conn = sqlite3.connect(store.path)
+    pk, email = conn.execute("SELECT id, email FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+    assert email == "sara@example.com"
+    assert conn.execute("SELECT label, amount FROM order_discounts WHERE order_pk = ?", (pk,)).fetchall() == [
+        ("Butterfly Niqab: 3 for 2", 90),
+    ]
+
+
+def test_opening_an_older_database_adds_the_email_column(tmp_path):
+    path = str(tmp_path / "orders.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY AUTOINCREMENT, order_id TEXT NOT NULL, "
+                 "created_at TEXT NOT NULL, day TEXT NOT NULL, customer TEXT NOT NULL, phone TEXT NOT NULL, "
+                 "address TEXT NOT NULL, request_id TEXT, total REAL NOT NULL, item_count INTEGER NOT NULL)")
+    conn.commit()
+    conn.close()
+
+    OrderStore(path).record(new_order_id(), "Sara", "0100", "Cairo", [abaya(1)], email="sara@example.com")
+    assert sqlite3.connect(path).execute("SELECT email FROM orders").fetchone() == ("sara@example.com",)
+
+
+def test_order_ids_are_unique():
+    assert len({new_order_id() for _ in range(1000)}) == 1000
@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from catalog import Product
+from product_details import DetailStore, ProductDetails
+
+ABAYA = Product(1, "Classic Black Abaya", "", 450, "Abayas", "https://example.com/1.jpg", None, "Short description")
+
+
+def write(directory, product_id, data, mtime=None):
+    path = directory / f"{product_id}.json"
+    path.write_text(json.dumps(data) if isinstance(data, dict) else data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def details(tmp_path):
+    return DetailStore(str(tmp_path), max_entries=2)
+
+
+def test_details_come_from_the_product_file(details, tmp_path):
+    write(tmp_path, 1, {"images": ["a.jpg", "b.jpg"], "long_description": "Long",
+                        "size_chart": [{"size": "52", "length_cm": 132}, {"size": "54", "chest_cm": 114}]})
+    got = details.get(ABAYA)
+    assert got.images == ["a.jpg", "b.jpg"] and got.long_description == "Long"
+    assert got.size_columns == ["size", "length_cm", "chest_cm"]
+
+
+def test_missing_or_broken_files_fall_back_to_the_catalog(details, tmp_path):
+    got = details.get(ABAYA)
+    assert (got.images, got.long_description, got.size_chart) == (["https://example.com/1.jpg"], "Short description", [])
+    write(tmp_path, 1, "{not json", mtime=1000)
+    assert details.get(ABAYA).long_description == "Short description"
+    write(tmp_path, 1, {"size_chart": [{"size": "52"}]}, mtime=2000)
+    got = details.get(ABAYA)
+    assert got.images == ["https://example.com/1.jpg"] and got.size_chart == [{"size": "52"}]
+
+
+def test_files_are_read_once_until_they_change(details, tmp_path, monkeypatch):
+    write(tmp_path, 1, {"long_description": "First"}, mtime=1000)
+    loads = []
+    load = details._load
+    monkeypatch.setattr(details, "_load", lambda product_id: loads.append(product_id) or load(product_id))
+    assert details.get(ABAYA).long_description == "First"
+    assert details.get(ABAYA).long_description == "First"
+    assert loads == [1]
+
+    write(tmp_path, 1, {"long_description": "Edited"}, mtime=2000)
+    assert details.get(ABAYA).long_description == "Edited"
+    assert loads == [1, 1]
+
+
+def test_the_cache_keeps_the_most_recent_products(details):
+    for product_id in (1, 2, 1, 3):
+        details.get(Product(product_id, "", "", 1, "Abayas", ""))
+    assert list(details._cache) == [1, 3]
+
+
+def test_to_dict_round_trips():
+    details = ProductDetails(["a.jpg"], "Long", [{"size": "52"}])
+    assert ProductDetails(**details.to_dict()).to_dict() == details.to_dict()
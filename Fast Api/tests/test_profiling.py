@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import profiling
+from profiling import ProfileRequestMiddleware, SamplingProfiler
+
+
+def busy_handler(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def idle_handler(stop):
+    stop.wait()
+
+
+def run_threads(profiler, *targets):
+    stop = threading.Event()
+    threads = [threading.Thread(target=t, args=(stop,)) for t in targets]
+    for thread in threads:
+        thread.start()
+    try:
+        profiler.run_for(0.2)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def test_stacks_are_collapsed_outermost_first():
+    profiler = SamplingProfiler(interval=0.001)
+    run_threads(profiler, busy_handler)
+    assert profiler.samples > 0
+    for line in profiler.collapsed().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert profiler.stacks[stack] == int(count)
+    frames = [s for s in profiler.stacks if "busy_handler (test_profiling.py:" in s]
+    assert frames and all(s.index("run (threading.py:") < s.index("busy_handler") for s in frames)
+
+
+def test_focus_keeps_only_stacks_through_those_functions():
+    profiler = SamplingProfiler(interval=0.001, focus={"busy_handler"})
+    run_threads(profiler, busy_handler, idle_handler)
+    assert profiler.stacks
+    assert all("busy_handler" in stack for stack in profiler.stacks)
+
+
+def test_profile_query_returns_the_request_profile(monkeypatch):
+    monkeypatch.setattr(profiling.settings, "PROFILE_REQUESTS", True)
+    app = FastAPI()
+    app.add_middleware(ProfileRequestMiddleware)
+
+    @app.get("/slow")
+    async def slow():
+        # Holds the event loop, which is the thread being sampled
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+        await asyncio.sleep(0)
+        return {"ok": True}
+
+    client = TestClient(app)
+    assert client.get("/slow").json() == {"ok": True}
+    response = client.get("/slow?profile=1")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert int(response.headers["x-profile-samples"]) > 0
+    assert "slow (test_profiling.py:" in response.text
+
+
+def test_profile_query_is_ignored_unless_enabled(monkeypatch):
+    monkeypatch.setattr(profiling.settings, "PROFILE_REQUESTS", False)
+    app = FastAPI()
+    app.add_middleware(ProfileRequestMiddleware)
+    app.get("/")(lambda: {"ok": True})
+    assert TestClient(app).get("/?profile=1").json() == {"ok": True}
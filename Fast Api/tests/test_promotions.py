@@ -0,0 +1,134 @@
+import importlib.util
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from promotions import CartLine, PromotionSet, Rule, compile_rules
+
+RULES = [
+    {"id": "khimar-underscarves", "kind": "bundle", "label": "Khimar + Underscarves bundle",
+     "skus": [5, 12], "price": "260"},
+    {"id": "niqab-3-for-2", "kind": "buy_x_get_y", "label": "Butterfly Niqab: 3 for 2", "sku": 8, "buy": 2, "get": 1},
+    {"id": "welcome10", "kind": "percent", "label": "Welcome 10% off", "code": "WELCOME10",
+     "percent": 10, "min_subtotal": "300"},
+    {"id": "eid-abayas", "kind": "percent", "label": "Eid: 15% off abayas", "code": "EID15",
+     "percent": 15, "categories": ["Abayas"], "starts": "2026-03-18", "ends": "2026-03-25"},
+]
+NOW = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+def line(product_id, category, price, quantity):
+    return CartLine(product_id, category, Decimal(price), quantity)
+
+
+KHIMAR = line(5, "Khimars", "200.00", 1)
+UNDERSCARVES = line(12, "Accessories", "105.00", 1)
+
+
+@pytest.fixture
+def promotions():
+    return PromotionSet(1, compile_rules(RULES))
+
+
+def test_no_rules_charges_the_subtotal():
+    pricing = PromotionSet(1, []).price([line(1, "Abayas", "450.00", 2)], now=NOW)
+    assert pricing.subtotal == pricing.total == Decimal("900.00")
+    assert pricing.discounts == []
+
+
+def test_bundle_spreads_its_saving_over_the_skus(promotions):
+    pricing = promotions.price([KHIMAR, UNDERSCARVES], now=NOW)
+    assert [d.rule_id for d in pricing.discounts] == ["khimar-underscarves"]
+    assert pricing.discount_total == Decimal("45.00")
+    assert pricing.total == Decimal("260.00")
+    assert pricing.product_discount(5) + pricing.product_discount(12) == Decimal("45.00")
+
+
+def test_buy_x_get_y_discounts_whole_groups_only(promotions):
+    assert promotions.price([line(8, "Niqabs", "90.00", 2)], now=NOW).discounts == []
+    pricing = promotions.price([line(8, "Niqabs", "90.00", 7)], now=NOW)
+    assert pricing.discount_total == Decimal("180.00")
+
+
+def test_lines_for_the_same_product_are_merged(promotions):
+    pricing = promotions.price([line(8, "Niqabs", "90.00", 1), line(8, "Niqabs", "90.00", 2)], now=NOW)
+    assert pricing.discount_total == Decimal("90.00")
+
+
+def test_coupon_needs_its_code_and_minimum(promotions):
+    cart = [line(1, "Abayas", "450.00", 1)]
+    assert not promotions.price(cart, now=NOW).coupon_applied
+    pricing = promotions.price(cart, " welcome10 ", now=NOW)
+    assert pricing.coupon == "WELCOME10" and pricing.coupon_applied
+    assert pricing.total == Decimal("405.00")
+    assert not promotions.price([line(8, "Niqabs", "90.00", 1)], "WELCOME10", now=NOW).coupon_applied
+
+
+def test_units_taken_by_a_bundle_are_not_discounted_again(promotions):
+    pricing = promotions.price([KHIMAR, UNDERSCARVES], "WELCOME10", now=NOW)
+    # The bundle runs first (lower priority) and takes both units; nothing is left for the 10%
+    assert [d.rule_id for d in pricing.discounts] == ["khimar-underscarves"]
+    assert not pricing.coupon_applied
+
+
+def test_rules_only_apply_inside_their_window(promotions):
+    cart = [line(1, "Abayas", "450.00", 1)]
+    assert promotions.price(cart, "EID15", now=NOW).discounts == []
+    during = promotions.price(cart, "EID15", now=datetime(2026, 3, 20, tzinfo=timezone.utc))
+    assert during.total == Decimal("382.50")
+
+
+def test_bad_rules_are_rejected():
+    with pytest.raises(ValueError):
+        compile_rules([{"kind": "mystery"}])
+    with pytest.raises(ValueError):
+        compile_rules([{"kind": "percent", "percent": 150}])
+    with pytest.raises(ValueError):
+        compile_rules([{"kind": "bundle", "skus": [1], "price": "10"}])
+
+
+def test_rule_kinds_must_implement_apply():
+    class Incomplete(Rule):
+        kind = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete({}, 0)
+
+
+@pytest.fixture(scope="module")
+def shop_pricing():
+    # The single-file stores' engine (SingleFile/shop_pricing.py) is a script-side module, not a package
+    path = Path(__file__).resolve().parents[2] / "SingleFile" / "shop_pricing.py"
+    spec = importlib.util.spec_from_file_location("shop_pricing", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+CARTS = [
+    ([KHIMAR, UNDERSCARVES], None),
+    ([KHIMAR, UNDERSCARVES], "WELCOME10"),
+    ([KHIMAR, UNDERSCARVES, line(5, "Khimars", "200.00", 1)], "welcome10"),
+    ([line(8, "Niqabs", "90.00", 7), line(1, "Abayas", "450.00", 1)], "WELCOME10"),
+    ([line(1, "Abayas", "450.00", 2), line(3, "Abayas", "333.33", 1)], "EID15"),
+    ([line(11, "Accessories", "65.00", 1)], "WELCOME10"),
+]
+
+
+@pytest.mark.parametrize("now", [NOW, datetime(2026, 3, 20, tzinfo=timezone.utc)])
+@pytest.mark.parametrize("cart, code", CARTS)
+def test_single_file_stores_price_the_same(promotions, shop_pricing, cart, code, now):
+    index = shop_pricing.PromotionIndex(1, shop_pricing.compile_promotions(RULES))
+    items = [SimpleNamespace(product=SimpleNamespace(id=c.product_id, price=c.unit_price, category=c.category),
+                             quantity=c.quantity) for c in cart]
+
+    expected = promotions.price(cart, code, now=now)
+    actual = index.price(items, code, now=now)
+    assert [(label, amount) for label, amount in actual.discounts] == [(d.label, d.amount) for d in expected.discounts]
+    assert (actual.subtotal, actual.total, actual.coupon_applied) == (
+        expected.subtotal, expected.total, expected.coupon_applied)
+    for product_id in actual.per_product:
+        assert actual.per_product[product_id] == expected.product_discount(product_id)
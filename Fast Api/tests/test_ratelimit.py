@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import accounts
+import ratelimit
+from accounts import SESSION_COOKIE, SessionSigner
+from ratelimit import MemoryBuckets, RateLimitMiddleware, Rule, SqliteBuckets
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def buckets(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBuckets(max_keys=100)
+    return SqliteBuckets(str(tmp_path / "ratelimit.db"), max_keys=100)
+
+
+def test_burst_then_wait(buckets):
+    assert [buckets.take("k", rate=1, burst=3, now=100) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("k", rate=1, burst=3, now=100) == pytest.approx(1)
+    # Half a second later half a token has come back
+    assert buckets.take("k", rate=1, burst=3, now=100.5) == pytest.approx(0.5)
+    assert buckets.take("k", rate=1, burst=3, now=101) == 0
+    assert buckets.take("other", rate=1, burst=3, now=101) == 0
+
+
+def test_tokens_refill_up_to_the_burst_only(buckets):
+    buckets.take("k", rate=1, burst=2, now=0)
+    assert [buckets.take("k", rate=1, burst=2, now=1000) for _ in range(3)][-1] > 0
+
+
+def test_memory_buckets_forget_the_least_recent_key():
+    buckets = MemoryBuckets(max_keys=2)
+    buckets.take("a", rate=1, burst=1, now=0)
+    buckets.take("b", rate=1, burst=1, now=0)
+    buckets.take("a", rate=1, burst=1, now=0)
+    buckets.take("c", rate=1, burst=1, now=0)
+    assert list(buckets._buckets) == ["a", "c"]
+
+
+def test_sqlite_buckets_are_shared_between_workers_and_threads(tmp_path):
+    path = str(tmp_path / "ratelimit.db")
+    first, second = SqliteBuckets(path, max_keys=100), SqliteBuckets(path, max_keys=100)
+    assert first.take("k", rate=1, burst=2, now=0) == 0
+    results = []
+    worker = threading.Thread(target=lambda: results.append(second.take("k", rate=1, burst=2, now=0)))
+    worker.start()
+    worker.join()
+    assert results == [0]
+    assert first.take("k", rate=1, burst=2, now=0) > 0
+
+
+async def ok(request):
+    # Answers with the event loop's thread
+    return PlainTextResponse(threading.current_thread().name)
+
+
+def make_client(store):
+    app = Starlette(routes=[Route("/api/checkout", ok, methods=["POST"]), Route("/", ok)])
+    rules = [Rule("checkout", "POST", r"^/api/checkout$", rate=1 / 60, burst=2)]
+    app.add_middleware(RateLimitMiddleware, rules=rules, store=store)
+    return TestClient(app)
+
+
+@pytest.fixture
+def signer(monkeypatch):
+    monkeypatch.setattr(ratelimit.settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit.settings, "TRUST_PROXY", False)
+    monkeypatch.setattr(accounts.settings, "SESSION_SECRET", "test-secret")
+    signer = SessionSigner(ttl_seconds=3600)
+    monkeypatch.setattr(ratelimit, "SESSIONS", signer)
+    return signer
+
+
+def test_over_limit_requests_get_429_with_retry_after(signer):
+    client = make_client(MemoryBuckets(max_keys=100))
+    assert [client.post("/api/checkout").status_code for _ in range(2)] == [200, 200]
+    response = client.post("/api/checkout")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "60"
+    # Unmatched paths are never limited
+    assert all(client.get("/").status_code == 200 for _ in range(5))
+
+
+def test_signed_in_customers_get_their_own_bucket(signer):
+    client = make_client(MemoryBuckets(max_keys=100))
+    for _ in range(2):
+        client.post("/api/checkout")
+    assert client.post("/api/checkout").status_code == 429
+
+    # Same IP, but a valid session counts against the customer instead
+    token = signer.issue(7, "Sara Ali")
+    client.cookies.set(SESSION_COOKIE, token)
+    assert [client.post("/api/checkout").status_code for _ in range(3)] == [200, 200, 429]
+    # A forged session falls back to the IP's bucket
+    client.cookies.set(SESSION_COOKIE, token[:-2] + "xx")
+    assert client.post("/api/checkout").status_code == 429
+
+
+def test_sqlite_takes_run_in_the_threadpool(signer, tmp_path):
+    threads = []
+
+    class Recording(SqliteBuckets):
+        def take(self, *args):
+            threads.append(threading.current_thread().name)
+            return super().take(*args)
+
+    client = make_client(Recording(str(tmp_path / "ratelimit.db"), max_keys=100))
+    loop_thread = client.post("/api/checkout").text
+    assert [client.post("/api/checkout").status_code for _ in range(2)] == [200, 429]
+    assert len(threads) == 3 and loop_thread not in threads
@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from orders import OrderLine, OrderStore, new_order_id
+from recommendations import CoPurchaseModel
+
+
+def test_pairs_are_counted_both_ways():
+    model = CoPurchaseModel(k=2)
+    model.add_basket([1, 2, 3])
+    model.add_basket([1, 2])
+    model.add_basket([2, 2, 4])
+    assert model.related(1) == (2, 3)
+    assert model.related(2) == (1, 3)  # ties go to the lower id
+    assert model.related(4) == (2,)
+    assert model.related(99) == ()
+    assert model.baskets == 3
+
+
+def test_single_item_orders_are_ignored():
+    model = CoPurchaseModel()
+    model.add_basket([5])
+    model.add_basket([5, 5])
+    assert model.related(5) == () and model.baskets == 0
+
+
+def test_cart_suggestions_skip_what_is_already_in_it():
+    model = CoPurchaseModel(k=3)
+    for basket in ([1, 2], [1, 2], [1, 3], [4, 5], [2, 5], [2, 5], [2, 5]):
+        model.add_basket(basket)
+    assert model.related_to_many([1, 2], k=2) == [5, 3]
+    assert model.related_to_many([]) == []
+
+
+def line(product_id):
+    return OrderLine(product_id, f"Product {product_id}", "Abayas", 1, Decimal("100.00"))
+
+
+def test_history_is_read_from_the_order_store(tmp_path):
+    store = OrderStore(str(tmp_path / "orders.db"))
+    for basket in ([1, 2], [1, 2, 3], [3]):
+        store.record(new_order_id(), "Sara", "0100", "Cairo", [line(pid) for pid in basket])
+    model = CoPurchaseModel()
+    assert model.load_order_history(store.path) == 3
+    assert model.related(1) == (2, 3) and model.related(3) == (1, 2)
+    # Later orders update the loaded rows
+    model.add_basket([3, 4])
+    model.add_basket([3, 4])
+    assert model.related(3)[0] == 4
+
+
+def test_missing_history_loads_nothing(tmp_path):
+    assert CoPurchaseModel().load_order_history(str(tmp_path / "missing.db")) == 0
@@ -0,0 +1,98 @@
+import json
+import os
+from decimal import Decimal
+
+import pytest
+
+from catalog import CatalogSnapshot, Product
+from shipping import QUOTE_CACHE, ShippingStore, load_table, normalize_place
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ZONES = {
+    "zones": {
+        "cairo": {"label": "Greater Cairo", "base": "40", "per_kg": "10", "free_over": "1000", "days": "1-2",
+                  "governorates": {"Cairo": "القاهرة", "Giza": "الجيزة"}, "aliases": ["Nasr City", "6th of October"]},
+        "south": {"label": "Upper Egypt", "base": "70", "per_kg": "15",
+                  "governorates": {"Aswan": "أسوان"}},
+    },
+    "weights_kg": {"default": 0.5, "categories": {"Abayas": 0.9}, "products": {"3": 1.2}},
+}
+
+SNAPSHOT = CatalogSnapshot(1, [
+    Product(1, "Classic Black Abaya", "", 300, "Abayas", ""),
+    Product(2, "Jersey Khimar", "", 200, "Khimars", ""),
+    Product(3, "Winter Abaya", "", 600, "Abayas", ""),
+])
+
+
+@pytest.fixture
+def shipping(tmp_path):
+    path = tmp_path / "shipping.json"
+    path.write_text(json.dumps(ZONES, ensure_ascii=False), encoding="utf-8")
+    store = ShippingStore(str(path), cache_size=2)
+    assert store.reload()
+    return store
+
+
+def test_place_names_are_normalized():
+    assert normalize_place("  Nasr-City, ") == "nasr city"
+    assert normalize_place("أسوان") == normalize_place("اسوان")
+
+
+def test_governorates_and_addresses_resolve_to_zones(shipping):
+    table = shipping.current()
+    assert table.zone_for("giza").id == "cairo"
+    assert table.zone_for("أسوان").id == "south"
+    # An unknown governorate falls back to the address, read from the end
+    assert table.zone_for("Nowhere", "12 Abbas St, Nasr City").id == "cairo"
+    assert table.zone_for(address="Building 5, 6th of October").id == "cairo"
+    assert table.zone_for("Nowhere", "Main St") is None
+    assert ("Aswan", "أسوان") in table.governorates()
+
+
+def test_rates_follow_weight_and_free_threshold(shipping):
+    # 0.5 kg khimar: base rate only
+    assert shipping.quote(SNAPSHOT, {2: 1}, "Cairo").cost == Decimal("40.00")
+    # 3 × 0.9 kg abayas start a third kg: two extra kg at 10
+    quote = shipping.quote(SNAPSHOT, {1: 3}, "Cairo")
+    assert quote.cost == Decimal("60.00") and quote.weight_kg == pytest.approx(2.7)
+    # Per-product weights win over the category weight, and 1200 EGP ships free in Cairo
+    free = shipping.quote(SNAPSHOT, {3: 2}, "Cairo")
+    assert free.cost == Decimal("0.00") and free.to_dict()["free"] and free.weight_kg == pytest.approx(2.4)
+    # Zones without a threshold always charge
+    assert shipping.quote(SNAPSHOT, {3: 2}, "Aswan").cost == Decimal("100.00")
+    assert shipping.quote(SNAPSHOT, {3: 2}, "Nowhere") is None
+
+
+def test_quotes_are_cached_per_zone_and_cart(shipping):
+    hits = QUOTE_CACHE._values.get(("hit",), 0)
+    first = shipping.quote(SNAPSHOT, {1: 1, 2: 1}, "Cairo")
+    # Same zone and cart, in another order and by another name
+    assert shipping.quote(SNAPSHOT, {2: 1, 1: 1}, "القاهرة") is first
+    assert QUOTE_CACHE._values.get(("hit",), 0) == hits + 1
+    # A new catalog version prices the parcel again
+    assert shipping.quote(CatalogSnapshot(2, SNAPSHOT.products), {1: 1, 2: 1}, "Cairo") is not first
+
+
+def test_the_cache_is_bounded_and_cleared_on_reload(shipping):
+    shipping.quote_many(SNAPSHOT, [({1: 1}, "Cairo", None), ({2: 1}, "Cairo", None), ({3: 1}, "Aswan", None)])
+    assert len(shipping._cache) == 2
+    shipping.reload()
+    assert len(shipping._cache) == 0 and shipping.current().version == 2
+
+
+def test_a_broken_file_keeps_the_current_table(shipping, tmp_path):
+    table = shipping.current()
+    (tmp_path / "shipping.json").write_text('{"zones": {"cairo": {"label": "no base"}}}')
+    os.utime(tmp_path / "shipping.json", (1, 1))
+    assert shipping.changed_on_disk()
+    assert not shipping.reload()
+    assert shipping.current() is table and not shipping.changed_on_disk()
+
+
+def test_the_shipped_zones_cover_every_governorate():
+    table = load_table(os.path.join(APP_DIR, "data", "shipping.json"), 1)
+    assert len(table.governorates()) == 27
+    for english, arabic in table.governorates():
+        assert table.zone_for(english) is table.zone_for(arabic) is not None
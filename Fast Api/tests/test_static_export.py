@@ -0,0 +1,88 @@
+import gzip
+import json
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from static_export import PrecompressedStaticFiles, build, slugify
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def product(id, name, category, price):
+    return {"id": id, "name": name, "name_ar": "", "price": price, "category": category,
+            "image_url": f"https://example.com/{id}.jpg", "badge": None, "description": ""}
+
+
+CATALOG = [
+    product(1, "Classic Black Abaya", "Abayas", 450),
+    product(2, "Butterfly Abaya", "Abayas", 520),
+    product(5, "Jersey Khimar", "Khimars", 200),
+]
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    # Templates, product details and shipping zones are read relative to the app directory
+    monkeypatch.chdir(APP_DIR)
+    catalog = tmp_path / "catalog.json"
+
+    def run(products, **kwargs):
+        catalog.write_text(json.dumps({"products": products}))
+        return build(str(tmp_path / "site"), "/store/", str(catalog), **kwargs)
+
+    run.out = tmp_path / "site"
+    return run
+
+
+def test_slugs():
+    assert slugify("Abayas & Khimars") == "abayas-khimars"
+    assert slugify("عبايات") == slugify("عبايات") != ""
+
+
+def test_first_build_renders_every_page_with_a_gzip_twin(site):
+    assert site(CATALOG) == {"categories": 2, "products": 3, "removed": 0}
+    out = site.out
+    for page in ("index.html", "category/abayas/index.html", "category/khimars/index.html",
+                 "product/1/index.html", "catalog.json"):
+        assert gzip.decompress((out / (page + ".gz")).read_bytes()) == (out / page).read_bytes()
+    abayas = (out / "category/abayas/index.html").read_text()
+    assert "Butterfly Abaya" in abayas and "Jersey Khimar" not in abayas
+    assert 'href="/store/product/2/"' in abayas
+    rows = json.loads((out / "catalog.json").read_text())["products"]
+    assert [row["id"] for row in rows] == [1, 2, 5]
+
+
+def test_rebuilds_only_what_changed(site):
+    site(CATALOG)
+    assert site(CATALOG) == {"categories": 0, "products": 0, "removed": 0}
+
+    repriced = [dict(CATALOG[0], price=400)] + CATALOG[1:]
+    assert site(repriced) == {"categories": 1, "products": 1, "removed": 0}
+    assert "400 EGP" in (site.out / "product/1/index.html").read_text()
+    assert "400 EGP" in (site.out / "index.html").read_text()
+
+    without_butterfly = [repriced[0], repriced[2]]
+    assert site(without_butterfly) == {"categories": 1, "products": 0, "removed": 1}
+    assert not (site.out / "product/2").exists()
+
+    # A new set of categories changes every page's navigation
+    assert site(without_butterfly[:1]) == {"categories": 1, "products": 1, "removed": 2}
+    assert not (site.out / "product/5").exists() and not (site.out / "category/khimars").exists()
+    assert site(without_butterfly[:1], force=True)["products"] == 1
+
+
+def test_precompressed_files_are_served_when_accepted(tmp_path):
+    (tmp_path / "page.html").write_bytes(b"<p>hello</p>")
+    (tmp_path / "page.html.gz").write_bytes(gzip.compress(b"<p>hello</p>"))
+    app = FastAPI()
+    app.mount("/store", PrecompressedStaticFiles(directory=str(tmp_path)))
+    client = TestClient(app)
+
+    response = client.get("/store/page.html", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip" and response.text == "<p>hello</p>"
+    assert response.headers["vary"] == "Accept-Encoding"
+    plain = client.get("/store/page.html", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.text == "<p>hello</p>"
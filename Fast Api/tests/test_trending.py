@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+from catalog import Product
+from orders import OrderLine, OrderStore, new_order_id
+from trending import MAX_EXPONENT, DecayedCounter, Rankings, Trending
+
+HOUR = 3600.0
+
+
+def product(id, badge=None):
+    return Product(id, f"Product {id}", "", 100, "Abayas", "", badge)
+
+
+def test_counts_halve_every_half_life():
+    counter = DecayedCounter(half_life=HOUR)
+    start = counter.landmark
+    counter.add(1, 4, now=start)
+    counter.add(2, 1, now=start + HOUR)
+    scores = counter.scores(now=start + 2 * HOUR)
+    assert scores[1] == pytest.approx(1.0)
+    assert scores[2] == pytest.approx(0.5)
+
+
+def test_rescaling_keeps_the_scores():
+    counter = DecayedCounter(half_life=1.0)
+    start = counter.landmark
+    counter.add(1, 1e6, now=start)
+    # Far enough along that the increment's weight would overflow without a rescale
+    later = start + MAX_EXPONENT / counter.rate + 10
+    counter.add(2, 1, now=later)
+    assert counter.landmark == later
+    assert counter.scores(now=later) == {2: pytest.approx(1.0)}
+
+
+def test_sales_make_bestsellers_and_views_make_popular():
+    sales = {1: 5.0, 2: 3.0, 3: 2.0, 4: 1.5, 5: 0.2}
+    views = {1: 50.0, 6: 9.0, 7: 4.0, 8: 2.0, 9: 1.0, 10: 0.5}
+    rankings = Rankings(sales, views)
+    assert {pid for pid, badge in rankings.badges.items() if badge == "Bestseller"} == {1, 2, 3}
+    # Popular skips bestsellers and anything under the badge threshold
+    assert {pid for pid, badge in rankings.badges.items() if badge == "Popular"} == {6, 7, 8}
+    assert rankings.trending[:3] == [1, 2, 3]
+
+
+def test_derived_badges_replace_typed_ones_but_editorial_badges_stay():
+    rankings = Rankings({1: 5.0}, {})
+    assert rankings.badge_for(product(1, "New")) == "Bestseller"
+    assert rankings.badge_for(product(2, "Bestseller")) is None
+    assert rankings.badge_for(product(3, "New")) == "New"
+
+
+def test_trending_sort_puts_ranked_products_first():
+    rankings = Rankings({3: 1.0}, {2: 5.0})
+    assert [p.id for p in rankings.sort([product(1), product(2), product(3), product(4)])] == [3, 2, 1, 4]
+
+
+def test_requests_read_the_rankings_built_at_refresh():
+    trending = Trending(half_life=HOUR)
+    trending.record_sale(5, 2)
+    assert trending.rankings.badges == {}
+    rankings = trending.refresh()
+    assert trending.rankings is rankings and rankings.badges == {5: "Bestseller"}
+
+
+def test_history_only_seeds_recent_orders(tmp_path):
+    store = OrderStore(str(tmp_path / "orders.db"))
+    line = OrderLine(1, "Classic Black Abaya", "Abayas", 2, Decimal("450.00"))
+    store.record(new_order_id(), "Sara", "0100", "Cairo", [line])
+    store.record(new_order_id(), "Mona", "0101", "Giza", [line], created_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+    trending = Trending(half_life=HOUR)
+    assert trending.load_order_history(store.path) == 1
+    assert trending.rankings.badges == {1: "Bestseller"}
+    assert Trending(half_life=HOUR).load_order_history(str(tmp_path / "missing.db")) == 0
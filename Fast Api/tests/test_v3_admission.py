@@ -0,0 +1,98 @@
+import importlib.util
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def shop():
+    # The PyWebIO v3 app is a single script; importing it doesn't start the server
+    path = Path(__file__).resolve().parents[2] / "SingleFile" / "v3" / "main.py"
+    spec = importlib.util.spec_from_file_location("modesta_v3", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeSlot:
+    """
+    Stands in for SessionSlot, which needs a live PyWebIO session and event loop.
+    """
+    def __init__(self, controller=None):
+        self.controller = controller
+        self.last_active = time.monotonic()
+        self.state_bytes = 0
+        self.closed = False
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def admission(shop, monkeypatch):
+    monkeypatch.setattr(shop, "MAX_SESSIONS", 2)
+    monkeypatch.setattr(shop, "MAX_WAITING", 2)
+    monkeypatch.setattr(shop, "MEMORY_BUDGET_MB", 0)
+    return shop.AdmissionController()
+
+
+def test_sessions_past_the_limit_wait_in_line(admission):
+    a, b, c, d, e = (FakeSlot() for _ in range(5))
+    assert [admission.enter(slot) for slot in (a, b, c, d)] == [0, 0, 1, 2]
+    # The waiting room is full too
+    assert admission.enter(e) is None and admission.rejected_total == 1
+
+    assert admission.poll(d) == 2 and admission.poll(c) == 1
+    admission.release(a)
+    # Only the head of the line gets the free seat
+    assert admission.poll(d) == 2
+    assert admission.poll(c) == 0 and admission.poll(d) == 1
+    assert set(admission.active) == {id(b), id(c)}
+
+
+def test_leaving_the_waiting_room_moves_the_line_up(admission):
+    slots = [FakeSlot() for _ in range(4)]
+    for slot in slots:
+        admission.enter(slot)
+    admission.release(slots[2])
+    assert admission.poll(slots[3]) == 1
+
+
+def test_idle_sessions_are_reaped(shop, admission, monkeypatch):
+    monkeypatch.setattr(shop, "SESSION_IDLE_TIMEOUT", 60)
+    idle, busy = FakeSlot(), FakeSlot(controller={"cart": list(range(100))})
+    admission.enter(idle)
+    admission.enter(busy)
+    idle.last_active -= 120
+    admission.reap()
+    assert idle.closed and not busy.closed
+    assert list(admission.active) == [id(busy)] and admission.reaped_total == 1
+    assert busy.state_bytes > 0
+    assert "modesta_pywebio_sessions_reaped_total 1" in admission.render()
+
+
+def test_memory_pressure_shortens_the_idle_timeout(shop, admission, monkeypatch):
+    monkeypatch.setattr(shop, "SESSION_IDLE_TIMEOUT", 900)
+    monkeypatch.setattr(shop, "MEMORY_BUDGET_MB", 1)
+    monkeypatch.setattr(shop, "resident_bytes", lambda: 2 * 1024 * 1024)
+    slot = FakeSlot()
+    admission.active[id(slot)] = slot
+    slot.last_active -= shop.PRESSURE_IDLE_TIMEOUT + 1
+    # Over budget: nobody new gets in, and sessions idle past the shorter timeout are closed
+    assert admission.enter(FakeSlot()) == 1
+    admission.reap()
+    assert slot.closed
+
+
+def test_state_size_skips_shared_catalog_products(shop):
+    product = shop.PRODUCTS_DB[0]
+    cart = shop.Cart()
+    cart.add_product(product)
+    products = [product] * 100
+    assert shop.state_size(products) == sys.getsizeof(products)
+    assert shop.state_size(cart) > shop.state_size(shop.Cart())
@@ -0,0 +1,59 @@
+import pytest
+
+from wishlists import BITSET, MAX_PRODUCT_ID, SORTED_IDS, Wishlist, WishlistError, WishlistStore, encode
+
+
+def test_empty():
+    assert encode([]) == b""
+    wishlist = Wishlist()
+    assert len(wishlist) == 0 and list(wishlist) == [] and 1 not in wishlist
+
+
+def test_dense_ids_use_a_bitset():
+    blob = encode([1, 3, 8, 15])
+    assert blob[0] == BITSET
+    assert len(blob) == 1 + 2
+    wishlist = Wishlist(1, blob)
+    assert list(wishlist) == [1, 3, 8, 15] and len(wishlist) == 4
+    assert 8 in wishlist and 9 not in wishlist and 10_000 not in wishlist and -1 not in wishlist
+
+
+def test_sparse_ids_use_a_sorted_array():
+    ids = [7, 40_000, MAX_PRODUCT_ID]
+    blob = encode(ids)
+    assert blob[0] == SORTED_IDS
+    assert len(blob) == 1 + 4 * len(ids)
+    wishlist = Wishlist(1, blob)
+    assert list(wishlist) == ids and len(wishlist) == 3
+    assert 40_000 in wishlist and 40_001 not in wishlist
+
+
+def test_from_ids_sorts_and_dedupes():
+    wishlist = Wishlist.from_ids([12, 3, 12, 5])
+    assert list(wishlist) == [3, 5, 12]
+    assert wishlist.saved([12, 4, 3]) == [12, 3]
+
+
+@pytest.fixture
+def wishlists(tmp_path):
+    return WishlistStore(str(tmp_path / "wishlists.db"), max_items=2, ttl_seconds=3600)
+
+
+def test_store_saves_and_unsaves(wishlists):
+    assert wishlists.set_saved("v1", 12, True).version == 1
+    assert wishlists.set_saved("v1", 12, True).version == 1  # saving twice is a no-op
+    assert list(wishlists.set_saved("v1", 3, True)) == [3, 12]
+    wishlist = wishlists.set_saved("v1", 12, False)
+    assert (wishlist.version, list(wishlist)) == (3, [3])
+    assert list(wishlists.get("v1")) == [3]
+    assert len(wishlists.get("someone-else")) == 0
+
+
+def test_store_enforces_its_limits(wishlists):
+    wishlists.set_saved("v1", 1, True)
+    wishlists.set_saved("v1", 2, True)
+    with pytest.raises(WishlistError):
+        wishlists.set_saved("v1", 3, True)
+    with pytest.raises(WishlistError):
+        wishlists.set_saved("v1", MAX_PRODUCT_ID + 1, True)
+    assert list(wishlists.get("v1")) == [1, 2]
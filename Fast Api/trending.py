@@ -0,0 +1,158 @@
+"""
+Bestseller / trending rankings derived from live sales and product views.
+
+Every order line and product view bumps an exponentially decayed counter in
+O(1) (forward decay: increments are weighted by exp(rate * (t - landmark)), so
+no other key is touched). A background task turns the counters into an
+immutable `Rankings` every TRENDING_REFRESH_INTERVAL seconds; requests only
+read that object, never aggregate.
+
+Badges derived here ("Bestseller", "Popular") replace the ones typed into the
+catalog; editorial badges such as "New" are kept.
+"""
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+import settings
+
+DERIVED_BADGES = ("Bestseller", "Popular")
+BESTSELLER_COUNT = 3
+POPULAR_COUNT = 3
+# A sale counts as much as this many views in the trending score
+SALE_WEIGHT = 10.0
+# Scores below this (about one recent sale / view) don't earn a badge
+MIN_BADGE_SCORE = 1.0
+# Rescale the stored weights before exp() gets anywhere near overflowing
+MAX_EXPONENT = 200.0
+
+
+class DecayedCounter:
+    def __init__(self, half_life: float):
+        self.rate = math.log(2) / half_life
+        self.landmark = time.time()
+        self._weights: Dict[int, float] = {}
+
+    def add(self, key: int, amount: float = 1.0, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        exponent = self.rate * (now - self.landmark)
+        if exponent > MAX_EXPONENT:
+            self._rescale(now)
+            exponent = 0.0
+        self._weights[key] = self._weights.get(key, 0.0) + amount * math.exp(exponent)
+
+    def _rescale(self, now: float):
+        factor = math.exp(-self.rate * (now - self.landmark))
+        self._weights = {k: w * factor for k, w in self._weights.items() if w * factor > 1e-6}
+        self.landmark = now
+
+    def scores(self, now: Optional[float] = None) -> Dict[int, float]:
+        """
+        Current decayed value of every key.
+        """
+        now = time.time() if now is None else now
+        factor = math.exp(-self.rate * (now - self.landmark))
+        return {k: w * factor for k, w in self._weights.items()}
+
+
+class Rankings:
+    """
+    One immutable set of badges and trending order.
+    """
+    def __init__(self, sales: Dict[int, float], views: Dict[int, float]):
+        scores: Dict[int, float] = {}
+        for pid, score in views.items():
+            scores[pid] = score
+        for pid, score in sales.items():
+            scores[pid] = scores.get(pid, 0.0) + SALE_WEIGHT * score
+        self.trending: List[int] = sorted(scores, key=lambda pid: (-scores[pid], pid))
+        self.rank: Dict[int, int] = {pid: i for i, pid in enumerate(self.trending)}
+
+        self.badges: Dict[int, str] = {}
+        for pid in _top(sales, BESTSELLER_COUNT):
+            self.badges[pid] = "Bestseller"
+        for pid in _top({k: v for k, v in views.items() if k not in self.badges}, POPULAR_COUNT):
+            self.badges[pid] = "Popular"
+
+    def badge_for(self, product) -> Optional[str]:
+        badge = self.badges.get(product.id)
+        if badge:
+            return badge
+        return None if product.badge in DERIVED_BADGES else product.badge
+
+    def sort(self, products: Iterable) -> list:
+        """
+        Trending products first (by score), then the rest in catalog order.
+        """
+        ranked, rest = [], []
+        for p in products:
+            (ranked if p.id in self.rank else rest).append(p)
+        ranked.sort(key=lambda p: self.rank[p.id])
+        return ranked + rest
+
+
+def _top(scores: Dict[int, float], n: int) -> List[int]:
+    eligible = [pid for pid, score in scores.items() if score >= MIN_BADGE_SCORE]
+    return sorted(eligible, key=lambda pid: (-scores[pid], pid))[:n]
+
+
+class Trending:
+    def __init__(self, half_life: float):
+        self.half_life = half_life
+        self._sales = DecayedCounter(half_life)
+        self._views = DecayedCounter(half_life)
+        self._lock = threading.Lock()
+        self.rankings = Rankings({}, {})
+
+    def record_sale(self, product_id: int, quantity: int = 1, now: Optional[float] = None):
+        with self._lock:
+            self._sales.add(product_id, quantity, now)
+
+    def record_view(self, product_id: int):
+        with self._lock:
+            self._views.add(product_id)
+
+    def refresh(self) -> Rankings:
+        with self._lock:
+            sales, views = self._sales.scores(), self._views.scores()
+        # Built outside the lock, then swapped in with one assignment
+        self.rankings = Rankings(sales, views)
+        return self.rankings
+
+    def load_order_history(self, db_path: str) -> int:
+        """
+        Seeds the sales counter with orders recent enough to still matter.
+        """
+        try:
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        except sqlite3.OperationalError:
+            return 0
+        since = datetime.fromtimestamp(time.time() - 10 * self.half_life, timezone.utc).isoformat()
+        loaded = 0
+        try:
+            rows = conn.execute(
+                "SELECT o.created_at, i.product_id, i.quantity FROM order_items i "
+                "JOIN orders o ON o.id = i.order_pk WHERE o.created_at >= ?", (since,)
+            )
+            for created_at, product_id, quantity in rows:
+                self.record_sale(product_id, quantity, datetime.fromisoformat(created_at).timestamp())
+                loaded += 1
+        except sqlite3.OperationalError:
+            # No orders table yet
+            pass
+        finally:
+            conn.close()
+        self.refresh()
+        return loaded
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.refresh()
+
+
+TRENDING = Trending(settings.TRENDING_HALF_LIFE)
@@ -0,0 +1,203 @@
+"""
+Saved-for-later items ("wishlists"), one per visitor.
+
+A wishlist is a set of product ids stored as one small blob, in whichever
+form is smaller for it:
+
+- a bitset over the product id space (bit n set = product n saved), when the
+  saved ids are dense relative to the largest one; 1000 products fit in 125 bytes;
+- a sorted array of little-endian uint32 ids, when a few ids are spread over a
+  large id range.
+
+Loading a visitor's wishlist is one primary-key read, and after that every
+"is this card saved?" check is a byte index and a bit test (or a bisect over
+the short sorted array), so a category page resolves all of its hearts from
+that one read instead of one query per card.
+
+Visitors are identified by an opaque id in the modesta_wishlist cookie. Lists
+live in SQLite (MODESTA_WISHLISTS_DB), shared by all workers; lists untouched
+for MODESTA_WISHLIST_TTL_DAYS are dropped.
+"""
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from typing import Iterable, Iterator, List, Optional
+
+import settings
+from metrics import REGISTRY, Counter
+
+WISHLIST_COOKIE = "modesta_wishlist"
+
+WISHLIST_CHANGES = REGISTRY.register(Counter(
+    "modesta_wishlist_changes_total", "Products saved to or removed from wishlists", ("action",)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS wishlists (
+    owner_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    items BLOB NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_wishlists_updated ON wishlists(updated_at);
+"""
+
+# First byte of a stored blob
+BITSET, SORTED_IDS = 1, 2
+MAX_PRODUCT_ID = 2 ** 32 - 1
+
+
+class WishlistError(ValueError):
+    pass
+
+
+def new_owner_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def _id_array(ids: Iterable[int]) -> array:
+    values = array("I", ids)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class Wishlist:
+    """
+    A decoded wishlist; `product_id in wishlist` is O(1) for the bitset form.
+    """
+    __slots__ = ("version", "_bits", "_ids")
+
+    def __init__(self, version: int = 0, blob: bytes = b""):
+        self.version = version
+        self._bits = None
+        self._ids = array("I")
+        if blob and blob[0] == BITSET:
+            self._bits = memoryview(blob)[1:]
+        elif blob and blob[0] == SORTED_IDS:
+            self._ids = array("I")
+            self._ids.frombytes(blob[1:])
+            if sys.byteorder == "big":
+                self._ids.byteswap()
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int], version: int = 0) -> "Wishlist":
+        return cls(version, encode(sorted(set(ids))))
+
+    def __contains__(self, product_id) -> bool:
+        if self._bits is not None:
+            byte = product_id >> 3
+            return 0 <= byte < len(self._bits) and bool(self._bits[byte] >> (product_id & 7) & 1)
+        i = bisect_left(self._ids, product_id)
+        return i < len(self._ids) and self._ids[i] == product_id
+
+    def __iter__(self) -> Iterator[int]:
+        # Ascending product ids
+        if self._bits is None:
+            return iter(self._ids)
+        return (byte * 8 + bit for byte, value in enumerate(self._bits) if value
+                for bit in range(8) if value >> bit & 1)
+
+    def __len__(self) -> int:
+        if self._bits is None:
+            return len(self._ids)
+        return sum(bin(value).count("1") for value in self._bits if value)
+
+    def saved(self, product_ids: Iterable[int]) -> List[int]:
+        """
+        The given ids that are saved, in the given order: every card of a page in one call.
+        """
+        return [pid for pid in product_ids if pid in self]
+
+
+def encode(sorted_ids: List[int]) -> bytes:
+    """
+    Ascending product ids -> the smaller of a bitset and a sorted uint32 array.
+    """
+    if not sorted_ids:
+        return b""
+    bitset_size = sorted_ids[-1] // 8 + 1
+    if bitset_size <= 4 * len(sorted_ids):
+        bits = bytearray(bitset_size + 1)
+        bits[0] = BITSET
+        for pid in sorted_ids:
+            bits[1 + (pid >> 3)] |= 1 << (pid & 7)
+        return bytes(bits)
+    return bytes([SORTED_IDS]) + _id_array(sorted_ids).tobytes()
+
+
+class WishlistStore:
+    def __init__(self, path: str, max_items: int, ttl_seconds: float):
+        self.path = path
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; changes are read-modify-write of one blob, so they take BEGIN IMMEDIATE
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def get(self, owner_id: Optional[str]) -> Wishlist:
+        if not owner_id:
+            return Wishlist()
+        row = self._conn().execute("SELECT version, items FROM wishlists WHERE owner_id = ?", (owner_id,)).fetchone()
+        return Wishlist(row[0], row[1]) if row else Wishlist()
+
+    def set_saved(self, owner_id: str, product_id: int, saved: bool) -> Wishlist:
+        """
+        Saves or unsaves one product; returns the new wishlist. Saving twice is a no-op.
+        """
+        if not 0 <= product_id <= MAX_PRODUCT_ID:
+            raise WishlistError(f"Invalid product id {product_id}")
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT version, items FROM wishlists WHERE owner_id = ?", (owner_id,)).fetchone()
+            current = Wishlist(row[0], row[1]) if row else Wishlist()
+            if (product_id in current) == saved:
+                conn.execute("COMMIT")
+                return current
+            ids = list(current)
+            if saved:
+                if len(ids) >= self.max_items:
+                    raise WishlistError(f"A wishlist holds at most {self.max_items} products")
+                insort(ids, product_id)
+            else:
+                ids.remove(product_id)
+            blob = encode(ids)
+            version = current.version + 1
+            conn.execute("INSERT INTO wishlists (owner_id, version, items, updated_at) VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT(owner_id) DO UPDATE SET version = excluded.version, items = excluded.items, "
+                         "updated_at = excluded.updated_at", (owner_id, version, blob, time.time()))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        WISHLIST_CHANGES.inc(action="save" if saved else "remove")
+        return Wishlist(version, blob)
+
+    def purge(self) -> int:
+        """
+        Drops wishlists untouched for longer than the TTL; returns how many.
+        """
+        cutoff = time.time() - self.ttl_seconds
+        conn = self._conn()
+        return conn.execute("DELETE FROM wishlists WHERE updated_at < ?", (cutoff,)).rowcount
+
+
+WISHLISTS = WishlistStore(settings.WISHLISTS_DB, settings.WISHLIST_MAX_ITEMS, settings.WISHLIST_TTL_DAYS * 24 * 3600)
@@ -0,0 +1,194 @@
+"""
+Money and promotion pricing shared by the single-file stores (v2-checkout and v3).
+
+Both apps run as scripts, so they put this directory on sys.path and import it. The rules are the
+same JSON as "Fast Api/data/promotions.json" and price exactly like "Fast Api/promotions.py"
+(Fast Api/tests/test_promotions.py checks the two engines against each other).
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Dict, List, Optional
+
+# Money: catalog prices are EGP and become Decimals quantized to the piastre before any arithmetic
+BASE_CURRENCY = "EGP"
+CENT = Decimal("0.01")
+CURRENCIES = {
+    "EGP": {"en": "{amount} EGP", "ar": "{amount} ج.م"},
+    "USD": {"en": "${amount}", "ar": "{amount} US$"},
+    "SAR": {"en": "{amount} SAR", "ar": "{amount} ر.س"},
+    "AED": {"en": "{amount} AED", "ar": "{amount} د.إ"},
+}
+ARABIC_DIGITS = str.maketrans("0123456789,.", "٠١٢٣٤٥٦٧٨٩٬٫")
+
+def to_money(value) -> Decimal:
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+def format_money(amount: Decimal, currency: str = BASE_CURRENCY, locale: str = "en") -> str:
+    text = f"{amount:,.2f}"
+    if text.endswith(".00"):
+        text = text[:-3]
+    if locale == "ar":
+        text = text.translate(ARABIC_DIGITS)
+    return CURRENCIES[currency][locale].format(amount=text)
+
+# Promotions: rules are compiled once per file version into closures, indexed by the SKUs and
+# categories they touch and coupon rules by code. Pricing a cart runs only the rules indexed under
+# its SKUs, categories and code, so checkout cost follows the cart rather than the number of rules.
+# Each unit is discounted by at most one rule; bundles go first, then buy-x-get-y, then percentages.
+PROMOTION_PRIORITY = {"bundle": 10, "buy_x_get_y": 20, "percent": 30}
+
+@dataclass(frozen=True)
+class PromotionRule:
+    id: str
+    label: str
+    order: tuple
+    code: Optional[str]
+    skus: tuple
+    categories: tuple
+    starts: Optional[datetime]
+    ends: Optional[datetime]
+    min_subtotal: Decimal
+    apply: object  # (prices: {id: (unit, category)}, available: {id: units}) -> {id: discount}
+
+@dataclass(frozen=True)
+class Pricing:
+    subtotal: Decimal
+    discounts: tuple  # (label, amount)
+    total: Decimal
+    per_product: Dict[int, Decimal]
+    coupon_applied: bool
+
+def _percent_of(amount: Decimal, percent: Decimal) -> Decimal:
+    return (amount * percent / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+
+def _compile_percent(row):
+    percent = Decimal(str(row["percent"]))
+    skus, categories = frozenset(int(s) for s in row.get("skus", ())), frozenset(row.get("categories", ()))
+    everything = not skus and not categories
+    if not 0 < percent <= 100:
+        raise ValueError("percent must be in (0, 100]")
+
+    def apply(prices, available):
+        result = {}
+        for pid, (unit, category) in prices.items():
+            if available[pid] and (everything or pid in skus or category in categories):
+                result[pid] = _percent_of(unit * available[pid], percent)
+                available[pid] = 0
+        return result
+    return tuple(skus), tuple(categories), apply
+
+def _compile_buy_x_get_y(row):
+    sku, buy, get = int(row["sku"]), int(row["buy"]), int(row.get("get", 1))
+    percent = Decimal(str(row.get("percent", 100)))
+    if buy < 1 or get < 1 or not 0 < percent <= 100:
+        raise ValueError("needs buy >= 1, get >= 1 and percent in (0, 100]")
+
+    def apply(prices, available):
+        groups = available.get(sku, 0) // (buy + get)
+        if not groups:
+            return {}
+        available[sku] -= groups * (buy + get)
+        return {sku: _percent_of(prices[sku][0] * groups * get, percent)}
+    return (sku,), (), apply
+
+def _compile_bundle(row):
+    skus = tuple(dict.fromkeys(int(s) for s in row["skus"]))
+    price = to_money(Decimal(str(row["price"])))
+    if len(skus) < 2 or price < 0:
+        raise ValueError("a bundle needs at least two SKUs and a price")
+
+    def apply(prices, available):
+        if any(s not in prices for s in skus):
+            return {}
+        count = min(available[s] for s in skus)
+        full = sum((prices[s][0] for s in skus), Decimal("0.00"))
+        saving = full - price
+        if not count or saving <= 0:
+            return {}
+        # Spread over the SKUs by price, so per-product revenue in the order store stays meaningful
+        result, allocated = {}, Decimal("0.00")
+        for s in skus[:-1]:
+            share = (saving * prices[s][0] / full).quantize(CENT, rounding=ROUND_HALF_UP)
+            result[s], allocated = share * count, allocated + share
+        result[skus[-1]] = (saving - allocated) * count
+        for s in skus:
+            available[s] -= count
+        return result
+    return skus, (), apply
+
+PROMOTION_COMPILERS = {"percent": _compile_percent, "buy_x_get_y": _compile_buy_x_get_y, "bundle": _compile_bundle}
+
+def _promotion_time(value) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(str(value))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def compile_promotion(row: dict, position: int) -> PromotionRule:
+    kind = row.get("kind")
+    rule_id = str(row.get("id") or f"{kind}-{position}")
+    try:
+        skus, categories, apply = PROMOTION_COMPILERS[kind](row)
+        return PromotionRule(rule_id, str(row.get("label") or rule_id),
+                             (int(row.get("priority", PROMOTION_PRIORITY[kind])), position),
+                             str(row["code"]).strip().upper() if row.get("code") else None, skus, categories,
+                             _promotion_time(row.get("starts")), _promotion_time(row.get("ends")),
+                             Decimal(str(row.get("min_subtotal", "0"))), apply)
+    except (KeyError, TypeError, ValueError, InvalidOperation) as exc:
+        raise ValueError(f"promotion {rule_id}: {exc!r}")
+
+def compile_promotions(rows: List[dict]) -> List[PromotionRule]:
+    return [compile_promotion(row, position) for position, row in enumerate(rows)]
+
+class PromotionIndex:
+    def __init__(self, version: int, rules: List[PromotionRule]):
+        self.version = version
+        self.by_sku: Dict[int, List[PromotionRule]] = {}
+        self.by_category: Dict[str, List[PromotionRule]] = {}
+        self.by_code: Dict[str, List[PromotionRule]] = {}
+        self.everywhere: List[PromotionRule] = []
+        for rule in rules:
+            if rule.code:
+                self.by_code.setdefault(rule.code, []).append(rule)
+                continue
+            if not rule.skus and not rule.categories:
+                self.everywhere.append(rule)
+            for s in rule.skus:
+                self.by_sku.setdefault(s, []).append(rule)
+            for c in rule.categories:
+                self.by_category.setdefault(c, []).append(rule)
+
+    def price(self, items: list, code: Optional[str] = None, now: Optional[datetime] = None) -> Pricing:
+        """
+        Prices cart items (anything with .product.id/.price/.category and .quantity) with the rules that apply.
+        """
+        now = now or datetime.now(timezone.utc)
+        code = code.strip().upper() if code else None
+        prices = {item.product.id: (to_money(item.product.price), item.product.category) for item in items}
+        available: Dict[int, int] = {}
+        for item in items:
+            available[item.product.id] = available.get(item.product.id, 0) + item.quantity
+        subtotal = sum((prices[pid][0] * qty for pid, qty in available.items()), Decimal("0.00"))
+
+        candidates = {id(r): r for r in self.everywhere}
+        for pid, (_, category) in prices.items():
+            candidates.update((id(r), r) for r in self.by_sku.get(pid, ()))
+            candidates.update((id(r), r) for r in self.by_category.get(category, ()))
+        candidates.update((id(r), r) for r in self.by_code.get(code, ()))
+
+        discounts, per_product, coupon_applied = [], {}, False
+        for rule in sorted(candidates.values(), key=lambda r: r.order):
+            if ((rule.starts and now < rule.starts) or (rule.ends and now >= rule.ends)
+                    or subtotal < rule.min_subtotal):
+                continue
+            amounts = {pid: a for pid, a in rule.apply(prices, available).items() if a > 0}
+            if amounts:
+                discounts.append((rule.label, sum(amounts.values(), Decimal("0.00"))))
+                for pid, a in amounts.items():
+                    per_product[pid] = per_product.get(pid, Decimal("0.00")) + a
+                coupon_applied = coupon_applied or rule.code is not None
+        discount_total = sum((a for _, a in discounts), Decimal("0.00"))
+        return Pricing(subtotal, tuple(discounts), subtotal - discount_total, per_product, coupon_applied)
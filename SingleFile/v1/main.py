@@ -463,7 +463,8 @@ class ShopController:
     def show_cart(self):
         self.ui.render_cart_modal(self.cart, on_close=None)
 
-def main():
+# Coroutine session: one event loop serves every shopper instead of a thread each
+async def main():
     app = ShopController()
     app.start()
 
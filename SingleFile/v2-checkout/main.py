@@ -1,9 +1,22 @@
 from pywebio import start_server, config
 from pywebio.output import put_html, put_buttons, put_row, put_markdown, clear, use_scope, popup, toast, put_table, close_popup, put_column
-from pywebio.input import input_group, input, select, textarea, NUMBER
+from pywebio.pin import put_input, put_select, put_textarea, pin_update, pin_on_change, get_pin_values
 from pywebio.session import run_js, set_env
 from dataclasses import dataclass, field
 from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import asyncio
+import functools
+import json
+import math
+import os
+import re
+import sys
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shop_pricing import PromotionIndex, compile_promotions, format_money, to_money
 
 # ==========================================
 # 1. MODELS & DATA LAYER
@@ -100,6 +113,104 @@ PRODUCTS_DB = [
             "Set of 5 premium cotton underscarves"),
 ]
 
+# Promotions are priced by the engine v3 uses (SingleFile/shop_pricing.py: rules compiled into closures
+# indexed by SKU, category and coupon code, Decimal money), so this checkout charges exactly what v3 and
+# the FastAPI store charge. Each unit gets at most one discount; bundles go first, then buy-x-get-y,
+# then percentages. Rules and shipping rates are read from the FastAPI app's data files, or from
+# MODESTA_PROMOTIONS / MODESTA_SHIPPING when set.
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "Fast Api", "data")
+PROMOTIONS_PATH = os.environ.get("MODESTA_PROMOTIONS") or os.path.join(DATA_DIR, "promotions.json")
+SHIPPING_PATH = os.environ.get("MODESTA_SHIPPING") or os.path.join(DATA_DIR, "shipping.json")
+
+def _read_json(path: str):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+PROMOTIONS = PromotionIndex(1, compile_promotions(_read_json(PROMOTIONS_PATH)["rules"]))
+
+def new_order_id() -> str:
+    # Same id format as v3; hash() of the name repeated for namesakes and changed with PYTHONHASHSEED
+    return f"MOD-{uuid.uuid4().hex[:12].upper()}"
+
+def price_cart(items: List[CartItem], coupon: str = ""):
+    """
+    Pricing (Decimal subtotal, (label, discount) lines, total, coupon_applied) for the cart.
+    """
+    return PROMOTIONS.price(items, coupon)
+
+# Shipping zones: every governorate maps to a zone through one precomputed lookup table, and a
+# quote only depends on (zone, cart signature), so it is computed once and then served from cache.
+_shipping = _read_json(SHIPPING_PATH)
+SHIPPING_ZONES = {
+    zone_id: {"label": zone["label"], "base": to_money(zone["base"]), "per_kg": to_money(zone["per_kg"]),
+              "free_over": to_money(zone["free_over"]) if zone.get("free_over") is not None else None,
+              "days": zone["days"], "governorates": list(zone["governorates"])}
+    for zone_id, zone in _shipping["zones"].items()
+}
+DEFAULT_WEIGHT_KG = float(_shipping["weights_kg"].get("default", 0.5))
+CATEGORY_WEIGHTS_KG = {cat: float(kg) for cat, kg in _shipping["weights_kg"].get("categories", {}).items()}
+PRODUCT_WEIGHTS_KG = {int(pid): float(kg) for pid, kg in _shipping["weights_kg"].get("products", {}).items()}
+ZONE_BY_GOVERNORATE = {gov: zone_id for zone_id, zone in SHIPPING_ZONES.items() for gov in zone["governorates"]}
+GOVERNORATES = list(ZONE_BY_GOVERNORATE)
+
+def _weight_kg(product: Product) -> float:
+    return PRODUCT_WEIGHTS_KG.get(product.id, CATEGORY_WEIGHTS_KG.get(product.category, DEFAULT_WEIGHT_KG))
+
+def cart_signature(cart: Cart):
+    return tuple(sorted((item.product.id, item.quantity) for item in cart.items))
+
+@functools.lru_cache(maxsize=4096)
+def _shipping_quote(zone_id: str, signature) -> dict:
+    zone = SHIPPING_ZONES[zone_id]
+    products = {p.id: p for p in PRODUCTS_DB}
+    weight = sum(_weight_kg(products[pid]) * qty for pid, qty in signature)
+    subtotal = sum((to_money(products[pid].price) * qty for pid, qty in signature), Decimal("0.00"))
+    if zone["free_over"] is not None and subtotal >= zone["free_over"]:
+        cost = Decimal("0.00")
+    else:
+        cost = to_money(zone["base"] + zone["per_kg"] * max(0, math.ceil(weight) - 1))
+    return {"zone": zone["label"], "cost": cost, "days": zone["days"], "weight_kg": round(weight, 2)}
+
+def shipping_quote(governorate: str, cart: Cart) -> Optional[dict]:
+    zone_id = ZONE_BY_GOVERNORATE.get(governorate)
+    return _shipping_quote(zone_id, cart_signature(cart)) if zone_id else None
+
+# Checkout fields are checked at the same time on a shared pool when the order is confirmed; the
+# checks are independent, so a slow one doesn't hold up the others, and the session awaits them
+# without blocking the event loop.
+PHONE_RE = re.compile(r"^(?:\+?20|0)?1[0125]\d{8}$")
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s.]{2,}$")
+VALIDATION_POOL = ThreadPoolExecutor(8, thread_name_prefix="checkout-check")
+
+def check_name(info: dict) -> Optional[str]:
+    return None if len(info.get("name", "")) >= 3 else "Please enter your full name"
+
+def check_phone(info: dict) -> Optional[str]:
+    phone = re.sub(r"[\s()-]", "", info.get("phone", ""))
+    return None if PHONE_RE.match(phone) else "Enter a mobile number such as 01012345678"
+
+def check_email(info: dict) -> Optional[str]:
+    email = info.get("email", "")
+    return None if not email or EMAIL_RE.match(email) else "This email address looks incomplete"
+
+def check_address(info: dict) -> Optional[str]:
+    if info.get("city") not in ZONE_BY_GOVERNORATE:
+        return "We don't deliver to this governorate yet"
+    return None if len(info.get("address", "").split()) >= 3 else "Please add street, building and area"
+
+def check_coupon(info: dict, items: List[CartItem]) -> Optional[str]:
+    code = info.get("coupon", "")
+    return None if not code or price_cart(items, code).coupon_applied else "This code doesn't apply to your cart"
+
+CHECKOUT_CHECKS = {"name": check_name, "phone": check_phone, "email": check_email, "address": check_address}
+
+async def validate_checkout(info: dict, items: List[CartItem]) -> Dict[str, str]:
+    loop = asyncio.get_running_loop()
+    checks = [loop.run_in_executor(VALIDATION_POOL, check, info) for check in CHECKOUT_CHECKS.values()]
+    checks.append(loop.run_in_executor(VALIDATION_POOL, check_coupon, info, items))
+    errors = await asyncio.gather(*checks)
+    return {field: error for field, error in zip([*CHECKOUT_CHECKS, "coupon"], errors) if error}
+
 # ==========================================
 # 2. UI / PRESENTATION LAYER
 # ==========================================
@@ -465,6 +576,14 @@ class UI:
 
         put_html('</div>')
 
+    @staticmethod
+    def discount_lines(pricing) -> str:
+        return "".join(f'''
+                        <div style="display: flex; justify-content: space-between; margin-bottom: 8px;">
+                            <span style="color: #666;">{label}</span>
+                            <span style="color: #27ae60; font-weight: 600;">-{format_money(amount)}</span>
+                        </div>''' for label, amount in pricing.discounts)
+
     @staticmethod
     def render_footer():
         put_html("""
@@ -712,6 +831,8 @@ class ShopController:
         </div>
         ''')
 
+        pricing = price_cart(self.cart.items)
+
         cart_items_html = ""
         for item in self.cart.items:
             cart_items_html += f'''
@@ -746,7 +867,7 @@ class ShopController:
                     <i class="fas fa-user" style="color: #e84393; margin-right: 10px;"></i>
                     Shipping Information
                 </h3>
-                <div id="form-container"></div>
+                <p style="color: #666; margin: 0;">Fill in your details below, then confirm your order.</p>
             </div>
 
             <div>
@@ -766,18 +887,19 @@ class ShopController:
                     <div style="border-top: 2px dashed #fecfef; margin-top: 15px; padding-top: 15px;">
                         <div style="display: flex; justify-content: space-between; margin-bottom: 8px;">
                             <span style="color: #666;">Subtotal</span>
-                            <span style="color: #2d3436; font-weight: 600;">{int(self.cart.get_total())} EGP</span>
+                            <span style="color: #2d3436; font-weight: 600;">{format_money(pricing.subtotal)}</span>
                         </div>
+                        <div id="order-discounts">{self.ui.discount_lines(pricing)}</div>
                         <div style="display: flex; justify-content: space-between; margin-bottom: 8px;">
-                            <span style="color: #666;">Shipping</span>
-                            <span style="color: #27ae60; font-weight: 600;">FREE</span>
+                            <span style="color: #666;">Shipping <span id="shipping-zone" style="font-size: 12px;"></span></span>
+                            <span id="shipping-cost" style="color: #27ae60; font-weight: 600;">Select governorate</span>
                         </div>
                         <div style="
                             display: flex; justify-content: space-between; margin-top: 15px;
                             padding-top: 15px; border-top: 2px solid #fecfef;
                         ">
                             <span style="color: #5f27cd; font-weight: 700; font-size: 18px;">Total</span>
-                            <span style="color: #e84393; font-weight: 800; font-size: 22px;">{int(self.cart.get_total())} EGP</span>
+                            <span id="order-total" style="color: #e84393; font-weight: 800; font-size: 22px;">{format_money(pricing.total)}</span>
                         </div>
                     </div>
                 </div>
@@ -809,25 +931,61 @@ class ShopController:
         </div>
         ''')
 
-        try:
-            info = input_group("", [
-                input("Full Name", name="name", placeholder="Enter your full name"),
-                input("Phone Number", name="phone", placeholder="+20 XXX XXX XXXX"),
-                input("Email", name="email", type="email", placeholder="your@email.com"),
-                textarea("Shipping Address", name="address", placeholder="Street, Building, Floor, Apartment..."),
-                select("City", name="city", options=["Cairo", "Alexandria", "Giza", "Other"]),
-            ])
+        # Pin widgets instead of a blocking input_group: the session keeps handling other clicks
+        put_column([
+            put_input('name', label="Full Name", placeholder="Enter your full name"),
+            put_input('phone', label="Phone Number", placeholder="+20 XXX XXX XXXX"),
+            put_input('email', label="Email", placeholder="your@email.com"),
+            put_textarea('address', label="Shipping Address", rows=3, placeholder="Street, Building, Floor, Apartment..."),
+            put_select('city', label="Governorate", options=GOVERNORATES),
+            put_input('coupon', label="Coupon Code", placeholder="Optional"),
+            put_buttons(['Confirm Order'], onclick=lambda _: self.submit_checkout()),
+        ]).style('max-width: 1060px; margin: 30px auto; padding: 30px; background: white; border-radius: 25px;')
+        # The summary follows the form: a new governorate or coupon re-prices it in place
+        self.checkout_city, self.checkout_coupon = GOVERNORATES[0], ""
+        pin_on_change('city', lambda governorate: self.update_summary(city=governorate))
+        pin_on_change('coupon', lambda coupon: self.update_summary(coupon=coupon or ""))
+        self.update_summary()
+
+    async def submit_checkout(self):
+        if not self.cart.items:
+            return
+        values = await get_pin_values(['name', 'phone', 'email', 'address', 'city', 'coupon'])
+        info = {field: (value or '').strip() for field, value in values.items()}
+        errors = await validate_checkout(info, self.cart.items)
+        for field in ('name', 'phone', 'email', 'address', 'coupon'):
+            pin_update(field, valid_status=False if field in errors else 0, help_text=errors.get(field, ''))
+        if errors:
+            return
+        clear()
+        run_js('window.scrollTo(0,0);')  # <<<<< Added Fix
+        self.refresh_header()
+        self.show_order_confirmation(info)
 
-            if info:
-                clear()
-                run_js('window.scrollTo(0,0);')  # <<<<< Added Fix
-                self.refresh_header()
-                self.show_order_confirmation(info)
-        except:
-            pass
+    def update_summary(self, city: Optional[str] = None, coupon: Optional[str] = None):
+        """
+        Updates the summary's discounts, shipping line and total in place when the governorate or coupon changes.
+        """
+        self.checkout_city = city if city is not None else self.checkout_city
+        self.checkout_coupon = coupon if coupon is not None else self.checkout_coupon
+        pricing = price_cart(self.cart.items, self.checkout_coupon)
+        quote = shipping_quote(self.checkout_city, self.cart)
+        cost = "FREE" if quote["cost"] == 0 else format_money(quote["cost"])
+        run_js("document.getElementById('order-discounts').innerHTML = discounts;"
+               "document.getElementById('shipping-cost').innerText = cost;"
+               "document.getElementById('shipping-zone').innerText = zone;"
+               "document.getElementById('order-total').innerText = order_total;",
+               discounts=self.ui.discount_lines(pricing), cost=cost,
+               zone=f"({quote['zone']}, {quote['days']} days)", order_total=format_money(pricing.total + quote["cost"]))
 
     def show_order_confirmation(self, info):
-        order_id = f"MOD-{hash(info['name']) % 100000:05d}"
+        order_id = new_order_id()
+        pricing = price_cart(self.cart.items, info.get('coupon', ''))
+        shipping = shipping_quote(info['city'], self.cart)
+        total = pricing.total + shipping["cost"]
+        discount_lines = "".join(f'<p style="color: #27ae60; margin: 0 0 8px 0;">{label}: -{format_money(amount)}</p>'
+                                 for label, amount in pricing.discounts)
+        discount_lines += f'<p style="color: #666; margin: 0 0 8px 0;">Shipping ({shipping["zone"]}): {format_money(shipping["cost"])}</p>'
 
         put_html(f'''
         <div style="
@@ -867,7 +1025,7 @@ class ShopController:
                 </h4>
                 <p style="color: #666; margin: 5px 0;"><strong>Name:</strong> {info['name']}</p>
                 <p style="color: #666; margin: 5px 0;"><strong>Phone:</strong> {info['phone']}</p>
-                <p style="color: #666; margin: 5px 0;"><strong>City:</strong> {info['city']}</p>
+                <p style="color: #666; margin: 5px 0;"><strong>Governorate:</strong> {info['city']}</p>
                 <p style="color: #666; margin: 5px 0;"><strong>Address:</strong> {info['address']}</p>
             </div>
 
@@ -875,8 +1033,9 @@ class ShopController:
                 background: linear-gradient(135deg, #d5f5e3, #abebc6);
                 padding: 20px; border-radius: 15px; margin-bottom: 30px;
             ">
+                {discount_lines}
                 <p style="color: #27ae60; font-size: 22px; font-weight: 700; margin: 0;">
-                    Total: {int(self.cart.get_total())} EGP
+                    Total: {format_money(total)}
                 </p>
             </div>
 
@@ -895,7 +1054,8 @@ class ShopController:
 
         self.ui.render_footer()
 
-def main():
+# Coroutine session: one event loop serves every shopper instead of a thread each
+async def main():
     app = ShopController()
     app.start()
 
@@ -1,10 +1,46 @@
 from pywebio import start_server, config
-from pywebio.output import put_html, put_buttons, put_row, put_markdown, clear, use_scope, popup, toast, put_table, close_popup, put_column, put_image, put_text, put_grid, put_scope
-from pywebio.input import input_group, input, select, textarea, NUMBER
-from pywebio.pin import put_input, pin
-from pywebio.session import run_js, set_env
+from pywebio.output import put_html, put_buttons, put_row, put_markdown, clear, use_scope, popup, toast, put_table, close_popup, put_column, put_image, put_text, put_grid, put_scope, put_file
+from pywebio.pin import put_input, put_select, put_textarea, put_checkbox, pin, pin_update, pin_on_change, get_pin_values
+from pywebio.session import run_js, eval_js, set_env, defer_call, get_current_session, info as session_info
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from heapq import nlargest
+from itertools import combinations
+from bisect import bisect_left
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+import asyncio
+import base64
+import functools
+import hashlib
+import hmac
+import html
+import json
+import logging
+import math
+import multiprocessing
+import os
+import re
+import secrets
+import sqlite3
+import string
+import sys
+import threading
+import time
+import uuid
+
+# Money formatting and the promotions engine are shared with v2-checkout (SingleFile/shop_pricing.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shop_pricing import (BASE_CURRENCY, CENT, CURRENCIES, PromotionIndex, compile_promotion, compile_promotions,
+                          format_money, to_money)
+
+# Reload, render and background-thread failures; configured in __main__ (WARNING and up to stderr otherwise)
+log = logging.getLogger("modesta.v3")
 
 # ==========================================
 # 1. MODELS & DATA LAYER
@@ -27,8 +63,8 @@ class CartItem:
     quantity: int = 1
 
     @property
-    def total_price(self) -> float:
-        return self.product.price * self.quantity
+    def total_price(self) -> Decimal:
+        return to_money(self.product.price) * self.quantity
 
 class Cart:
     def __init__(self):
@@ -57,8 +93,8 @@ class Cart:
                     item.quantity = new_qty
                 return
 
-    def get_total(self) -> float:
-        return sum(item.total_price for item in self.items)
+    def get_total(self) -> Decimal:
+        return sum((item.total_price for item in self.items), Decimal("0.00"))
 
     def get_count(self) -> int:
         return sum(item.quantity for item in self.items)
@@ -105,18 +141,1344 @@ PRODUCTS_DB = [
             "Set of 5 premium cotton underscarves"),
 ]
 
+# Optional external catalog (same JSON format as "Fast Api/data/catalog.json").
+# When set, edits to the file are picked up by every worker without a restart.
+CATALOG_PATH = os.environ.get("MODESTA_CATALOG", "")
+CATALOG_WATCH_INTERVAL = float(os.environ.get("MODESTA_CATALOG_WATCH_INTERVAL", "2"))
+
+class CatalogSnapshot:
+    """
+    One immutable catalog version with its lookup indexes.
+    """
+    def __init__(self, version: int, products: List[Product]):
+        self.version = version
+        self.products = tuple(products)
+        self.by_id = {p.id: p for p in self.products}
+        by_category: Dict[str, List[Product]] = {}
+        for p in self.products:
+            by_category.setdefault(p.category, []).append(p)
+        self.by_category = {c: tuple(ps) for c, ps in by_category.items()}
+        self.categories = list(self.by_category)
+
+class Catalog:
+    """
+    Holds the current CatalogSnapshot. A reload builds the new snapshot first
+    and then swaps the reference, so open sessions (and their carts) keep
+    running and simply see the new version on their next page render.
+    """
+    def __init__(self, path: str, fallback: List[Product]):
+        self.path = path
+        self._snapshot = CatalogSnapshot(1, fallback)
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def current(self) -> CatalogSnapshot:
+        return self._snapshot
+
+    def reload(self) -> bool:
+        if not self.path:
+            return False
+        with self._lock:
+            mtime = None
+            try:
+                mtime = os.path.getmtime(self.path)
+                with open(self.path, encoding="utf-8") as f:
+                    rows = json.load(f)["products"]
+                products = [Product(int(r["id"]), r["name"], r.get("name_ar", ""), float(r["price"]), r["category"],
+                                    r.get("image_url", ""), r.get("badge") or None, r.get("description", ""))
+                            for r in rows]
+                # float() accepts NaN and Infinity, which would break every price computed from them
+                if not all(math.isfinite(p.price) for p in products):
+                    raise ValueError("prices must be finite numbers")
+            except (OSError, ValueError, KeyError, TypeError) as exc:
+                log.error("Catalog reload failed, keeping version %s: %s", self._snapshot.version, exc)
+                # Don't let the watcher retry the same broken file every poll
+                self._mtime = mtime or self._mtime
+                return False
+            self._snapshot = CatalogSnapshot(self._snapshot.version + 1, products)
+            self._mtime = mtime
+        return True
+
+    def start_watcher(self, interval: float = CATALOG_WATCH_INTERVAL):
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    changed = os.path.getmtime(self.path) != self._mtime
+                except OSError:
+                    changed = False
+                if changed:
+                    self.reload()
+        if self.path and interval > 0:
+            threading.Thread(target=watch, name="catalog-watcher", daemon=True).start()
+
+CATALOG = Catalog(CATALOG_PATH, PRODUCTS_DB)
+
+# Confirmed orders are written to the shared order store when MODESTA_ORDERS_DB points at it.
+# The store is created by "Fast Api/orders.py"; its triggers keep the sales rollups current.
+ORDERS_DB = os.environ.get("MODESTA_ORDERS_DB", "")
+# Amounts are exact Decimals; the REAL columns take them via their text form
+sqlite3.register_adapter(Decimal, str)
+
+def new_order_id() -> str:
+    # Keys the order log, invoices and notifications, so it must never repeat (same form as the FastAPI app)
+    return f"MOD-{uuid.uuid4().hex[:12].upper()}"
+
+_orders_migrated = False
+_orders_migrate_lock = threading.Lock()
+
+def migrate_orders(conn: sqlite3.Connection):
+    # Same migration as "Fast Api/orders.py": the email column and the discount lines invoices are rebuilt from
+    global _orders_migrated
+    with _orders_migrate_lock:
+        if _orders_migrated:
+            return
+        if "email" not in {row[1] for row in conn.execute("PRAGMA table_info(orders)")}:
+            conn.execute("ALTER TABLE orders ADD COLUMN email TEXT")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS order_discounts (
+                order_pk INTEGER NOT NULL REFERENCES orders(id), label TEXT NOT NULL, amount REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_order_discounts_order ON order_discounts(order_pk);
+        """)
+        _orders_migrated = True
+
+def record_order(order_id: str, info: dict, cart: Cart, pricing=None, created_at: Optional[datetime] = None):
+    if not ORDERS_DB or not os.path.exists(ORDERS_DB):
+        return
+    now = created_at or datetime.now(timezone.utc)
+    day = now.date().isoformat()
+    address = f"{info.get('address', '')}, {info.get('city', '')}"
+    total = pricing.total if pricing else cart.get_total()
+    discounts = pricing.per_product if pricing else {}
+    conn = sqlite3.connect(ORDERS_DB, timeout=10)
+    try:
+        migrate_orders(conn)
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO orders (order_id, created_at, day, customer, phone, address, request_id, total, item_count, "
+                "email) VALUES (?, ?, ?, ?, ?, ?, NULL, ?, ?, ?)",
+                (order_id, now.isoformat(), day, info['name'], info['phone'], address, total, cart.get_count(),
+                 info.get('email') or None),
+            )
+            conn.executemany("INSERT INTO order_discounts (order_pk, label, amount) VALUES (?, ?, ?)",
+                             [(cursor.lastrowid, label, amount) for label, amount in (pricing.discounts if pricing else ())])
+            conn.executemany(
+                "INSERT INTO order_items (order_pk, day, product_id, name, category, quantity, unit_price, line_total) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(cursor.lastrowid, day, item.product.id, item.product.name, item.product.category,
+                  item.quantity, to_money(item.product.price), item.total_price - discounts.get(item.product.id, 0))
+                 for item in cart.items],
+            )
+    finally:
+        conn.close()
+
+# "Frequently bought together": sparse co-purchase counts (one Counter per product) with a
+# precomputed top-k table, seeded from the order store at startup and updated per order.
+RELATED_TOP_K = 4
+
+class CoPurchaseModel:
+    def __init__(self, k: int = RELATED_TOP_K):
+        self.k = k
+        self._counts: Dict[int, Counter] = {}
+        self._top: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+
+    def add_basket(self, product_ids):
+        with self._lock:
+            self._count(product_ids)
+            self._refresh(set(product_ids))
+
+    def _count(self, product_ids):
+        for a, b in combinations(sorted(set(product_ids)), 2):
+            self._counts.setdefault(a, Counter())[b] += 1
+            self._counts.setdefault(b, Counter())[a] += 1
+
+    def _refresh(self, product_ids):
+        for pid in product_ids:
+            if pid in self._counts:
+                row = self._counts[pid].items()
+                self._top[pid] = tuple(o for o, _ in nlargest(self.k, row, key=lambda kv: (kv[1], -kv[0])))
+
+    def related(self, product_id: int) -> tuple:
+        return self._top.get(product_id, ())
+
+    def related_to_many(self, product_ids) -> List[int]:
+        in_cart = set(product_ids)
+        scores = Counter()
+        for pid in in_cart:
+            for rank, other in enumerate(self.related(pid)):
+                if other not in in_cart:
+                    scores[other] += self.k - rank
+        return [pid for pid, _ in nlargest(self.k, scores.items(), key=lambda kv: (kv[1], -kv[0]))]
+
+    def load_order_history(self, db_path: str):
+        if not db_path or not os.path.exists(db_path):
+            return
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            baskets: Dict[int, List[int]] = {}
+            for order_pk, product_id in conn.execute("SELECT order_pk, product_id FROM order_items"):
+                baskets.setdefault(order_pk, []).append(product_id)
+        except sqlite3.OperationalError:
+            return
+        finally:
+            conn.close()
+        with self._lock:
+            for basket in baskets.values():
+                self._count(basket)
+            self._refresh(list(self._counts))
+
+RECOMMENDER = CoPurchaseModel()
+
+def related_products(product_ids) -> List[Product]:
+    snapshot = CATALOG.current()
+    return [snapshot.by_id[pid] for pid in product_ids if pid in snapshot.by_id]
+
+# Saved-for-later products, per browser (its id is kept in localStorage). A list is stored as a
+# bitset over the product id space, or as a sorted uint32 id array when a few ids are spread over
+# a large range, whichever is smaller; a category page loads it once and checks each card's heart
+# with a bit test. Kept in MODESTA_WISHLISTS_DB (same table as "Fast Api/wishlists.py") when set,
+# otherwise in memory for the life of the process.
+WISHLISTS_DB = os.environ.get("MODESTA_WISHLISTS_DB", "")
+WISHLIST_MAX_ITEMS = int(os.environ.get("MODESTA_WISHLIST_MAX_ITEMS", "500"))
+WISHLIST_BITSET, WISHLIST_SORTED_IDS = 1, 2
+VISITOR_KEY = "modesta_visitor"
+
+def encode_wishlist(sorted_ids: List[int]) -> bytes:
+    if not sorted_ids:
+        return b""
+    bitset_size = sorted_ids[-1] // 8 + 1
+    if bitset_size <= 4 * len(sorted_ids):
+        bits = bytearray(bitset_size + 1)
+        bits[0] = WISHLIST_BITSET
+        for pid in sorted_ids:
+            bits[1 + (pid >> 3)] |= 1 << (pid & 7)
+        return bytes(bits)
+    return bytes([WISHLIST_SORTED_IDS]) + b"".join(pid.to_bytes(4, "little") for pid in sorted_ids)
+
+class Wishlist:
+    __slots__ = ("version", "_bits", "_ids")
+
+    def __init__(self, version: int = 0, blob: bytes = b""):
+        self.version = version
+        self._bits = memoryview(blob)[1:] if blob and blob[0] == WISHLIST_BITSET else None
+        self._ids = [int.from_bytes(blob[i:i + 4], "little") for i in range(1, len(blob), 4)] \
+            if blob and blob[0] == WISHLIST_SORTED_IDS else []
+
+    def __contains__(self, product_id: int) -> bool:
+        if self._bits is not None:
+            byte = product_id >> 3
+            return 0 <= byte < len(self._bits) and bool(self._bits[byte] >> (product_id & 7) & 1)
+        i = bisect_left(self._ids, product_id)
+        return i < len(self._ids) and self._ids[i] == product_id
+
+    def __iter__(self):
+        if self._bits is None:
+            return iter(self._ids)
+        return (byte * 8 + bit for byte, value in enumerate(self._bits) if value
+                for bit in range(8) if value >> bit & 1)
+
+    def __len__(self) -> int:
+        if self._bits is None:
+            return len(self._ids)
+        return sum(bin(value).count("1") for value in self._bits if value)
+
+class WishlistStore:
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS wishlists (owner_id TEXT PRIMARY KEY, version INTEGER NOT NULL, "
+              "items BLOB NOT NULL, updated_at REAL NOT NULL) WITHOUT ROWID")
+
+    def __init__(self, path: str, max_items: int):
+        self.path = path
+        self.max_items = max_items
+        self._memory: Dict[str, Tuple[int, bytes]] = {}
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._schema_ready:
+            conn.execute(self.SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def get(self, owner_id: str) -> Wishlist:
+        if not self.path:
+            return Wishlist(*self._memory.get(owner_id, (0, b"")))
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT version, items FROM wishlists WHERE owner_id = ?", (owner_id,)).fetchone()
+        finally:
+            conn.close()
+        return Wishlist(*row) if row else Wishlist()
+
+    def set_saved(self, owner_id: str, product_id: int, saved: bool) -> Wishlist:
+        """
+        Saves or unsaves one product; raises ValueError when the list is full.
+        """
+        if not self.path:
+            with self._lock:
+                version, blob = self._change(*self._memory.get(owner_id, (0, b"")), product_id, saved)
+                self._memory[owner_id] = (version, blob)
+            return Wishlist(version, blob)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT version, items FROM wishlists WHERE owner_id = ?", (owner_id,)).fetchone()
+                old_version = row[0] if row else 0
+                version, blob = self._change(*(row or (0, b"")), product_id, saved)
+                if version != old_version:
+                    conn.execute("INSERT OR REPLACE INTO wishlists (owner_id, version, items, updated_at) VALUES (?, ?, ?, ?)",
+                                 (owner_id, version, blob, time.time()))
+        finally:
+            conn.close()
+        return Wishlist(version, blob)
+
+    def _change(self, version: int, blob: bytes, product_id: int, saved: bool) -> Tuple[int, bytes]:
+        current = Wishlist(version, blob)
+        if (product_id in current) == saved:
+            return version, blob
+        ids = list(current)
+        if saved:
+            if len(ids) >= self.max_items:
+                raise ValueError(f"A wishlist holds at most {self.max_items} products")
+            ids.insert(bisect_left(ids, product_id), product_id)
+        else:
+            ids.remove(product_id)
+        return version + 1, encode_wishlist(ids)
+
+WISHLISTS = WishlistStore(WISHLISTS_DB, WISHLIST_MAX_ITEMS)
+
+# Bestseller/Popular badges and the "Trending" sort follow live demand: sales and add-to-cart
+# events bump exponentially decayed counters (O(1), forward decay against a fixed landmark) and a
+# background thread re-ranks every TRENDING_REFRESH_INTERVAL seconds. Pages only read the result.
+# Editorial badges such as "New" still come from the catalog.
+TRENDING_HALF_LIFE = float(os.environ.get("MODESTA_TRENDING_HALF_LIFE", str(3 * 24 * 3600)))
+TRENDING_REFRESH_INTERVAL = float(os.environ.get("MODESTA_TRENDING_REFRESH_INTERVAL", "30"))
+DERIVED_BADGES = ("Bestseller", "Popular")
+BADGE_COUNT = 3
+SALE_WEIGHT = 10.0
+
+class DecayedCounter:
+    def __init__(self, half_life: float):
+        self.rate = math.log(2) / half_life
+        self.landmark = time.time()
+        self.weights: Dict[int, float] = {}
+
+    def add(self, key: int, amount: float = 1.0, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        if self.rate * (now - self.landmark) > 200:
+            # Move the landmark forward before exp() overflows
+            factor = math.exp(-self.rate * (now - self.landmark))
+            self.weights = {k: w * factor for k, w in self.weights.items() if w * factor > 1e-6}
+            self.landmark = now
+        self.weights[key] = self.weights.get(key, 0.0) + amount * math.exp(self.rate * (now - self.landmark))
+
+    def scores(self) -> Dict[int, float]:
+        factor = math.exp(-self.rate * (time.time() - self.landmark))
+        return {k: w * factor for k, w in self.weights.items()}
+
+@dataclass(frozen=True)
+class Rankings:
+    badges: Dict[int, str] = field(default_factory=dict)
+    rank: Dict[int, int] = field(default_factory=dict)
+
+    def badge_for(self, product: Product) -> Optional[str]:
+        return self.badges.get(product.id) or (None if product.badge in DERIVED_BADGES else product.badge)
+
+    def sort(self, products) -> List[Product]:
+        return sorted(products, key=lambda p: self.rank.get(p.id, len(self.rank)))
+
+class Trending:
+    def __init__(self, half_life: float = TRENDING_HALF_LIFE):
+        self.sales = DecayedCounter(half_life)
+        self.interest = DecayedCounter(half_life)
+        self._lock = threading.Lock()
+        self.rankings = Rankings()
+
+    def record_sale(self, product_id: int, quantity: int = 1, now: Optional[float] = None):
+        with self._lock:
+            self.sales.add(product_id, quantity, now)
+
+    def record_interest(self, product_id: int):
+        with self._lock:
+            self.interest.add(product_id)
+
+    def refresh(self):
+        with self._lock:
+            sales, interest = self.sales.scores(), self.interest.scores()
+        scores = dict(interest)
+        for pid, score in sales.items():
+            scores[pid] = scores.get(pid, 0.0) + SALE_WEIGHT * score
+        top = lambda d: sorted((k for k, v in d.items() if v >= 1.0), key=lambda k: (-d[k], k))[:BADGE_COUNT]
+        badges = {pid: "Bestseller" for pid in top(sales)}
+        badges.update({pid: "Popular" for pid in top({k: v for k, v in interest.items() if k not in badges})})
+        ranked = sorted(scores, key=lambda k: (-scores[k], k))
+        self.rankings = Rankings(badges, {pid: i for i, pid in enumerate(ranked)})
+
+    def load_order_history(self, db_path: str):
+        if not db_path or not os.path.exists(db_path):
+            return
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute("SELECT o.created_at, i.product_id, i.quantity FROM order_items i "
+                                "JOIN orders o ON o.id = i.order_pk").fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+        finally:
+            conn.close()
+        for created_at, product_id, quantity in rows:
+            self.record_sale(product_id, quantity, datetime.fromisoformat(created_at).timestamp())
+        self.refresh()
+
+    def start_refresher(self, interval: float = TRENDING_REFRESH_INTERVAL):
+        def run():
+            while True:
+                time.sleep(interval)
+                self.refresh()
+        threading.Thread(target=run, name="trending-refresher", daemon=True).start()
+
+TRENDING = Trending()
+
+# Token buckets (rate per second, burst) keyed by client IP and by session, in a bounded LRU.
+# Over-limit actions are refused with a toast before any rendering or order work happens.
+RATE_LIMITS = {
+    "add_to_cart": (2.0, 20),
+    "wishlist": (2.0, 20),
+    "login": (5 / 60, 10),
+    "order": (5 / 60, 5),
+}
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("MODESTA_RATE_LIMIT_MAX_KEYS", "100000"))
+
+class RateLimiter:
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, action: str, *keys: str) -> bool:
+        rate, burst = RATE_LIMITS[action]
+        now = time.monotonic()
+        with self._lock:
+            buckets = []
+            for key in keys:
+                bucket = self._buckets.get(f"{action}:{key}")
+                if bucket is None:
+                    bucket = self._buckets[f"{action}:{key}"] = [float(burst), now]
+                    if len(self._buckets) > self.max_keys:
+                        self._buckets.popitem(last=False)
+                else:
+                    self._buckets.move_to_end(f"{action}:{key}")
+                    bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                    bucket[1] = now
+                buckets.append(bucket)
+            # Every bucket (IP and session) must have a token; only then are they spent
+            if any(bucket[0] < 1 for bucket in buckets):
+                return False
+            for bucket in buckets:
+                bucket[0] -= 1
+        return True
+
+RATE_LIMITER = RateLimiter()
+
+# Heavy product content (gallery, size chart, long description) stays out of the catalog so
+# listing pages only touch card fields. It is read from <MODESTA_PRODUCT_DETAILS>/<id>.json (same
+# files as "Fast Api/data/products") when a detail page opens, and cached per product and mtime.
+PRODUCT_DETAILS_DIR = os.environ.get("MODESTA_PRODUCT_DETAILS", "")
+
+@dataclass(frozen=True)
+class ProductDetails:
+    images: tuple
+    long_description: str
+    size_chart: tuple = ()
+
+@functools.lru_cache(maxsize=1024)
+def _read_details(path: str, mtime: float) -> Optional[ProductDetails]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return ProductDetails(tuple(data.get("images", ())), data.get("long_description", ""),
+                              tuple(dict(row) for row in data.get("size_chart", ())))
+    except (OSError, ValueError, TypeError, AttributeError) as exc:
+        log.warning("Invalid product details %s: %s", path, exc)
+        return None
+
+def product_details(product: Product) -> ProductDetails:
+    details = None
+    if PRODUCT_DETAILS_DIR:
+        path = os.path.join(PRODUCT_DETAILS_DIR, f"{product.id}.json")
+        try:
+            details = _read_details(path, os.path.getmtime(path))
+        except OSError:
+            pass
+    if details is None:
+        return ProductDetails((product.image_url,), product.description)
+    return ProductDetails(details.images or (product.image_url,), details.long_description or product.description,
+                          details.size_chart)
+
+# Display currencies use rates from MODESTA_FX_RATES (same file as "Fast Api/data/fx_rates.json"),
+# reloaded when it changes; each (catalog, rates, currency, locale) gets one precomputed table of
+# converted, formatted prices shared by all sessions. Amounts are shop_pricing's piastre Decimals.
+FX_RATES_PATH = os.environ.get("MODESTA_FX_RATES", "")
+class FxRates:
+    """
+    Units of each currency per EGP, with hot reload; a broken file keeps the previous rates.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.version = 1
+        self.rates = {BASE_CURRENCY: Decimal(1)}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def reload(self) -> bool:
+        if not self.path:
+            return False
+        with self._lock:
+            mtime = None
+            try:
+                mtime = os.path.getmtime(self.path)
+                with open(self.path, encoding="utf-8") as f:
+                    data = json.load(f)
+                rates = {BASE_CURRENCY: Decimal(1)}
+                rates.update((code, Decimal(str(rate))) for code, rate in data["rates"].items() if code in CURRENCIES)
+                if data.get("base", BASE_CURRENCY) != BASE_CURRENCY or any(r <= 0 for r in rates.values()):
+                    raise ValueError("rates must be positive and quoted against EGP")
+            except (OSError, ValueError, KeyError, TypeError, AttributeError, InvalidOperation) as exc:
+                log.error("FX rates reload failed, keeping version %s: %s", self.version, exc)
+                self._mtime = mtime or self._mtime
+                return False
+            self.rates = rates
+            self.version += 1
+            self._mtime = mtime
+        return True
+
+    def rate(self, currency: str) -> Decimal:
+        return self.rates.get(currency, Decimal(1))
+
+    def start_watcher(self, interval: float = CATALOG_WATCH_INTERVAL):
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    changed = os.path.getmtime(self.path) != self._mtime
+                except OSError:
+                    changed = False
+                if changed:
+                    self.reload()
+        if self.path and interval > 0:
+            threading.Thread(target=watch, name="fx-watcher", daemon=True).start()
+
+FX = FxRates(FX_RATES_PATH)
+
+def convert_money(amount: Decimal, rate: Decimal) -> Decimal:
+    return (amount * rate).quantize(CENT, rounding=ROUND_HALF_UP)
+
+@functools.lru_cache(maxsize=32)
+def _price_table(snapshot: CatalogSnapshot, rate: Decimal, currency: str, locale: str) -> Dict[int, str]:
+    return {p.id: format_money(convert_money(to_money(p.price), rate), currency, locale) for p in snapshot.products}
+
+def price_labels(currency: str, locale: str) -> Dict[int, str]:
+    """
+    Formatted price of every product in the current catalog; built once per catalog, rate, currency and locale.
+    """
+    return _price_table(CATALOG.current(), FX.rate(currency), currency, locale)
+
+STRINGS = {
+    "en": {"home": "Home", "cart": "Cart", "add": "Add", "details": "Details", "add_to_cart": "Add to Cart",
+           "often_bought_with": "Often bought with", "featured": "Featured", "trending": "Trending",
+           "total": "Total", "cart_empty": "Your cart is empty", "you_may_also_like": "You may also like",
+           "proceed": "Proceed to Checkout", "size_chart": "Size chart", "language": "عربي",
+           "coupon": "Coupon code", "apply": "Apply", "coupon_not_applicable": "This code doesn't apply to your cart",
+           "confirm_order": "Confirm Order", "saved": "Saved", "save_for_later": "Save for later",
+           "saved_empty": "Nothing saved yet", "account": "Account", "hello": "Hi", "sign_in": "Sign in",
+           "sign_out": "Sign out", "register": "Create account", "saved_addresses": "Saved addresses",
+           "new_address": "New address", "save_address": "Save this address to my account", "email": "Email",
+           "password": "Password"},
+    "ar": {"home": "الرئيسية", "cart": "السلة", "add": "أضف", "details": "التفاصيل", "add_to_cart": "أضف إلى السلة",
+           "often_bought_with": "يُشترى غالباً مع", "featured": "المميز", "trending": "الأكثر رواجاً",
+           "total": "الإجمالي", "cart_empty": "سلتك فارغة", "you_may_also_like": "قد يعجبك أيضاً",
+           "proceed": "إتمام الشراء", "size_chart": "جدول المقاسات", "language": "English",
+           "coupon": "كود الخصم", "apply": "تطبيق", "coupon_not_applicable": "هذا الكود لا ينطبق على سلتك",
+           "confirm_order": "تأكيد الطلب", "saved": "المحفوظات", "save_for_later": "احفظ لوقت لاحق",
+           "saved_empty": "لا توجد منتجات محفوظة بعد", "account": "حسابي", "hello": "أهلاً",
+           "sign_in": "تسجيل الدخول", "sign_out": "تسجيل الخروج", "register": "إنشاء حساب",
+           "saved_addresses": "العناوين المحفوظة", "new_address": "عنوان جديد",
+           "save_address": "احفظ هذا العنوان في حسابي", "email": "البريد الإلكتروني", "password": "كلمة المرور"},
+}
+
+# Promotions: rules from MODESTA_PROMOTIONS (same file as "Fast Api/data/promotions.json"),
+# compiled and indexed by shop_pricing once per file version and swapped in on change.
+PROMOTIONS_PATH = os.environ.get("MODESTA_PROMOTIONS", "")
+
+class Promotions:
+    """
+    Current PromotionIndex with hot reload; a broken file keeps the previous rules.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._index = PromotionIndex(1, [])
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def current(self) -> PromotionIndex:
+        return self._index
+
+    def reload(self) -> bool:
+        if not self.path:
+            return False
+        with self._lock:
+            mtime = None
+            try:
+                mtime = os.path.getmtime(self.path)
+                with open(self.path, encoding="utf-8") as f:
+                    rows = json.load(f)["rules"]
+                rules = compile_promotions(rows)
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as exc:
+                log.error("Promotions reload failed, keeping version %s: %s", self._index.version, exc)
+                self._mtime = mtime or self._mtime
+                return False
+            self._index = PromotionIndex(self._index.version + 1, rules)
+            self._mtime = mtime
+        return True
+
+    def start_watcher(self, interval: float = CATALOG_WATCH_INTERVAL):
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    changed = os.path.getmtime(self.path) != self._mtime
+                except OSError:
+                    changed = False
+                if changed:
+                    self.reload()
+        if self.path and interval > 0:
+            threading.Thread(target=watch, name="promotions-watcher", daemon=True).start()
+
+PROMOTIONS = Promotions(PROMOTIONS_PATH)
+
+# Checkout doesn't block the session: the form is made of pins and sent with a button, so the
+# header, cart and coupon stay usable while it is open. On submit the field checks run at the
+# same time on a shared pool (they are independent, so a slow one such as an address lookup
+# doesn't add to the others), and the order goes through the backend pipeline (order store,
+# co-purchases, trending) on its own pool. Sessions await both, so the event loop keeps serving
+# every other shopper meanwhile.
+CHECKOUT_WORKERS = int(os.environ.get("MODESTA_CHECKOUT_WORKERS", "8"))
+ORDER_WORKERS = int(os.environ.get("MODESTA_ORDER_WORKERS", "4"))
+CHECKOUT_CITIES = ["Cairo", "Alexandria", "Giza"]
+PHONE_RE = re.compile(r"^(?:\+?20|0)?1[0125]\d{8}$")
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s.]{2,}$")
+VALIDATION_POOL = ThreadPoolExecutor(CHECKOUT_WORKERS, thread_name_prefix="checkout-check")
+ORDER_POOL = ThreadPoolExecutor(ORDER_WORKERS, thread_name_prefix="order-pipeline")
+
+def check_name(info: dict) -> Optional[str]:
+    return None if len(info.get("name", "")) >= 3 else "Please enter your full name"
+
+def check_phone(info: dict) -> Optional[str]:
+    phone = re.sub(r"[\s()-]", "", info.get("phone", ""))
+    return None if PHONE_RE.match(phone) else "Enter a mobile number such as 01012345678"
+
+def check_email(info: dict) -> Optional[str]:
+    # Optional, but a typo would lose the confirmation
+    email = info.get("email", "")
+    return None if not email or EMAIL_RE.match(email) else "This email address looks incomplete"
+
+def check_address(info: dict) -> Optional[str]:
+    if info.get("city") not in CHECKOUT_CITIES:
+        return "We don't deliver to this city yet"
+    return None if len(info.get("address", "").split()) >= 3 else "Please add street, building and area"
+
+CHECKOUT_CHECKS = {"name": check_name, "phone": check_phone, "email": check_email, "address": check_address}
+
+async def validate_checkout(info: dict) -> Dict[str, str]:
+    """
+    {field: message} for every field that fails; all checks run concurrently.
+    """
+    errors = await asyncio.gather(*(off_loop(VALIDATION_POOL, check, info) for check in CHECKOUT_CHECKS.values()))
+    return {field: "Please check this field" if isinstance(error, Failed) else error
+            for field, error in zip(CHECKOUT_CHECKS, errors) if error}
+
+def place_order(order_id: str, info: dict, items: List[CartItem], pricing, created_at: datetime) -> str:
+    order = Cart()
+    order.items = items
+    record_order(order_id, info, order, pricing, created_at)
+    RECOMMENDER.add_basket([item.product.id for item in items])
+    for item in items:
+        TRENDING.record_sale(item.product.id, item.quantity)
+    return order_id
+
+# Customer accounts with saved addresses, in MODESTA_ACCOUNTS_DB (same tables and password format
+# as "Fast Api/accounts.py", so one account works in both stores). Passwords are hashed with
+# scrypt on PASSWORD_POOL, off the event loop and bounded in memory (128 * 8 * N bytes per hash).
+# A sign-in is kept in the browser's localStorage as an HMAC-signed token, so a returning session
+# is restored with a signature check rather than a store lookup. Like the other stores, accounts
+# are off unless configured: they need MODESTA_ACCOUNTS_DB and a signing key (MODESTA_SESSION_SECRET,
+# or MODESTA_SESSION_SECRET_FILE, created on first use).
+ACCOUNTS_DB = os.environ.get("MODESTA_ACCOUNTS_DB", "")
+SESSION_SECRET = os.environ.get("MODESTA_SESSION_SECRET", "")
+SESSION_SECRET_FILE = os.environ.get("MODESTA_SESSION_SECRET_FILE", "")
+ACCOUNTS_ENABLED = bool(ACCOUNTS_DB and (SESSION_SECRET or SESSION_SECRET_FILE))
+SESSION_TTL = float(os.environ.get("MODESTA_SESSION_TTL_DAYS", "30")) * 24 * 3600
+PASSWORD_SCRYPT_N = int(os.environ.get("MODESTA_PASSWORD_SCRYPT_N", str(2 ** 15)))
+PASSWORD_WORKERS = int(os.environ.get("MODESTA_PASSWORD_WORKERS", "4"))
+ACCOUNT_MAX_ADDRESSES = int(os.environ.get("MODESTA_ACCOUNT_MAX_ADDRESSES", "10"))
+MIN_PASSWORD_LENGTH = 8
+SESSION_KEY = "modesta_session"
+PASSWORD_POOL = ThreadPoolExecutor(PASSWORD_WORKERS, thread_name_prefix="password-hash")
+
+ACCOUNTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY, email TEXT NOT NULL UNIQUE COLLATE NOCASE, name TEXT NOT NULL,
+    phone TEXT NOT NULL, password_hash TEXT NOT NULL, created_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS addresses (
+    id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    label TEXT NOT NULL, name TEXT NOT NULL, phone TEXT NOT NULL, governorate TEXT,
+    address TEXT NOT NULL, created_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_addresses_user ON addresses(user_id);
+"""
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=256 * r * n, dklen=32)
+
+def hash_password(password: str) -> str:
+    salt = secrets.token_bytes(16)
+    return f"scrypt${PASSWORD_SCRYPT_N}$8$1${_b64(salt)}${_b64(_scrypt(password, salt, PASSWORD_SCRYPT_N, 8, 1))}"
+
+def verify_password(password: str, stored: str) -> bool:
+    try:
+        scheme, n, r, p, salt, digest = stored.split("$")
+        return scheme == "scrypt" and hmac.compare_digest(_scrypt(password, _unb64(salt), int(n), int(r), int(p)),
+                                                          _unb64(digest))
+    except ValueError:
+        return False
+
+@functools.lru_cache(maxsize=1)
+def dummy_password_hash() -> str:
+    # Checked for unknown emails, so a sign-in takes as long whether or not the account exists
+    return hash_password(secrets.token_urlsafe(16))
+
+@functools.lru_cache(maxsize=1)
+def session_secret() -> bytes:
+    if SESSION_SECRET:
+        return SESSION_SECRET.encode("utf-8")
+    try:
+        with open(SESSION_SECRET_FILE, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        key = secrets.token_urlsafe(32).encode("ascii")
+        fd = os.open(SESSION_SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+        return key
+
+def issue_session(user_id: int, name: str) -> str:
+    payload = _b64(json.dumps({"u": user_id, "n": name, "e": int(time.time() + SESSION_TTL)},
+                              separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    return f"{payload}.{_b64(hmac.new(session_secret(), payload.encode('ascii'), hashlib.sha256).digest())}"
+
+def read_session(token) -> Optional[Tuple[int, str]]:
+    """
+    (user id, name) from a signed token, or None when missing, forged or expired. No store lookup.
+    """
+    if not isinstance(token, str) or "." not in token:
+        return None
+    payload, signature = token.rsplit(".", 1)
+    try:
+        expected = _b64(hmac.new(session_secret(), payload.encode("ascii"), hashlib.sha256).digest())
+        if not hmac.compare_digest(expected, signature):
+            return None
+        data = json.loads(_unb64(payload))
+    except (TypeError, ValueError):
+        return None
+    return (data["u"], data["n"]) if data.get("e", 0) >= time.time() else None
+
+class AccountStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._schema_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA foreign_keys=ON")
+        if not self._schema_ready:
+            conn.executescript(ACCOUNTS_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def register(self, email: str, password: str, name: str, phone: str) -> Tuple[Optional[Tuple[int, str]], Optional[str]]:
+        """
+        Runs on PASSWORD_POOL; ((user id, name), None), or (None, a message for the form). Returned rather
+        than raised: a coroutine session doesn't see exceptions from an executor future.
+        """
+        if not EMAIL_RE.match(email):
+            return None, "Please enter a valid email"
+        if len(password) < MIN_PASSWORD_LENGTH:
+            return None, f"Passwords need at least {MIN_PASSWORD_LENGTH} characters"
+        if len(name) < 2 or not phone:
+            return None, "Please enter your name and phone number"
+        password_hash = hash_password(password)
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.execute(
+                    "INSERT INTO users (email, name, phone, password_hash, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (email, name, phone, password_hash, time.time()))
+        except sqlite3.IntegrityError:
+            return None, "An account with this email already exists"
+        finally:
+            conn.close()
+        return (cursor.lastrowid, name), None
+
+    def login(self, email: str, password: str) -> Optional[Tuple[int, str]]:
+        """
+        Runs on PASSWORD_POOL; (user id, name) when the password matches.
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT id, name, password_hash FROM users WHERE email = ?", (email,)).fetchone()
+        finally:
+            conn.close()
+        ok = verify_password(password, row[2] if row else dummy_password_hash())
+        return (row[0], row[1]) if row and ok else None
+
+    def addresses(self, user_id: int) -> List[dict]:
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT id, label, name, phone, governorate, address FROM addresses "
+                                "WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+        finally:
+            conn.close()
+        return [dict(zip(("id", "label", "name", "phone", "governorate", "address"), row)) for row in rows]
+
+    def add_address(self, user_id: int, info: dict):
+        conn = self._connect()
+        try:
+            with conn:
+                count = conn.execute("SELECT COUNT(*) FROM addresses WHERE user_id = ?", (user_id,)).fetchone()[0]
+                if count < ACCOUNT_MAX_ADDRESSES:
+                    conn.execute("INSERT INTO addresses (user_id, label, name, phone, governorate, address, created_at) "
+                                 "VALUES (?, 'Home', ?, ?, ?, ?, ?)",
+                                 (user_id, info['name'], info['phone'], info['city'], info['address'], time.time()))
+        finally:
+            conn.close()
+
+    def delete_address(self, user_id: int, address_id: int):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM addresses WHERE user_id = ? AND id = ?", (user_id, address_id))
+        finally:
+            conn.close()
+
+ACCOUNTS = AccountStore(ACCOUNTS_DB)
+
+# Invoices: every order gets a printable HTML invoice and an email-ready receipt (plain text +
+# HTML, as a .eml message) in MODESTA_INVOICE_OUTBOX/<order id>/, for the mailer to pick up.
+# Rendering runs in a process pool, so building documents never competes with the sessions for
+# the interpreter. Worker processes compile the templates once, and a document whose content
+# (and templates) haven't changed since the last render is not written again. Admins regenerate
+# in bulk with POST /admin/invoices/regenerate.
+INVOICE_OUTBOX = os.environ.get("MODESTA_INVOICE_OUTBOX", "outbox")
+INVOICE_WORKERS = int(os.environ.get("MODESTA_INVOICE_WORKERS", "2"))
+MAIL_FROM = os.environ.get("MODESTA_MAIL_FROM", "Modesta <orders@modesta.com>")
+
+INVOICE_HTML = """<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>Invoice $order_id - Modesta</title>
+<style>
+    body { font-family: 'Tajawal', Arial, sans-serif; color: #2d3436; max-width: 720px; margin: 40px auto; padding: 0 20px; }
+    h1 { font-family: 'Playfair Display', Georgia, serif; color: #e84393; margin-bottom: 0; }
+    table { width: 100%; border-collapse: collapse; margin-top: 25px; }
+    th, td { padding: 8px 6px; border-bottom: 1px solid #eee; text-align: left; }
+    .num { text-align: right; }
+    tfoot td { font-weight: bold; border-bottom: none; }
+    .discount td { color: #27ae60; font-weight: normal; }
+    .muted { color: #888; font-size: 13px; }
+    @media print { body { margin: 0; } .no-print { display: none; } }
+</style></head>
+<body>
+    <h1>Modesta</h1>
+    <p class="muted">Invoice $order_id &middot; $date</p>
+    <p><strong>$customer</strong><br>$phone<br>$address</p>
+    <table>
+        <thead><tr><th>Item</th><th class="num">Qty</th><th class="num">Unit price</th><th class="num">Amount</th></tr></thead>
+        <tbody>$rows</tbody>
+        <tfoot>$totals</tfoot>
+    </table>
+    <p class="muted">Amounts in $currency. Thank you for shopping with Modesta.</p>
+    <button class="no-print" onclick="window.print()">Print</button>
+</body></html>
+"""
+INVOICE_ROW = '<tr><td>$name</td><td class="num">$quantity</td><td class="num">$unit</td><td class="num">$amount</td></tr>'
+INVOICE_TOTAL = '<tr class="$kind"><td colspan="3">$label</td><td class="num">$amount</td></tr>'
+RECEIPT_TEXT = """Thank you for your order, $customer!
+
+Order $order_id, $date
+
+$lines
+
+Total: $total $currency
+
+We'll call $phone to arrange delivery to:
+$address
+
+Modesta - Where Modesty Meets Elegance
+"""
+INVOICE_TEMPLATES_DIGEST = hashlib.sha256(
+    "".join((INVOICE_HTML, INVOICE_ROW, INVOICE_TOTAL, RECEIPT_TEXT)).encode()).hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def invoice_templates() -> Dict[str, string.Template]:
+    # Compiled once per worker process
+    return {"html": string.Template(INVOICE_HTML), "row": string.Template(INVOICE_ROW),
+            "total": string.Template(INVOICE_TOTAL), "text": string.Template(RECEIPT_TEXT)}
+
+def invoice_document(order_id: str, info: dict, items: List[CartItem], pricing, created_at: Optional[datetime] = None) -> dict:
+    """
+    Everything an invoice shows, as plain (picklable) data; amounts are EGP strings.
+    """
+    return {
+        "order_id": order_id,
+        "date": (created_at or datetime.now(timezone.utc)).strftime("%Y-%m-%d %H:%M UTC"),
+        "customer": info.get("name", ""),
+        "phone": info.get("phone", ""),
+        "email": info.get("email", ""),
+        "address": ", ".join(part for part in (info.get("address"), info.get("city")) if part),
+        "currency": BASE_CURRENCY,
+        "lines": [[item.product.name, item.quantity, str(to_money(item.product.price)), str(item.total_price)]
+                  for item in items],
+        "discounts": [[label, str(amount)] for label, amount in pricing.discounts],
+        "total": str(pricing.total),
+    }
+
+def _write_file(path: str, data: bytes):
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+def render_invoice(doc: dict, force: bool = False, outbox: str = INVOICE_OUTBOX) -> Tuple[str, str]:
+    """
+    Runs in a worker process: writes invoice.html, receipt.txt and receipt.eml; returns (status, directory).
+    """
+    directory = os.path.join(outbox, re.sub(r"[^\w-]", "_", doc["order_id"]))
+    digest = hashlib.sha256((INVOICE_TEMPLATES_DIGEST + json.dumps(doc, sort_keys=True)).encode()).hexdigest()
+    digest_path = os.path.join(directory, ".digest")
+    if not force and os.path.exists(digest_path):
+        with open(digest_path) as f:
+            if f.read() == digest:
+                return "cached", directory
+    os.makedirs(directory, exist_ok=True)
+
+    templates = invoice_templates()
+    e = {key: html.escape(str(value)) for key, value in doc.items() if not isinstance(value, list)}
+    rows = "".join(templates["row"].substitute(name=html.escape(name), quantity=qty, unit=unit, amount=amount)
+                   for name, qty, unit, amount in doc["lines"])
+    totals = [("subtotal", "Subtotal", str(sum((Decimal(line[3]) for line in doc["lines"]), Decimal("0.00"))))]
+    totals += [("discount", html.escape(label), f"-{amount}") for label, amount in doc["discounts"]]
+    totals.append(("total", "Total", doc["total"]))
+    invoice = templates["html"].substitute(e, rows=rows, totals="".join(
+        templates["total"].substitute(kind=kind, label=label, amount=amount) for kind, label, amount in totals))
+    lines = "\n".join(f"  {qty} x {name}  {amount}" for name, qty, _, amount in doc["lines"])
+    lines += "".join(f"\n  {label}  -{amount}" for label, amount in doc["discounts"])
+    text = templates["text"].substitute(doc, lines=lines)
+
+    message = EmailMessage()
+    message["Subject"] = f"Your Modesta order {doc['order_id']}"
+    message["From"] = MAIL_FROM
+    if doc.get("email"):
+        message["To"] = doc["email"]
+    message.set_content(text)
+    message.add_alternative(invoice, subtype="html")
+
+    _write_file(os.path.join(directory, "invoice.html"), invoice.encode("utf-8"))
+    _write_file(os.path.join(directory, "receipt.txt"), text.encode("utf-8"))
+    _write_file(os.path.join(directory, "receipt.eml"), bytes(message))
+    # Written last: a render cut short is redone next time
+    _write_file(digest_path, digest.encode())
+    return "rendered", directory
+
+def render_order_invoice(doc: dict) -> Optional[bytes]:
+    """
+    Worker-side wrapper for checkout: the rendered invoice.html, or None when rendering failed.
+    Errors are caught here because an exception raised in an executor never reaches the awaiting session.
+    """
+    try:
+        _, directory = render_invoice(doc)
+        with open(os.path.join(directory, "invoice.html"), "rb") as f:
+            return f.read()
+    except Exception:
+        log.exception("Invoice for %s failed", doc.get("order_id"))
+        return None
+
+def load_invoice_documents(order_ids: Optional[List[str]] = None, day: Optional[str] = None) -> List[dict]:
+    """
+    Invoice documents rebuilt from the order store, with the email and discount lines the order was placed with.
+    """
+    if not ORDERS_DB or not os.path.exists(ORDERS_DB):
+        return []
+    where, args = [], []
+    if order_ids:
+        where.append(f"order_id IN ({','.join('?' * len(order_ids))})")
+        args.extend(order_ids)
+    if day:
+        where.append("day = ?")
+        args.append(day)
+    conn = sqlite3.connect(ORDERS_DB, timeout=10)
+    try:
+        migrate_orders(conn)
+        orders = conn.execute(
+            "SELECT id, order_id, created_at, customer, phone, address, total, email FROM orders"
+            + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id", args).fetchall()
+        docs = []
+        for pk, order_id, created_at, customer, phone, address, total, email in orders:
+            items = conn.execute("SELECT name, quantity, unit_price, line_total FROM order_items WHERE order_pk = ?",
+                                 (pk,)).fetchall()
+            lines = [[name, qty, str(to_money(unit)), str(to_money(unit) * qty)] for name, qty, unit, _ in items]
+            discounts = [[label, str(to_money(amount))] for label, amount in conn.execute(
+                "SELECT label, amount FROM order_discounts WHERE order_pk = ? ORDER BY rowid", (pk,))]
+            if not discounts:
+                # Orders recorded before discount lines were stored: the total difference, as one line
+                discount = sum((Decimal(line[3]) for line in lines), Decimal("0.00")) - \
+                    sum((to_money(line_total) for *_, line_total in items), Decimal("0.00"))
+                discounts = [["Discounts", str(discount)]] if discount > 0 else []
+            docs.append({
+                "order_id": order_id,
+                "date": datetime.fromisoformat(created_at).strftime("%Y-%m-%d %H:%M UTC"),
+                "customer": customer, "phone": phone, "email": email or "", "address": address,
+                "currency": BASE_CURRENCY, "lines": lines, "discounts": discounts,
+                "total": str(to_money(total)),
+            })
+    finally:
+        conn.close()
+    return docs
+
+_invoice_pool: Optional[ProcessPoolExecutor] = None
+_invoice_pool_lock = threading.Lock()
+
+def invoice_pool() -> ProcessPoolExecutor:
+    # Started on first use; spawned (not forked) workers, since the server already runs threads by then
+    global _invoice_pool
+    with _invoice_pool_lock:
+        if _invoice_pool is None:
+            _invoice_pool = ProcessPoolExecutor(INVOICE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _invoice_pool
+
+def regenerate_invoices(docs: List[dict], force: bool = False) -> Dict[str, int]:
+    counts = {"rendered": 0, "cached": 0, "failed": 0}
+    futures = [invoice_pool().submit(render_invoice, doc, force) for doc in docs]
+    for future in as_completed(futures):
+        try:
+            counts[future.result()[0]] += 1
+        except Exception:
+            counts["failed"] += 1
+    return counts
+
 # ==========================================
-# 2. UI / PRESENTATION LAYER
+# 2. METRICS & PROFILING
 # ==========================================
 
-class UI:
-    @staticmethod
-    def get_styles():
+METRICS_PORT = int(os.environ.get("MODESTA_METRICS_PORT", "5001"))
+ADMIN_TOKEN = os.environ.get("MODESTA_ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = 60
+CALLBACK_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class SessionMetrics:
+    """
+    Session counts and per-callback latency, rendered in the Prometheus text format
+    (same naming scheme as the FastAPI /metrics endpoint).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active_sessions = 0
+        self.sessions_total = 0
+        # callback name -> [count per bucket..., +Inf count, sum of seconds]
+        self.callbacks: Dict[str, list] = {}
+
+    def session_opened(self):
+        with self.lock:
+            self.active_sessions += 1
+            self.sessions_total += 1
+
+    def session_closed(self):
+        with self.lock:
+            self.active_sessions -= 1
+
+    def observe_callback(self, name: str, seconds: float):
+        with self.lock:
+            state = self.callbacks.get(name)
+            if state is None:
+                state = self.callbacks[name] = [0] * (len(CALLBACK_BUCKETS) + 1) + [0.0]
+            state[bisect_left(CALLBACK_BUCKETS, seconds)] += 1
+            state[-1] += seconds
+
+    def render(self) -> str:
+        with self.lock:
+            lines = [
+                "# HELP modesta_pywebio_sessions_active PyWebIO sessions currently open",
+                "# TYPE modesta_pywebio_sessions_active gauge",
+                f"modesta_pywebio_sessions_active {self.active_sessions}",
+                "# HELP modesta_pywebio_sessions_total PyWebIO sessions opened",
+                "# TYPE modesta_pywebio_sessions_total counter",
+                f"modesta_pywebio_sessions_total {self.sessions_total}",
+                "# HELP modesta_pywebio_callback_duration_seconds ShopController callback latency",
+                "# TYPE modesta_pywebio_callback_duration_seconds histogram",
+            ]
+            name = "modesta_pywebio_callback_duration_seconds"
+            for callback, state in sorted(self.callbacks.items()):
+                cumulative = 0
+                for bound, count in zip(CALLBACK_BUCKETS + ("+Inf",), state[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{callback="{callback}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{callback="{callback}"}} {state[-1]}')
+                lines.append(f'{name}_count{{callback="{callback}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+METRICS = SessionMetrics()
+
+# Names of every ShopController callback, used to focus the profiler
+CALLBACK_NAMES = set()
+
+def timed_callback(func):
+    """
+    Records how long a ShopController callback takes to run.
+    """
+    CALLBACK_NAMES.add(func.__name__)
+
+    def touch(args):
+        slot = getattr(args[0], "slot", None) if args else None
+        if slot is not None:
+            slot.touch()
+
+    if asyncio.iscoroutinefunction(func):
+        # Includes the time spent awaiting I/O, i.e. what the shopper waits for
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            touch(args)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                METRICS.observe_callback(func.__name__, time.perf_counter() - start)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        touch(args)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            METRICS.observe_callback(func.__name__, time.perf_counter() - start)
+    return wrapper
+
+class Failed:
+    """
+    What off_loop() returns instead of a result when the call raised.
+    """
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+async def off_loop(pool, func, *args):
+    """
+    Runs func(*args) on `pool` (None: the default executor); its result, or a Failed if it raised.
+    The error is caught in the worker because a coroutine session resolves executor futures in a
+    loop callback: an exception never reaches the awaiting callback, which would just stop.
+    """
+    def call():
+        try:
+            return func(*args)
+        except Exception as exc:
+            log.exception("%s failed", getattr(func, "__qualname__", func))
+            return Failed(exc)
+    return await asyncio.get_running_loop().run_in_executor(pool, call)
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads (the sessions' event loop and the worker
+    pools) every `interval` seconds and
+    counts the ones passing through a ShopController callback. Output is in
+    the collapsed-stack format used by flamegraph.pl and speedscope.
+    """
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+
+    def run_for(self, seconds: float):
+        deadline = time.monotonic() + seconds
+        me = threading.get_ident()
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                hit = False
+                while frame is not None:
+                    code = frame.f_code
+                    hit = hit or code.co_name in CALLBACK_NAMES
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if hit:
+                    self.stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            self.send_text(METRICS.render() + ADMISSION.render(), "text/plain; version=0.0.4")
+        elif url.path == "/admin/profile":
+            self.profile(parse_qs(url.query))
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/admin/catalog/reload":
+            if not self.is_admin(query):
+                self.send_error(403)
+                return
+            if not CATALOG.reload():
+                self.send_error(422, "Catalog reload failed")
+                return
+            snapshot = CATALOG.current()
+            self.send_text(json.dumps({"status": "success", "version": snapshot.version,
+                                       "products": len(snapshot.products)}), "application/json")
+        elif url.path == "/admin/invoices/regenerate":
+            self.regenerate_invoices(query)
+        else:
+            self.send_error(404)
+
+    def is_admin(self, query) -> bool:
+        token = self.headers.get("X-Admin-Token") or query.get("token", [""])[0]
+        return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+    def regenerate_invoices(self, query):
+        """
+        /admin/invoices/regenerate?orders=MOD-1,MOD-2 or ?day=YYYY-MM-DD (&force=1 to re-render unchanged ones)
+        """
+        if not self.is_admin(query):
+            self.send_error(403)
+            return
+        order_ids = [o for o in query.get("orders", [""])[0].split(",") if o] or None
+        day = query.get("day", [None])[0]
+        if not order_ids and not day:
+            self.send_error(400, "Give orders=... or day=YYYY-MM-DD")
+            return
+        docs = load_invoice_documents(order_ids, day)
+        counts = regenerate_invoices(docs, force=query.get("force", ["0"])[0] == "1")
+        self.send_text(json.dumps({"orders": len(docs), **counts, "outbox": INVOICE_OUTBOX}), "application/json")
+
+    def profile(self, query):
+        """
+        /admin/profile?seconds=N&token=... samples the callbacks for N seconds
+        """
+        if not self.is_admin(query):
+            self.send_error(403)
+            return
+        try:
+            seconds = min(float(query.get("seconds", ["10"])[0]), PROFILE_MAX_SECONDS)
+        except ValueError:
+            self.send_error(400)
+            return
+        profiler = SamplingProfiler()
+        profiler.run_for(seconds)
+        self.send_text(profiler.collapsed(), "text/plain", {"Content-Disposition": 'attachment; filename="profile.folded"'})
+
+    def send_text(self, text: str, content_type: str, headers: Optional[Dict[str, str]] = None):
+        body = text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """
+    Serves /metrics and the /admin/... endpoints from a daemon thread next to the PyWebIO server.
+    """
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ==========================================
+# 3. UI / PRESENTATION LAYER
+# ==========================================
+
+# Fonts and icons: point MODESTA_ASSETS_DIR at the FastAPI app's build (`python assets.py build`
+# there writes Tajawal/Playfair WOFF2 subsets and an SVG sprite of the icons used here). The
+# directory is served as /static/ with hashed names and ?v=, which tornado caches for years, so
+# the Google Fonts and Font Awesome CDNs (and their full icon font) drop out of the first load.
+# Without a build the pages use the CDNs.
+ASSETS_DIR = os.environ.get("MODESTA_ASSETS_DIR", "")
+
+
+def load_asset_manifest(directory: str) -> dict:
+    try:
+        with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+ASSET_MANIFEST = load_asset_manifest(ASSETS_DIR) if ASSETS_DIR else {}
+ICON_NAMES = set(ASSET_MANIFEST.get("icons", []))
+
+
+def asset_url(filename: str) -> str:
+    # The name already carries the content hash; ?v= is what makes tornado send the long cache headers
+    return f"/static/{filename}?v={filename.split('.')[-2]}"
+
+
+def icon(name: str, classes: str = "", style: str = "") -> str:
+    """
+    Sprite reference for a Font Awesome icon (name with or without "fa-"), or the icon font's <i> without a build.
+    """
+    name = name[3:] if name.startswith("fa-") else name
+    style_attr = f' style="{style}"' if style else ""
+    if name in ICON_NAMES:
+        sprite = asset_url(ASSET_MANIFEST["files"]["icons.svg"])
+        return f'<svg class="{" ".join(["icon", classes]).strip()}" aria-hidden="true"{style_attr}><use href="{sprite}#fa-{name}"></use></svg>'
+    font_classes = " ".join(["fas", f"fa-{name}", classes.replace("icon-", "fa-")]).strip()
+    return f'<i class="{font_classes}"{style_attr}></i>'
+
+
+def font_links() -> str:
+    if not ASSET_MANIFEST:
         return """
         <link href="https://fonts.googleapis.com/css2?family=Tajawal:wght@400;500;700;800&family=Playfair+Display:wght@400;600;700&display=swap" rel="stylesheet">
         <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
+        """
+    faces = "".join(
+        f"@font-face {{ font-family: '{font['family']}'; font-style: normal; font-weight: {font['weight']}; "
+        f"font-display: swap; src: url({asset_url(font['file'])}) format('woff2'); }}\n"
+        for font in ASSET_MANIFEST["fonts"])
+    return f"<style>\n{faces}</style>"
+
+
+class UI:
+    @staticmethod
+    def get_styles():
+        return font_links() + """
         <style>
             * { box-sizing: border-box; }
+            svg.icon { width: 1em; height: 1em; fill: currentColor; vertical-align: -0.125em; overflow: visible; }
+            svg.icon-spin { animation: icon-spin 1s linear infinite; }
+            @keyframes icon-spin { to { transform: rotate(360deg); } }
             
             body, .pywebio {
                 font-family: 'Tajawal', sans-serif !important;
@@ -224,7 +1586,9 @@ class UI:
         """)
 
     @staticmethod
-    def render_header(cart_count: int, on_cart_click, on_home_click):
+    def render_header(cart_count: int, on_cart_click, on_home_click, t=STRINGS["en"].get, currency: str = BASE_CURRENCY,
+                      on_locale=None, on_currency=None, saved_count: int = 0, on_saved_click=None,
+                      account_label: str = "", on_account_click=None):
         with use_scope('header', clear=True):
             put_html(f"""
             <div id="sticky-header" style="
@@ -236,7 +1600,7 @@ class UI:
                 display: flex; justify-content: space-between; align-items: center;
             ">
                 <div style="display: flex; align-items: center; gap: 12px;">
-                    <i class="fas fa-mosque" style="font-size: 28px; color: white; text-shadow: 2px 2px 4px rgba(0,0,0,0.15);"></i>
+                    {icon('mosque', style='font-size: 28px; color: white; text-shadow: 2px 2px 4px rgba(0,0,0,0.15);')}
                     <div style="
                         font-size: 28px; font-weight: 700; color: white;
                         text-shadow: 2px 2px 4px rgba(0,0,0,0.15);
@@ -248,8 +1612,14 @@ class UI:
             """)
             
             put_row([
-                put_buttons([{'label': ' Home', 'value': 'home'}], onclick=[lambda: on_home_click()]),
-                put_buttons([{'label': f' Cart ({cart_count})', 'value': 'cart'}], onclick=[lambda: on_cart_click()])
+                put_buttons([{'label': t('language'), 'value': 'lang', 'color': 'light'}], onclick=[lambda: on_locale()]),
+                put_buttons([{'label': code, 'value': code, 'color': 'primary' if code == currency else 'light'}
+                             for code in sorted(FX.rates)], onclick=on_currency, small=True),
+                put_buttons([{'label': f' {t("home")}', 'value': 'home'}], onclick=[lambda: on_home_click()]),
+                *([put_buttons([{'label': f'👤 {account_label or t("account")}', 'value': 'account'}], onclick=[lambda: on_account_click()])]
+                  if on_account_click else []),
+                put_buttons([{'label': f'♥ {t("saved")} ({saved_count})', 'value': 'saved'}], onclick=[lambda: on_saved_click()]),
+                put_buttons([{'label': f' {t("cart")} ({cart_count})', 'value': 'cart'}], onclick=[lambda: on_cart_click()])
             ], size='auto').style('''
                 position: fixed; top: 18px; right: 30px; z-index: 1001; display: flex; gap: 10px;
             ''')
@@ -278,7 +1648,7 @@ class UI:
         </div>
         """)
         
-        put_html("""
+        put_html(f"""
         <div style="
             background: linear-gradient(135deg, #ffffff 0%, #fff9fc 100%);
             border-radius: 25px; padding: 40px 50px; max-width: 850px;
@@ -291,27 +1661,27 @@ class UI:
                 O Prophet, tell your wives and your daughters and the women of the believers 
                 to bring down over themselves [part] of their outer garments.
             </p>
-            <p style="color: #e84393; font-size: 14px; margin-top: 25px; font-weight: 700; text-align: right;"><i class="fas fa-book-quran"></i> [Al-Ahzab: 59]</p>
+            <p style="color: #e84393; font-size: 14px; margin-top: 25px; font-weight: 700; text-align: right;">{icon('book-quran')} [Al-Ahzab: 59]</p>
         </div>
         """)
         
-        put_html("""
+        put_html(f"""
         <div style="display: flex; justify-content: center; gap: 40px; flex-wrap: wrap; padding: 30px 20px; max-width: 900px; margin: 0 auto 40px auto;">
             <div style="text-align: center;">
                 <div style="width: 70px; height: 70px; background: linear-gradient(135deg, #ff9a9e, #fecfef); border-radius: 50%; display: flex; align-items: center; justify-content: center; margin: 0 auto 15px auto; box-shadow: 0 8px 25px rgba(232, 67, 147, 0.2);">
-                    <i class="fas fa-truck-fast" style="font-size: 28px; color: white;"></i>
+                    {icon('truck-fast', style='font-size: 28px; color: white;')}
                 </div>
                 <p style="color: #5f27cd; font-weight: 600; font-size: 14px;">Free Shipping</p>
             </div>
             <div style="text-align: center;">
                 <div style="width: 70px; height: 70px; background: linear-gradient(135deg, #a55eea, #8854d0); border-radius: 50%; display: flex; align-items: center; justify-content: center; margin: 0 auto 15px auto; box-shadow: 0 8px 25px rgba(165, 94, 234, 0.2);">
-                    <i class="fas fa-shield-heart" style="font-size: 28px; color: white;"></i>
+                    {icon('shield-heart', style='font-size: 28px; color: white;')}
                 </div>
                 <p style="color: #5f27cd; font-weight: 600; font-size: 14px;">Quality Guarantee</p>
             </div>
             <div style="text-align: center;">
                 <div style="width: 70px; height: 70px; background: linear-gradient(135deg, #00b894, #55efc4); border-radius: 50%; display: flex; align-items: center; justify-content: center; margin: 0 auto 15px auto; box-shadow: 0 8px 25px rgba(0, 184, 148, 0.2);">
-                    <i class="fas fa-rotate-left" style="font-size: 28px; color: white;"></i>
+                    {icon('rotate-left', style='font-size: 28px; color: white;')}
                 </div>
                 <p style="color: #5f27cd; font-weight: 600; font-size: 14px;">Easy Returns</p>
             </div>
@@ -330,7 +1700,7 @@ class UI:
 
         cats_html = '<div style="display: flex; justify-content: center; flex-wrap: wrap; gap: 25px; padding: 10px 20px; max-width: 900px; margin: 0 auto;">'
         for cat in categories:
-            icon = category_icons.get(cat, "fa-tag")
+            cat_icon = category_icons.get(cat, "fa-tag")
             cats_html += f"""
             <div class="category-card" id="cat-{cat}" style="
                 background: white; border-radius: 20px; padding: 30px 40px; text-align: center;
@@ -338,7 +1708,7 @@ class UI:
                 border: 2px solid transparent; min-width: 180px;
             " onmouseover="this.style.transform='translateY(-5px)'; this.style.borderColor='#e84393'; this.style.boxShadow='0 15px 40px rgba(232, 67, 147, 0.2)';"
                onmouseout="this.style.transform='translateY(0)'; this.style.borderColor='transparent'; this.style.boxShadow='0 8px 30px rgba(232, 67, 147, 0.1)';">
-                <i class="fas {icon}" style="font-size: 40px; color: #e84393; margin-bottom: 15px;"></i>
+                {icon(cat_icon, style='font-size: 40px; color: #e84393; margin-bottom: 15px;')}
                 <p style="color: #2d3436; font-weight: 700; font-size: 18px; margin: 0;">{cat}</p>
             </div>
             """
@@ -361,15 +1731,18 @@ class UI:
             """)
 
     @staticmethod
-    def render_products(products: List[Product], on_add_to_cart, on_back):
+    def render_products(products: List[Product], on_add_to_cart, on_back, related: Optional[Dict[int, List[Product]]] = None,
+                        on_details=None, prices: Optional[Dict[int, str]] = None, t=STRINGS["en"].get, locale: str = "en",
+                        wishlist: Optional[Wishlist] = None, on_toggle_saved=None):
+        prices = prices or price_labels(BASE_CURRENCY, locale)
         put_html('<div style="text-align: center; margin: 30px 0;">')
         put_buttons([{'label': ' Back to Categories', 'value': 'back'}], onclick=[lambda: on_back()]).style('display: inline-flex; align-items: center; gap: 8px;')
         put_html("</div>")
 
         if not products:
-            put_html('''
+            put_html(f'''
             <div style="text-align: center; padding: 60px 40px; background: white; border-radius: 25px; max-width: 500px; margin: 20px auto; box-shadow: 0 10px 40px rgba(232, 67, 147, 0.1);">
-                <i class="fas fa-box-open" style="font-size: 60px; color: #fecfef; margin-bottom: 20px;"></i>
+                {icon('box-open', style='font-size: 60px; color: #fecfef; margin-bottom: 20px;')}
                 <p style="color: #a55eea; font-size: 20px; font-weight: 600;">No products found</p>
             </div>
             ''')
@@ -382,12 +1755,21 @@ class UI:
         
         cards = []
         
+        rankings = TRENDING.rankings
+        wishlist = wishlist if wishlist is not None else Wishlist()
         for p in products:
             badge_html = ""
-            if p.badge:
+            badge = rankings.badge_for(p)
+            if badge:
                 badge_html = f"""
-                <div style="position: absolute; top: 15px; left: 15px; padding: 6px 14px; border-radius: 20px; color: white; font-size: 12px; font-weight: 700; z-index: 10;" class="badge-{p.badge.lower()}">{p.badge}</div>
+                <div style="position: absolute; top: 15px; left: 15px; padding: 6px 14px; border-radius: 20px; color: white; font-size: 12px; font-weight: 700; z-index: 10;" class="badge-{badge.lower()}">{badge}</div>
                 """
+
+            related_html = ""
+            if related and related.get(p.id):
+                names = ", ".join(r.name_ar if locale == "ar" else r.name for r in related[p.id])
+                related_html = f'<p style="font-size: 12px; color: #636e72; margin-bottom: 5px;">{t("often_bought_with")}: {names}</p>'
+            title, subtitle = (p.name_ar, p.name) if locale == "ar" else (p.name, p.name_ar)
             
             # Card Image & Details HTML
             top_html = f"""
@@ -397,9 +1779,10 @@ class UI:
                 <div style="position: absolute; bottom: 0; left: 0; right: 0; height: 80px; background: linear-gradient(to top, white, transparent);"></div>
             </div>
             <div style="padding: 20px 20px 5px 20px; text-align: center;">
-                <h3 style="font-size: 20px; font-weight: 700; color: #2d3436; margin-bottom: 5px; height: 25px; overflow: hidden;">{p.name}</h3>
-                <p style="font-size: 14px; color: #a55eea; margin-bottom: 8px; font-weight: 500;">{p.name_ar}</p>
-                <p style="font-size: 24px; font-weight: 800; color: #e84393; margin: 10px 0;">{int(p.price)} <span style="font-size: 14px;">EGP</span></p>
+                <h3 style="font-size: 20px; font-weight: 700; color: #2d3436; margin-bottom: 5px; height: 25px; overflow: hidden;">{title}</h3>
+                <p style="font-size: 14px; color: #a55eea; margin-bottom: 8px; font-weight: 500;">{subtitle}</p>
+                {related_html}
+                <p style="font-size: 24px; font-weight: 800; color: #e84393; margin: 10px 0;">{prices[p.id]}</p>
             </div>
             """
             
@@ -407,11 +1790,15 @@ class UI:
             qty_pin_name = f"qty_{p.id}"
             
             # Card Action Row (Input + Button)
-            # FIXED: Lambda now accepts `_` as the first argument (button value) to prevent overwriting `p`
+            # List callbacks get no arguments; `p` and the pin name are bound as defaults.
+            # The controller reads the pin itself, since that is a round trip to the browser.
             action_row = put_row([
-                pin.put_input(qty_pin_name, type='number', value=1).style('width: 70px; margin-right: 10px;'),
-                put_buttons([{'label': 'Add', 'value': 'add'}], 
-                            onclick=[lambda _, p=p, name=qty_pin_name: on_add_to_cart(p, pin[name])])
+                put_input(qty_pin_name, type='number', value=1).style('width: 70px; margin-right: 10px;'),
+                put_buttons([{'label': t('add'), 'value': 'add'}, {'label': t('details'), 'value': 'details', 'color': 'light'}],
+                            onclick=[lambda p=p, name=qty_pin_name: on_add_to_cart(p, name),
+                                     lambda p=p: on_details(p)]),
+                # A bit test per card against the wishlist loaded once for the page
+                put_scope(f'wish_{p.id}', [UI.wish_button(p, p.id in wishlist, on_toggle_saved)])
             ], size='auto').style('justify-content: center; padding-bottom: 25px;')
             
             # Combine into a column
@@ -424,10 +1811,59 @@ class UI:
             
         put_row(cards, wrap=True).style('justify-content: center; gap: 35px; padding: 30px;')
 
+    @staticmethod
+    def wish_button(product: Product, saved: bool, on_toggle_saved):
+        return put_buttons([{'label': '♥' if saved else '♡', 'value': 'saved', 'color': 'danger' if saved else 'light'}],
+                           onclick=[lambda: on_toggle_saved(product)], small=True)
+
+    @staticmethod
+    def render_product_detail(product: Product, details: ProductDetails, badge: Optional[str], on_add_to_cart, on_back,
+                              price_label: str = "", t=STRINGS["en"].get, locale: str = "en", saved: bool = False,
+                              on_toggle_saved=None):
+        title, subtitle = (product.name_ar, product.name) if locale == "ar" else (product.name, product.name_ar)
+        put_html('<div style="padding-top: 100px;"></div>')
+        put_buttons([{'label': f' Back to {product.category}', 'value': 'back'}], onclick=[lambda: on_back()]).style('text-align: center;')
+
+        gallery = [put_image(details.images[0], width='100%').style('border-radius: 20px; object-fit: cover; max-height: 520px;')]
+        if len(details.images) > 1:
+            gallery.append(put_row([
+                put_html(f'<img src="{url}" loading="lazy" style="width: 70px; height: 88px; border-radius: 10px; object-fit: cover;">')
+                for url in details.images[1:]
+            ], size='auto').style('gap: 10px; margin-top: 10px;'))
+
+        info = [
+            put_html(f'''
+            <div>
+                {f'<span class="badge-{badge.lower()}" style="padding: 6px 14px; border-radius: 20px; color: white; font-size: 12px; font-weight: 700;">{badge}</span>' if badge else ''}
+                <h1 style="font-size: 34px; color: #5f27cd; font-family: 'Playfair Display', serif; margin: 15px 0 5px 0;">{title}</h1>
+                <p style="font-size: 16px; color: #a55eea;">{subtitle}</p>
+                <p style="font-size: 28px; font-weight: 800; color: #e84393;">{price_label or format_money(to_money(product.price))}</p>
+            </div>
+            '''),
+            put_markdown(details.long_description),
+        ]
+        if details.size_chart:
+            columns = []
+            for row in details.size_chart:
+                columns.extend(c for c in row if c not in columns)
+            info.append(put_markdown(f"#### {t('size_chart')}"))
+            info.append(put_table([[row.get(c, "") for c in columns] for row in details.size_chart],
+                                  header=[c.replace("_", " ").capitalize() for c in columns]))
+        qty_pin_name = f"detail_qty_{product.id}"
+        info.append(put_row([
+            put_input(qty_pin_name, type='number', value=1).style('width: 70px; margin-right: 10px;'),
+            put_buttons([{'label': t('add_to_cart'), 'value': 'add'}],
+                        onclick=[lambda _=None: on_add_to_cart(product, qty_pin_name)]),
+            put_scope(f'wish_{product.id}', [UI.wish_button(product, saved, on_toggle_saved)])
+        ], size='auto'))
+
+        put_row([put_column(gallery), put_column(info)], size='1fr 1fr').style(
+            'gap: 40px; max-width: 1100px; margin: 30px auto; padding: 30px; background: white; border-radius: 25px; box-shadow: 0 10px 40px rgba(232, 67, 147, 0.1);')
+
     @staticmethod
     def render_footer():
         # Footer code same as before
-        put_html("""
+        put_html(f"""
         <footer style="background: linear-gradient(135deg, #2d3436 0%, #1a1a2e 100%); padding: 60px 30px 30px 30px; margin-top: 80px; color: white;">
             <div style="max-width: 1200px; margin: 0 auto; display: grid; grid-template-columns: repeat(auto-fit, minmax(250px, 1fr)); gap: 40px;">
                 <div>
@@ -436,7 +1872,7 @@ class UI:
                 </div>
                 <div>
                     <h4 style="color: #fecfef; margin-bottom: 20px; font-size: 16px;">Contact Us</h4>
-                    <p style="color: #b2bec3; font-size: 14px;"><i class="fas fa-envelope" style="color: #e84393; margin-right: 10px;"></i> support@modesta.com</p>
+                    <p style="color: #b2bec3; font-size: 14px;">{icon('envelope', style='color: #e84393; margin-right: 10px;')} support@modesta.com</p>
                 </div>
             </div>
             <div style="border-top: 1px solid rgba(255,255,255,0.1); margin-top: 50px; padding-top: 25px; text-align: center;">
@@ -445,15 +1881,91 @@ class UI:
         </footer>
         """)
 
+    @staticmethod
+    def render_waiting_room(position: int):
+        # Deliberately tiny: waiting sessions must stay cheap while the store is full
+        with use_scope('waiting_room', clear=True):
+            put_html(f'''
+            <div style="max-width: 480px; margin: 120px auto; padding: 40px; background: white; border-radius: 20px; text-align: center; box-shadow: 0 10px 30px rgba(0,0,0,0.08); font-family: sans-serif;">
+                <h2 style="color: #5f27cd;">Modesta is busy right now</h2>
+                <p style="color: #636e72;">You're number <strong>{position}</strong> in line. This page continues automatically.</p>
+            </div>
+            ''')
+
+    @staticmethod
+    def render_busy():
+        put_html('''
+        <div style="max-width: 480px; margin: 120px auto; padding: 40px; background: white; border-radius: 20px; text-align: center; font-family: sans-serif;">
+            <h2 style="color: #5f27cd;">Modesta is very busy</h2>
+            <p style="color: #636e72;">Please try again in a few minutes.</p>
+        </div>
+        ''')
+
 # ==========================================
-# 3. CONTROLLER
+# 4. CONTROLLER
 # ==========================================
 
 class ShopController:
     def __init__(self):
         self.cart = Cart()
         self.ui = UI()
-        self.categories = ["Abayas", "Khimars", "Niqabs", "Accessories"]
+        self.client_ip = session_info.user_ip or "unknown"
+        self.session_key = f"{self.client_ip}:{id(self)}"
+        self.locale = "ar" if (session_info.user_language or "").lower().startswith("ar") else "en"
+        self._currency = BASE_CURRENCY
+        self.coupon = None
+        self.placing_order = False
+        self.current_page = self.show_home
+        self.visitor_id = None
+        self.wishlist = Wishlist()
+        self.user: Optional[Tuple[int, str]] = None  # (id, name) from the signed token
+        self.addresses: List[dict] = []
+
+    @property
+    def currency(self) -> str:
+        # A currency dropped from the rates file falls back to EGP
+        return self._currency if self._currency in FX.rates else BASE_CURRENCY
+
+    def t(self, key: str) -> str:
+        return STRINGS[self.locale].get(key, key)
+
+    def money(self, amount: Decimal) -> str:
+        return format_money(amount, self.currency, self.locale)
+
+    def unit_amount(self, product: Product) -> Decimal:
+        return convert_money(to_money(product.price), FX.rate(self.currency))
+
+    def cart_total(self) -> Decimal:
+        # Converted unit prices times quantities, so lines add up to what the cards show
+        return sum((self.unit_amount(item.product) * item.quantity for item in self.cart.items), Decimal("0.00"))
+
+    @timed_callback
+    def switch_locale(self):
+        self.locale = "en" if self.locale == "ar" else "ar"
+        self.current_page()
+
+    @timed_callback
+    def switch_currency(self, currency: str):
+        self._currency = currency
+        self.current_page()
+
+    def allowed(self, action: str) -> bool:
+        if RATE_LIMITER.allow(action, self.client_ip, self.session_key):
+            return True
+        toast("Too many requests, please slow down", color='error')
+        return False
+
+    async def restore_visitor(self):
+        # The browser keeps its visitor id (saved items) and sign-in token; one round trip reads both.
+        # The token is only signature-checked here, the account store is read when checkout needs it.
+        visitor_id, token = await eval_js(f"[localStorage.getItem('{VISITOR_KEY}'), localStorage.getItem('{SESSION_KEY}')]")
+        self.user = read_session(token) if ACCOUNTS_ENABLED else None
+        if not isinstance(visitor_id, str) or not 0 < len(visitor_id) <= 64:
+            visitor_id = secrets.token_urlsafe(16)
+            run_js(f"localStorage.setItem('{VISITOR_KEY}', id)", id=visitor_id)
+        self.visitor_id = visitor_id
+        wishlist = await off_loop(None, WISHLISTS.get, visitor_id)
+        self.wishlist = Wishlist() if isinstance(wishlist, Failed) else wishlist
 
     def start(self):
         set_env(title="Modesta Store - Elegant Modest Fashion")
@@ -464,31 +1976,45 @@ class ShopController:
         self.ui.render_header(
             cart_count=self.cart.get_count(),
             on_cart_click=self.show_cart,
-            on_home_click=self.show_home
+            on_home_click=self.show_home,
+            t=self.t,
+            currency=self.currency,
+            on_locale=self.switch_locale,
+            on_currency=self.switch_currency,
+            saved_count=len(self.wishlist),
+            on_saved_click=self.show_saved,
+            account_label=f"{self.t('hello')}, {self.user[1]}" if self.user else "",
+            on_account_click=self.show_account if ACCOUNTS_ENABLED else None
         )
 
+    @timed_callback
     def show_home(self):
+        self.current_page = self.show_home
         clear()
         run_js('window.scrollTo(0,0);')
         self.refresh_header()
         self.ui.render_hero_section()
-        self.ui.render_categories(self.categories, self.show_category_page)
+        self.ui.render_categories(CATALOG.current().categories, self.show_category_page)
         self.ui.render_footer()
 
-    def show_category_page(self, category_name):
+    @timed_callback
+    def show_category_page(self, category_name, sort: str = "featured"):
+        self.current_page = lambda: self.show_category_page(category_name, sort)
         clear()
         run_js('window.scrollTo(0,0);')
         self.refresh_header()
 
-        filtered_products = [p for p in PRODUCTS_DB if p.category == category_name]
+        filtered_products = CATALOG.current().by_category.get(category_name, ())
+        if sort == "trending":
+            filtered_products = TRENDING.rankings.sort(filtered_products)
         
         category_icons = { "Abayas": "fa-person-dress", "Khimars": "fa-user-nurse", "Niqabs": "fa-mask", "Accessories": "fa-gem" }
-        icon = category_icons.get(category_name, "fa-tag")
+        cat_icon = category_icons.get(category_name, "fa-tag")
 
         put_html(f'''
         <div style="text-align: center; padding: 100px 20px 20px 20px;">
             <div style="width: 80px; height: 80px; background: linear-gradient(135deg, #ff9a9e, #fecfef); border-radius: 50%; display: flex; align-items: center; justify-content: center; margin: 0 auto 20px auto; box-shadow: 0 10px 30px rgba(232, 67, 147, 0.2);">
-                <i class="fas {icon}" style="font-size: 35px; color: white;"></i>
+                {icon(cat_icon, style='font-size: 35px; color: white;')}
             </div>
             <h1 style="font-size: 38px; color: #5f27cd; margin-bottom: 10px; font-weight: 700; font-family: 'Playfair Display', serif;">{category_name}</h1>
             <p style="color: #a55eea; font-size: 16px;">{len(filtered_products)} products available</p>
@@ -496,48 +2022,265 @@ class ShopController:
         </div>
         ''')
 
+        put_buttons(
+            [{'label': self.t('featured'), 'value': 'featured', 'color': 'primary' if sort != 'trending' else 'light'},
+             {'label': self.t('trending'), 'value': 'trending', 'color': 'primary' if sort == 'trending' else 'light'}],
+            onclick=lambda value: self.show_category_page(category_name, value), small=True
+        ).style('text-align: center;')
+
+        related = {}
+        for p in filtered_products:
+            ids = RECOMMENDER.related(p.id)
+            if ids:
+                related[p.id] = related_products(ids)
+
         self.ui.render_products(
             products=filtered_products,
             on_add_to_cart=self.add_to_cart,
-            on_back=self.show_home
+            on_back=self.show_home,
+            related=related,
+            on_details=self.open_product_page,
+            prices=price_labels(self.currency, self.locale),
+            t=self.t,
+            locale=self.locale,
+            wishlist=self.wishlist,
+            on_toggle_saved=self.toggle_saved
+        )
+        self.ui.render_footer()
+
+    @timed_callback
+    async def open_product_page(self, product: Product):
+        # The detail file may need a disk read; the loop keeps serving other sessions meanwhile
+        details = await off_loop(None, product_details, product)
+        if isinstance(details, Failed):
+            toast("We couldn't open this product, please try again", color='error')
+            return
+        self.show_product_page(product, details)
+
+    def show_product_page(self, product: Product, details: ProductDetails):
+        self.current_page = lambda: self.show_product_page(product, details)
+        clear()
+        run_js('window.scrollTo(0,0);')
+        self.refresh_header()
+        self.ui.render_product_detail(
+            product=product,
+            details=details,
+            badge=TRENDING.rankings.badge_for(product),
+            on_add_to_cart=self.add_to_cart,
+            on_back=lambda: self.show_category_page(product.category),
+            price_label=price_labels(self.currency, self.locale).get(product.id, ""),
+            t=self.t,
+            locale=self.locale,
+            saved=product.id in self.wishlist,
+            on_toggle_saved=self.toggle_saved
         )
         self.ui.render_footer()
 
-    def add_to_cart(self, product: Product, qty: int):
+    @timed_callback
+    async def add_to_cart(self, product: Product, qty_pin: str):
+        if not self.allowed("add_to_cart"):
+            return
+        qty = await pin[qty_pin]
         if not qty or qty < 1:
             toast("Please enter a valid quantity", color='error')
             return
         self.cart.add_product(product, qty)
+        TRENDING.record_interest(product.id)
         toast(f"Added {qty} x {product.name} to cart!", color='success')
         self.refresh_header()
 
+    @timed_callback
+    async def toggle_saved(self, product: Product):
+        if not self.allowed("wishlist"):
+            return
+        saved = product.id not in self.wishlist
+        wishlist = await off_loop(None, WISHLISTS.set_saved, self.visitor_id, product.id, saved)
+        if isinstance(wishlist, Failed):
+            # The store enforces the size limit (another tab may have filled the list), with a ValueError
+            if isinstance(wishlist.error, ValueError):
+                toast(str(wishlist.error), color='error')
+            else:
+                toast("We couldn't update your saved items, please try again", color='error')
+            return
+        self.wishlist = wishlist
+        # Redrawn only where they are on screen; create_scope=False keeps them off other pages
+        clear(f'wish_{product.id}')
+        with use_scope(f'wish_{product.id}', create_scope=False):
+            self.ui.wish_button(product, saved, self.toggle_saved)
+        self.refresh_saved_popup(create=False)
+        self.refresh_header()
+
+    @timed_callback
+    def add_saved_to_cart(self, product: Product):
+        self.cart.add_product(product, 1)
+        TRENDING.record_interest(product.id)
+        toast(f"Added {product.name} to cart!", color='success')
+        self.refresh_header()
+
+    def refresh_saved_popup(self, create: bool = True):
+        clear('saved_content')
+        with use_scope('saved_content', create_scope=create):
+            snapshot = CATALOG.current()
+            saved = [snapshot.by_id[pid] for pid in self.wishlist if pid in snapshot.by_id]
+            if not saved:
+                put_html(f'''
+                <div style="text-align: center; padding: 30px;">
+                    {icon('heart', style='font-size: 50px; color: #fecfef; margin-bottom: 15px;')}
+                    <h3 style="color: #5f27cd; font-size: 18px;">{self.t('saved_empty')}</h3>
+                </div>
+                ''')
+                return
+            prices = price_labels(self.currency, self.locale)
+            for p in saved:
+                put_row([
+                    put_image(p.image_url, width='60px', height='60px').style('border-radius: 10px; object-fit: cover;'),
+                    put_column([
+                        put_text(p.name_ar if self.locale == 'ar' else p.name).style('font-weight: bold; font-size: 14px;'),
+                        put_text(prices[p.id]).style('color: #e84393; font-weight: bold;')
+                    ]),
+                    put_buttons([self.t('add')], onclick=lambda _, p=p: self.add_saved_to_cart(p), small=True),
+                    put_buttons([{'label': '🗑', 'value': 'del', 'color': 'danger'}],
+                                onclick=lambda _, p=p: self.toggle_saved(p), small=True)
+                ], size='60px 1fr auto auto').style('align-items: center; gap: 10px; margin-bottom: 15px; border-bottom: 1px solid #eee; padding-bottom: 10px;')
+
+    @timed_callback
+    def show_saved(self):
+        popup(self.t('saved'), [put_scope('saved_content')])
+        self.refresh_saved_popup()
+
+    def refresh_account_popup(self, error: str = ""):
+        with use_scope('account_content', clear=True):
+            if not self.user:
+                put_input('account_email', label=self.t('email'))
+                put_input('account_password', type='password', label=self.t('password'))
+                put_input('account_name', label="Full Name", help_text="New accounts only")
+                put_input('account_phone', label="Phone", help_text="New accounts only")
+                if error:
+                    put_text(error).style('color: #e17055;')
+                put_buttons([{'label': self.t('sign_in'), 'value': 'in'},
+                             {'label': self.t('register'), 'value': 'register', 'color': 'light'}],
+                            onclick=[lambda: self.sign_in(), lambda: self.register()])
+                return
+            put_text(f"{self.t('hello')}, {self.user[1]}").style('font-weight: bold; color: #5f27cd;')
+            if self.addresses:
+                put_text(self.t('saved_addresses')).style('font-weight: bold; margin-top: 15px;')
+            for address in self.addresses:
+                put_row([
+                    put_text(f"{address['label']}: {address['name']}, {address['phone']}, {address['address']}").style('font-size: 14px;'),
+                    put_buttons([{'label': '🗑', 'value': 'del', 'color': 'danger'}],
+                                onclick=lambda _, aid=address['id']: self.delete_address(aid), small=True)
+                ], size='1fr auto').style('align-items: center; gap: 10px; margin-bottom: 10px;')
+            put_buttons([{'label': self.t('sign_out'), 'value': 'out', 'color': 'light'}], onclick=[lambda: self.sign_out()])
+
+    @timed_callback
+    async def show_account(self):
+        popup(self.t('account'), [put_scope('account_content')])
+        if self.user:
+            await self.load_addresses()
+        self.refresh_account_popup()
+
+    async def load_addresses(self):
+        addresses = await off_loop(None, ACCOUNTS.addresses, self.user[0])
+        self.addresses = [] if isinstance(addresses, Failed) else addresses
+
+    async def signed_in(self, user: Tuple[int, str]):
+        self.user = user
+        run_js(f"localStorage.setItem('{SESSION_KEY}', token)", token=issue_session(*user))
+        await self.load_addresses()
+        self.refresh_account_popup()
+        self.refresh_header()
+
+    @timed_callback
+    async def sign_in(self):
+        if not self.allowed("login"):
+            return
+        values = await get_pin_values(['account_email', 'account_password'])
+        # scrypt runs on its own pool; other sessions keep being served meanwhile
+        user = await off_loop(PASSWORD_POOL, ACCOUNTS.login, (values['account_email'] or '').strip(),
+                              values['account_password'] or '')
+        if isinstance(user, Failed):
+            self.refresh_account_popup("Something went wrong, please try again")
+            return
+        if user is None:
+            self.refresh_account_popup("Wrong email or password")
+            return
+        await self.signed_in(user)
+
+    @timed_callback
+    async def register(self):
+        if not self.allowed("login"):
+            return
+        values = await get_pin_values(['account_email', 'account_password', 'account_name', 'account_phone'])
+        result = await off_loop(PASSWORD_POOL, ACCOUNTS.register, (values['account_email'] or '').strip(),
+                                values['account_password'] or '', (values['account_name'] or '').strip(),
+                                (values['account_phone'] or '').strip())
+        user, error = (None, "Something went wrong, please try again") if isinstance(result, Failed) else result
+        if error:
+            self.refresh_account_popup(error)
+            return
+        await self.signed_in(user)
+
+    @timed_callback
+    def sign_out(self):
+        self.user = None
+        self.addresses = []
+        run_js(f"localStorage.removeItem('{SESSION_KEY}')")
+        self.refresh_account_popup()
+        self.refresh_header()
+
+    @timed_callback
+    async def delete_address(self, address_id: int):
+        if isinstance(await off_loop(None, ACCOUNTS.delete_address, self.user[0], address_id), Failed):
+            toast("We couldn't remove this address, please try again", color='error')
+        await self.load_addresses()
+        self.refresh_account_popup()
+
+    def fill_saved_address(self, address_id):
+        address = next((a for a in self.addresses if a['id'] == address_id), None)
+        if address is None:
+            return
+        pin_update('checkout_name', value=address['name'])
+        pin_update('checkout_phone', value=address['phone'])
+        pin_update('checkout_address', value=address['address'])
+        if address['governorate'] in CHECKOUT_CITIES:
+            pin_update('checkout_city', value=address['governorate'])
+
+    @timed_callback
     def update_cart_item(self, product_id, change):
         self.cart.update_quantity(product_id, change)
         self.refresh_cart_popup()
         self.refresh_header()
 
+    @timed_callback
     def remove_cart_item(self, product_id):
         self.cart.remove_product(product_id)
         self.refresh_cart_popup()
         self.refresh_header()
 
+    @timed_callback
+    def add_suggestion(self, product: Product):
+        self.cart.add_product(product, 1)
+        self.refresh_cart_popup()
+        self.refresh_header()
+
     def refresh_cart_popup(self):
         with use_scope('cart_content', clear=True):
             if not self.cart.items:
-                put_html('''
+                put_html(f'''
                 <div style="text-align: center; padding: 30px;">
-                    <i class="fas fa-shopping-bag" style="font-size: 50px; color: #fecfef; margin-bottom: 15px;"></i>
-                    <h3 style="color: #5f27cd; font-size: 18px;">Your cart is empty</h3>
+                    {icon('shopping-bag', style='font-size: 50px; color: #fecfef; margin-bottom: 15px;')}
+                    <h3 style="color: #5f27cd; font-size: 18px;">{self.t('cart_empty')}</h3>
                 </div>
                 ''')
                 return
 
+            prices = price_labels(self.currency, self.locale)
             for item in self.cart.items:
                 put_row([
                     put_image(item.product.image_url, width='60px', height='60px').style('border-radius: 10px; object-fit: cover;'),
                     put_column([
                         put_text(item.product.name).style('font-weight: bold; font-size: 14px;'),
-                        put_text(f"{int(item.product.price)} EGP").style('color: #e84393; font-weight: bold;')
+                        put_text(self.money(self.unit_amount(item.product))).style('color: #e84393; font-weight: bold;')
                     ]),
                     put_row([
                         put_buttons(['-'], onclick=lambda _, pid=item.product.id: self.update_cart_item(pid, -1), small=True).style('margin: 0 2px;'),
@@ -549,19 +2292,33 @@ class ShopController:
                 ], size='60px 1fr auto auto').style('align-items: center; gap: 10px; margin-bottom: 15px; border-bottom: 1px solid #eee; padding-bottom: 10px;')
 
             put_row([
-                put_text("Total:").style('font-size: 18px; font-weight: bold; color: #27ae60;'),
-                put_text(f"{int(self.cart.get_total())} EGP").style('font-size: 20px; font-weight: 800; color: #27ae60;')
+                put_text(f"{self.t('total')}:").style('font-size: 18px; font-weight: bold; color: #27ae60;'),
+                put_text(self.money(self.cart_total())).style('font-size: 20px; font-weight: 800; color: #27ae60;')
             ], size='auto').style('justify-content: space-between; margin-top: 10px;')
 
-            put_buttons(['Proceed to Checkout'], onclick=lambda _: self.show_checkout()).style('width: 100%; margin-top: 20px;')
+            suggestions = related_products(RECOMMENDER.related_to_many(item.product.id for item in self.cart.items))
+            if suggestions:
+                put_text(self.t('you_may_also_like')).style('font-weight: bold; color: #5f27cd; margin-top: 20px;')
+                for p in suggestions:
+                    put_row([
+                        put_image(p.image_url, width='45px', height='45px').style('border-radius: 10px; object-fit: cover;'),
+                        put_text(f"{p.name_ar if self.locale == 'ar' else p.name} - {prices[p.id]}").style('font-size: 14px;'),
+                        put_buttons(['+'], onclick=lambda _, p=p: self.add_suggestion(p), small=True)
+                    ], size='45px 1fr auto').style('align-items: center; gap: 10px; margin-top: 8px;')
+
+            put_buttons([self.t('proceed')], onclick=lambda _: self.show_checkout()).style('width: 100%; margin-top: 20px;')
 
+    @timed_callback
     def show_cart(self):
         popup('Shopping Cart', [
             put_scope('cart_content')
         ])
         self.refresh_cart_popup()
 
-    def show_checkout(self):
+    async def show_checkout(self):
+        # Saved addresses are the only account data checkout reads from the store
+        if self.user:
+            await self.load_addresses()
         close_popup()
         clear()
         run_js('window.scrollTo(0,0);')
@@ -577,24 +2334,30 @@ class ShopController:
         </div>
         ''')
 
-        # Simple cart summary for checkout page
-        cart_summary = []
-        for item in self.cart.items:
-            cart_summary.append(put_row([
-                put_text(f"{item.product.name} x {item.quantity}"),
-                put_text(f"{int(item.total_price)} EGP")
-            ], size='auto').style('justify-content: space-between; border-bottom: 1px solid #eee; padding: 10px 0;'))
-        
-        cart_summary.append(put_row([
-            put_text("Total").style('font-weight: bold;'),
-            put_text(f"{int(self.cart.get_total())} EGP").style('font-weight: bold; color: #e84393;')
-        ], size='auto').style('justify-content: space-between; margin-top: 15px; padding-top: 10px; border-top: 2px dashed #eee;'))
+        cart_summary = [
+            put_scope('order_summary'),
+            put_row([
+                put_input('coupon', placeholder=self.t('coupon'), value=self.coupon or ''),
+                put_buttons([self.t('apply')], onclick=lambda _: self.apply_coupon(), small=True)
+            ], size='1fr auto').style('gap: 10px; margin-top: 15px;'),
+        ]
 
         put_grid([
             [put_column([
                 put_markdown("### Shipping Info"),
-                # We use a placeholder here, real form logic continues below
-                put_html('<div id="form-container"></div>') 
+                *([put_select('checkout_saved', label=self.t('saved_addresses'),
+                              options=[{'label': f"{a['label']}: {a['address']}", 'value': a['id']} for a in self.addresses]
+                              + [{'label': self.t('new_address'), 'value': 0}])] if self.addresses else []),
+                put_input('checkout_name', label="Full Name"),
+                put_input('checkout_phone', label="Phone"),
+                put_input('checkout_email', label="Email", placeholder="Optional"),
+                put_textarea('checkout_address', label="Address", rows=3),
+                put_select('checkout_city', label="City", options=CHECKOUT_CITIES),
+                *([put_checkbox('checkout_save', options=[{'label': self.t('save_address'), 'value': 'save'}])]
+                  if self.user else []),
+                put_scope('checkout_actions', [
+                    put_buttons([self.t('confirm_order')], onclick=lambda _: self.submit_checkout())
+                ]),
             ]).style('background: white; padding: 30px; border-radius: 20px; box-shadow: 0 5px 20px rgba(0,0,0,0.05);'),
             
             put_column([
@@ -602,41 +2365,305 @@ class ShopController:
                 put_column(cart_summary)
             ]).style('background: white; padding: 30px; border-radius: 20px; box-shadow: 0 5px 20px rgba(0,0,0,0.05);')]
         ], cell_width='1fr 400px', cell_gap='30px').style('max-width: 1100px; margin: 0 auto; padding: 0 20px;')
+        if self.addresses:
+            pin_on_change('checkout_saved', onchange=self.fill_saved_address, init_run=True)
+        self.render_order_summary()
 
-        try:
-            info = input_group("", [
-                input("Full Name", name="name"),
-                input("Phone", name="phone"),
-                input("Email", name="email"),
-                textarea("Address", name="address"),
-                select("City", name="city", options=["Cairo", "Alexandria", "Giza"]),
-            ])
-            if info:
-                clear()
-                run_js('window.scrollTo(0,0);')
-                self.refresh_header()
-                self.show_order_confirmation(info)
-        except:
-            pass
+    @timed_callback
+    async def submit_checkout(self):
+        if self.placing_order or not self.cart.items:
+            return
+        # One round trip for the whole form
+        values = await get_pin_values([f'checkout_{field}' for field in ('name', 'phone', 'email', 'address', 'city')]
+                                      + (['checkout_save'] if self.user else []))
+        save_address = 'save' in (values.pop('checkout_save', None) or [])
+        info = {name[len('checkout_'):]: (value or '').strip() for name, value in values.items()}
+        errors = await validate_checkout(info)
+        for field in CHECKOUT_CHECKS:
+            pin_update(f'checkout_{field}', valid_status=False if field in errors else 0,
+                       help_text=errors.get(field, ''))
+        if errors or not self.allowed("order"):
+            return
 
-    def show_order_confirmation(self, info):
-        # Order confirmation logic (same as before)
-        order_id = f"MOD-{hash(info['name']) % 100000:05d}"
+        # The order is priced and copied now, so cart edits made while it is placed don't leak into it
+        self.placing_order = True
+        items = [CartItem(item.product, item.quantity) for item in self.cart.items]
+        pricing = PROMOTIONS.current().price(items, self.coupon)
+        order_id = new_order_id()
+        with use_scope('checkout_actions', clear=True):
+            put_html(f'{icon("spinner", "icon-spin")} Placing your order...')
+        # One timestamp for the order row and the invoice, so regenerating it from the store gives the same document
+        created_at = datetime.now(timezone.utc)
+        placed = await off_loop(ORDER_POOL, place_order, order_id, info, items, pricing, created_at)
+        if isinstance(placed, Failed):
+            self.placing_order = False
+            with use_scope('checkout_actions', clear=True):
+                put_text("We couldn't place your order, please try again").style('color: #e17055;')
+                put_buttons([self.t('confirm_order')], onclick=lambda _: self.submit_checkout())
+            return
+        self.placing_order = False
+        if save_address and not any((a['name'], a['phone'], a['address']) == (info['name'], info['phone'], info['address'])
+                                    for a in self.addresses):
+            # Best effort: the order is placed, so a failure here must not keep the confirmation from showing
+            await off_loop(None, ACCOUNTS.add_address, self.user[0], info)
+        # Rendered in a worker process while the confirmation is already on screen
+        invoice = asyncio.get_running_loop().run_in_executor(
+            invoice_pool(), render_order_invoice, invoice_document(order_id, info, items, pricing, created_at))
+        clear()
+        run_js('window.scrollTo(0,0);')
+        self.show_order_confirmation(order_id, info, items)
+        await self.offer_invoice(order_id, invoice)
+
+    def render_order_summary(self):
+        pricing = PROMOTIONS.current().price(self.cart.items, self.coupon)
+        rate = FX.rate(self.currency)
+        with use_scope('order_summary', clear=True):
+            for item in self.cart.items:
+                put_row([
+                    put_text(f"{item.product.name} x {item.quantity}"),
+                    put_text(self.money(self.unit_amount(item.product) * item.quantity))
+                ], size='auto').style('justify-content: space-between; border-bottom: 1px solid #eee; padding: 10px 0;')
+            total = self.cart_total()
+            for label, amount in pricing.discounts:
+                amount = convert_money(amount, rate)
+                total -= amount
+                put_row([
+                    put_text(label),
+                    put_text(f"-{self.money(amount)}")
+                ], size='auto').style('justify-content: space-between; color: #27ae60; padding: 8px 0;')
+            if self.coupon and not pricing.coupon_applied:
+                put_text(self.t('coupon_not_applicable')).style('color: #e17055; font-size: 13px;')
+            put_row([
+                put_text(self.t('total')).style('font-weight: bold;'),
+                put_text(self.money(total)).style('font-weight: bold; color: #e84393;')
+            ], size='auto').style('justify-content: space-between; margin-top: 15px; padding-top: 10px; border-top: 2px dashed #eee;')
+
+    @timed_callback
+    async def apply_coupon(self):
+        self.coupon = (await pin['coupon'] or '').strip().upper() or None
+        self.render_order_summary()
+
+    def show_order_confirmation(self, order_id: str, info: dict, items: List[CartItem]):
+        self.coupon = None
+        ordered = {item.product.id: item.quantity for item in items}
+        # Keep anything added to the cart while the order was being placed
+        for item in list(self.cart.items):
+            left = item.quantity - ordered.get(item.product.id, 0)
+            if left > 0:
+                item.quantity = left
+            else:
+                self.cart.remove_product(item.product.id)
         put_html(f'''
         <div style="max-width: 600px; margin: 50px auto; padding: 40px; background: white; border-radius: 20px; text-align: center; box-shadow: 0 10px 30px rgba(0,0,0,0.1);">
-            <i class="fas fa-check-circle" style="font-size: 60px; color: #27ae60; margin-bottom: 20px;"></i>
+            {icon('check-circle', style='font-size: 60px; color: #27ae60; margin-bottom: 20px;')}
             <h1 style="color: #27ae60;">Order Confirmed!</h1>
             <p>Order ID: <strong>{order_id}</strong></p>
             <p>Thank you {info['name']}!</p>
         </div>
         ''')
-        self.cart.clear_cart()
+        put_scope('invoice_download').style('text-align: center;')
         self.refresh_header()
         put_buttons(['Back to Home'], onclick=lambda _: self.show_home()).style('text-align: center; display: block; margin-top: 20px;')
 
-def main():
+    async def offer_invoice(self, order_id: str, invoice):
+        content = await invoice
+        if content is None:
+            # The order is placed either way; admins can regenerate the invoice later
+            return
+        # Output to a scope that is gone (the shopper moved on) is dropped by PyWebIO
+        put_file(f"invoice-{order_id}.html", content, "Download invoice", scope='invoice_download')
+
+# Admission control: at most MAX_SESSIONS shopping sessions at once. Further visitors wait in a
+# FIFO waiting room (up to MAX_WAITING, then a "try again later" page), sessions without any
+# interaction for SESSION_IDLE_TIMEOUT seconds are closed, and with MEMORY_BUDGET_MB set no new
+# session is admitted above that resident size while idle sessions are reaped more aggressively.
+MAX_SESSIONS = int(os.environ.get("MODESTA_MAX_SESSIONS", "200"))
+MAX_WAITING = int(os.environ.get("MODESTA_MAX_WAITING", "500"))
+SESSION_IDLE_TIMEOUT = float(os.environ.get("MODESTA_SESSION_IDLE_TIMEOUT", "900"))
+MEMORY_BUDGET_MB = float(os.environ.get("MODESTA_MEMORY_BUDGET_MB", "0"))
+PRESSURE_IDLE_TIMEOUT = 60
+WAITING_ROOM_POLL = 3
+REAPER_INTERVAL = 15
+
+def resident_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def state_size(obj, seen=None) -> int:
+    """
+    Approximate bytes held by one session's own objects. Catalog products are
+    shared by all sessions, so they (and anything not defined here) aren't counted.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, (Product, CatalogSnapshot)):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        # Copied first: the session may be changing its state while the reaper measures it
+        size += sum(state_size(k, seen) + state_size(v, seen) for k, v in list(obj.items()))
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(state_size(item, seen) for item in list(obj))
+    elif type(obj).__module__ == __name__ and hasattr(obj, "__dict__"):
+        size += state_size(vars(obj), seen)
+    return size
+
+class SessionSlot:
+    def __init__(self, session):
+        self.session = session
+        # Coroutine sessions belong to the event loop; the reaper thread closes them through it
+        self.loop = asyncio.get_running_loop()
+        self.controller = None
+        self.last_active = time.monotonic()
+        self.state_bytes = 0
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self._close)
+
+    def _close(self):
+        # Ask the browser to drop the connection, then release the server side right away
+        try:
+            self.session.send_task_command(dict(command='close_session'))
+        except Exception:
+            pass
+        self.session.close(nonblock=True)
+
+class AdmissionController:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active: Dict[int, SessionSlot] = {}
+        self.waiting: List[SessionSlot] = []
+        self.rejected_total = 0
+        self.reaped_total = 0
+
+    def over_budget(self) -> bool:
+        if MEMORY_BUDGET_MB <= 0:
+            return False
+        rss = resident_bytes()
+        return rss is not None and rss > MEMORY_BUDGET_MB * 1024 * 1024
+
+    def _has_room(self) -> bool:
+        return len(self.active) < MAX_SESSIONS and not self.over_budget()
+
+    def enter(self, slot: SessionSlot) -> Optional[int]:
+        """
+        0 when admitted, else the position in the waiting room; None if that is full too.
+        """
+        with self.lock:
+            if not self.waiting and self._has_room():
+                self.active[id(slot)] = slot
+                return 0
+            if len(self.waiting) >= MAX_WAITING:
+                self.rejected_total += 1
+                return None
+            self.waiting.append(slot)
+            return len(self.waiting)
+
+    def poll(self, slot: SessionSlot) -> int:
+        with self.lock:
+            if self.waiting and self.waiting[0] is slot and self._has_room():
+                self.waiting.pop(0)
+                slot.touch()
+                self.active[id(slot)] = slot
+                return 0
+            return self.waiting.index(slot) + 1 if slot in self.waiting else 0
+
+    def release(self, slot: SessionSlot):
+        with self.lock:
+            self.active.pop(id(slot), None)
+            if slot in self.waiting:
+                self.waiting.remove(slot)
+
+    def reap(self):
+        timeout = PRESSURE_IDLE_TIMEOUT if self.over_budget() else SESSION_IDLE_TIMEOUT
+        now = time.monotonic()
+        with self.lock:
+            slots = list(self.active.values())
+        for slot in slots:
+            slot.state_bytes = state_size(slot.controller) if slot.controller else 0
+            if now - slot.last_active > timeout:
+                self.release(slot)
+                self.reaped_total += 1
+                slot.close()
+
+    def start_reaper(self, interval: float = REAPER_INTERVAL):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reap()
+                except Exception:
+                    log.exception("Session reaper failed")
+        threading.Thread(target=run, name="session-reaper", daemon=True).start()
+
+    def render(self) -> str:
+        with self.lock:
+            active, waiting = list(self.active.values()), len(self.waiting)
+        rss = resident_bytes()
+        lines = [
+            "# HELP modesta_pywebio_sessions_waiting Sessions in the waiting room",
+            "# TYPE modesta_pywebio_sessions_waiting gauge",
+            f"modesta_pywebio_sessions_waiting {waiting}",
+            "# HELP modesta_pywebio_sessions_rejected_total Sessions turned away with the waiting room full",
+            "# TYPE modesta_pywebio_sessions_rejected_total counter",
+            f"modesta_pywebio_sessions_rejected_total {self.rejected_total}",
+            "# HELP modesta_pywebio_sessions_reaped_total Idle sessions closed by the reaper",
+            "# TYPE modesta_pywebio_sessions_reaped_total counter",
+            f"modesta_pywebio_sessions_reaped_total {self.reaped_total}",
+            "# HELP modesta_pywebio_session_state_bytes Approximate per-session state, summed (updated by the reaper)",
+            "# TYPE modesta_pywebio_session_state_bytes gauge",
+            f"modesta_pywebio_session_state_bytes {sum(slot.state_bytes for slot in active)}",
+        ]
+        if rss is not None:
+            lines += [
+                "# HELP modesta_process_resident_memory_bytes Resident set size",
+                "# TYPE modesta_process_resident_memory_bytes gauge",
+                f"modesta_process_resident_memory_bytes {rss}",
+            ]
+        return "\n".join(lines) + "\n"
+
+ADMISSION = AdmissionController()
+
+# Sessions are coroutines on one asyncio event loop rather than a thread each; anything that waits
+# on I/O (pin reads, detail files, checkout checks, order submission) is awaited.
+async def main():
+    slot = SessionSlot(get_current_session())
+    defer_call(lambda: ADMISSION.release(slot))
+    position = ADMISSION.enter(slot)
+    if position is None:
+        UI.render_busy()
+        return
+    while position:
+        UI.render_waiting_room(position)
+        await asyncio.sleep(WAITING_ROOM_POLL)
+        position = ADMISSION.poll(slot)
+    clear()
+
+    METRICS.session_opened()
+    defer_call(METRICS.session_closed)
     app = ShopController()
+    app.slot = slot
+    slot.controller = app
+    await app.restore_visitor()
     app.start()
 
 if __name__ == '__main__':
-    start_server(main, port=5000, debug=True)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    CATALOG.reload()
+    CATALOG.start_watcher()
+    FX.reload()
+    FX.start_watcher()
+    PROMOTIONS.reload()
+    PROMOTIONS.start_watcher()
+    RECOMMENDER.load_order_history(ORDERS_DB)
+    TRENDING.load_order_history(ORDERS_DB)
+    TRENDING.start_refresher()
+    ADMISSION.start_reaper()
+    start_metrics_server()
+    start_server(main, port=5000, debug=True, static_dir=ASSETS_DIR or None)
@@ -0,0 +1,257 @@
+"""
+Micro-benchmarks for the hot primitives behind the store pages.
+
+Every benchmark is run over a range of sizes (cart size or catalog size) so
+the O(N) scaling shows up as a curve instead of a single number.
+
+Usage:
+    python benchmarks/micro.py                 # run everything
+    python benchmarks/micro.py cart render     # only benchmarks whose name matches
+    python benchmarks/micro.py --json out.json # also dump the results for tracking
+"""
+import importlib.util
+import json
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+V3_MAIN = os.path.join(ROOT, "SingleFile", "v3", "main.py")
+FASTAPI_DIR = os.path.join(ROOT, "Fast Api")
+TEMPLATES_DIR = os.path.join(FASTAPI_DIR, "templates")
+
+CART_SIZES = [1, 10, 50, 200, 1000]
+CATALOG_SIZES = [12, 100, 1000, 10000]
+RULE_COUNTS = [10, 100, 1000, 10000]
+CATEGORIES = ["Abayas", "Khimars", "Niqabs", "Accessories"]
+
+
+def load_v3():
+    spec = importlib.util.spec_from_file_location("shop_v3", V3_MAIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_catalog(shop, size):
+    """
+    Builds a synthetic catalog of `size` products by cycling the real one.
+    """
+    base = shop.PRODUCTS_DB
+    products = []
+    for i in range(size):
+        p = base[i % len(base)]
+        products.append(shop.Product(i + 1, p.name, p.name_ar, p.price, CATEGORIES[i % len(CATEGORIES)],
+                                     p.image_url, p.badge, p.description))
+    return products
+
+
+def index_context():
+    """
+    What the / route renders index.html with, for an English EGP visitor with no wishlist or session:
+    the template globals (dynamic_urls, assets) plus localized() and the visitor-state defaults.
+    """
+    if FASTAPI_DIR not in sys.path:
+        sys.path.insert(0, FASTAPI_DIR)
+    import settings
+    from assets import AssetManifest
+    from i18n import translator
+    from money import BASE_CURRENCY, CURRENCIES, FxRates, PriceTable
+    from starlette.requests import Request
+    from static_export import CatalogBadges, dynamic_urls
+
+    request = Request({"type": "http", "method": "GET", "scheme": "http", "server": ("localhost", 8000),
+                       "path": "/", "query_string": b"", "headers": []})
+    assets = AssetManifest(os.path.join(FASTAPI_DIR, settings.ASSETS_DIR), settings.ASSETS_BASE_URL)
+    assets.load()
+    prices = PriceTable(FxRates(0, {BASE_CURRENCY: Decimal(1)}), BASE_CURRENCY, "en")
+    return {
+        "request": request, **dynamic_urls(), "static": False, "assets": assets, "icon": assets.icon,
+        "locale": "en", "t": translator("en"), "prices": prices, "currencies": [BASE_CURRENCY],
+        "money_js": {"rate": "1", "locale": "en", "pattern": CURRENCIES[BASE_CURRENCY]["en"]},
+        "rankings": CatalogBadges(), "related": {}, "wishlist": (), "user": None, "governorates": [],
+        "current_sort": "featured",
+    }
+
+
+class _Sink:
+    """
+    Stands in for the PyWebIO output functions so render_products can be
+    timed without a live session. Only the HTML generation is measured.
+    """
+    def __init__(self):
+        self.html = []
+
+    def __call__(self, *args, **kwargs):
+        for a in args:
+            if isinstance(a, str):
+                self.html.append(a)
+        return self
+
+    def style(self, *args, **kwargs):
+        return self
+
+    def __getattr__(self, name):
+        return self
+
+    # use_scope() is a context manager
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+# --- BENCHMARKS ---
+# Each benchmark takes (shop, size) and returns a zero-argument callable to time.
+
+def bench_cart_add_product(shop, size):
+    catalog = make_catalog(shop, size)
+
+    def run():
+        cart = shop.Cart()
+        for p in catalog:
+            cart.add_product(p, 1)
+    return run
+
+
+def bench_cart_update_quantity(shop, size):
+    catalog = make_catalog(shop, size)
+    cart = shop.Cart()
+    for p in catalog:
+        cart.add_product(p, 1)
+    last_id = catalog[-1].id
+
+    def run():
+        # The last item is the worst case for the linear scan
+        cart.update_quantity(last_id, 1)
+    return run
+
+
+def bench_cart_get_total(shop, size):
+    cart = shop.Cart()
+    for p in make_catalog(shop, size):
+        cart.add_product(p, 2)
+    return cart.get_total
+
+
+def bench_category_filter(shop, size):
+    catalog = make_catalog(shop, size)
+
+    def run():
+        return [p for p in catalog if p.category == "Niqabs"]
+    return run
+
+
+def bench_category_index(shop, size):
+    snapshot = shop.CatalogSnapshot(1, make_catalog(shop, size))
+
+    def run():
+        return snapshot.by_category.get("Niqabs", ())
+    return run
+
+
+def bench_render_products(shop, size):
+    catalog = make_catalog(shop, size)
+    sink = _Sink()
+    for name in ("put_html", "put_buttons", "put_row", "put_column", "put_input", "put_scope", "use_scope"):
+        setattr(shop, name, sink)
+    # The app's price table only covers the real catalog; labels are precomputed either way
+    prices = {p.id: shop.format_money(shop.to_money(p.price)) for p in catalog}
+
+    def run():
+        sink.html.clear()
+        shop.UI.render_products(catalog, on_add_to_cart=None, on_back=None, prices=prices)
+    return run
+
+
+def bench_jinja_index(shop, size):
+    from jinja2 import Environment, FileSystemLoader
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=True)
+    template = env.get_template("index.html")
+    catalog = make_catalog(shop, size)
+    context = index_context()
+
+    def run():
+        return template.render(products=catalog, categories=CATEGORIES, current_category="All",
+                               **context)
+    return run
+
+
+def bench_promotions_price_cart(shop, size):
+    """
+    Prices a 10-line cart against `size` rules spread over a 10k-SKU catalog; should stay flat.
+    """
+    kinds = [
+        lambda i: {"kind": "percent", "percent": 10, "skus": [i % 10000 + 1]},
+        lambda i: {"kind": "buy_x_get_y", "sku": i % 10000 + 1, "buy": 2, "get": 1},
+        lambda i: {"kind": "bundle", "skus": [i % 10000 + 1, (i * 7) % 10000 + 1], "price": "100"},
+        lambda i: {"kind": "percent", "percent": 5, "code": f"FLASH{i}"},
+    ]
+    rules = [shop.compile_promotion(kinds[i % len(kinds)](i), i) for i in range(size)]
+    rules.append(shop.compile_promotion({"kind": "percent", "percent": 15, "categories": ["Niqabs"]}, size))
+    index = shop.PromotionIndex(1, rules)
+    cart = shop.Cart()
+    for p in make_catalog(shop, 10):
+        cart.add_product(p, 3)
+
+    def run():
+        return index.price(cart.items, "FLASH3")
+    return run
+
+
+BENCHMARKS = [
+    ("cart.add_product", bench_cart_add_product, CART_SIZES),
+    ("cart.update_quantity", bench_cart_update_quantity, CART_SIZES),
+    ("cart.get_total", bench_cart_get_total, CART_SIZES),
+    ("catalog.filter_category", bench_category_filter, CATALOG_SIZES),
+    ("catalog.category_index", bench_category_index, CATALOG_SIZES),
+    ("ui.render_products", bench_render_products, CATALOG_SIZES),
+    ("jinja.index_html", bench_jinja_index, CATALOG_SIZES),
+    ("promotions.price_cart", bench_promotions_price_cart, RULE_COUNTS),
+]
+
+
+def measure(func, min_time=0.2):
+    """
+    Returns the best time per call in microseconds (autoranged like timeit's CLI).
+    """
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=5, number=number))
+    return best / number * 1e6
+
+
+def main(argv):
+    json_path = None
+    if "--json" in argv:
+        i = argv.index("--json")
+        json_path = argv[i + 1]
+        argv = argv[:i] + argv[i + 2:]
+    filters = argv
+
+    shop = load_v3()
+    results = {}
+    for name, bench, sizes in BENCHMARKS:
+        if filters and not any(f in name for f in filters):
+            continue
+        print(f"\n{name}")
+        print(f"  {'size':>8}  {'us/call':>12}  {'us/item':>10}")
+        curve = []
+        for size in sizes:
+            us = measure(bench(shop, size))
+            curve.append({"size": size, "us": round(us, 3)})
+            print(f"  {size:>8}  {us:>12.2f}  {us / size:>10.4f}")
+        results[name] = curve
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {json_path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
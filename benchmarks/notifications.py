@@ -0,0 +1,105 @@
+"""
+Notification outbox dispatch throughput by batch size and transport.
+
+Queues MESSAGES order notifications in a fresh outbox database, then drains
+it with the dispatcher and reports messages per second. Transports:
+
+- file: the JSON-lines sink (local disk, the floor set by SQLite bookkeeping);
+- smtp: smtplib against the local SMTP stand-in on a loopback port (one
+  connection per batch, so small batches pay the handshake per message);
+- api: a provider call with a fixed API_LATENCY round trip per request,
+  as for an SMS gateway that takes a list of messages.
+
+Usage:
+    python benchmarks/notifications.py                 # every transport and batch size
+    python benchmarks/notifications.py smtp api        # only these transports
+    python benchmarks/notifications.py --json out.json
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Fast Api"))
+
+from notifications import FileTransport, LocalSmtpSink, Outbox, SmtpTransport  # noqa: E402
+
+BATCH_SIZES = [1, 10, 100, 500]
+MESSAGES = {"file": 5000, "smtp": 2000, "api": 500}
+API_LATENCY = 0.02
+
+
+class ApiTransport:
+    """
+    Stands in for a gateway: every call costs one round trip, whatever the batch size.
+    """
+    def send_batch(self, messages):
+        time.sleep(API_LATENCY)
+        return [None] * len(messages)
+
+
+def make_transport(name: str, directory: str, smtp_port: int):
+    if name == "file":
+        return FileTransport("sms", directory)
+    if name == "smtp":
+        return SmtpTransport("127.0.0.1", smtp_port)
+    return ApiTransport()
+
+
+def run(name: str, batch_size: int, count: int, smtp_port: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        outbox = Outbox(os.path.join(directory, "outbox.db"),
+                        transports={"sms": make_transport(name, directory, smtp_port)}, batch_size=batch_size)
+        rows = [("sms", f"0101{i:07d}", "Order confirmed", f"Your order MOD-{i:05d} is confirmed.", f"MOD-{i}")
+                for i in range(count)]
+        start = time.perf_counter()
+        outbox.enqueue_many(rows)
+        enqueued_in = time.perf_counter() - start
+
+        start = time.perf_counter()
+        handled = outbox.drain()
+        elapsed = time.perf_counter() - start
+        status = outbox.status()["counts"]["sms"]
+    return {
+        "transport": name,
+        "batch": batch_size,
+        "messages": handled,
+        "sent": status.get("sent", 0),
+        "enqueue_per_s": round(count / enqueued_in),
+        "dispatch_s": round(elapsed, 3),
+        "per_s": round(handled / elapsed),
+    }
+
+
+def main(argv):
+    json_path = None
+    if "--json" in argv:
+        i = argv.index("--json")
+        json_path = argv[i + 1]
+        argv = argv[:i] + argv[i + 2:]
+    transports = [t for t in MESSAGES if not argv or t in argv]
+
+    sink = LocalSmtpSink(port=0)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    smtp_port = sink.server_address[1]
+
+    results = []
+    print(f"  {'transport':<10} {'batch':>5} {'messages':>8}  {'dispatch s':>10}  {'msg/s':>8}")
+    for name in transports:
+        for batch_size in BATCH_SIZES:
+            r = run(name, batch_size, MESSAGES[name], smtp_port)
+            results.append(r)
+            print(f"  {name:<10} {batch_size:>5} {r['messages']:>8}  {r['dispatch_s']:>10.3f}  {r['per_s']:>8}")
+    sink.shutdown()
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {json_path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,210 @@
+"""
+Thread-based vs coroutine-based PyWebIO sessions at 1k and 5k shoppers.
+
+Each session runs the same shopper flow as the store: render a page with a
+button, wait for the click, then place an order that spends ORDER_IO seconds
+waiting on the backend and render the confirmation. Thread-based sessions
+block an OS thread on that wait (plus the threads every session keeps
+parked); coroutine sessions are tasks on one event loop and await it.
+
+The sessions are real PyWebIO session objects driven in-process (no browser
+or websocket), so only the session machinery is measured. Each mode and
+size runs in a fresh interpreter, so memory numbers don't mix.
+
+Reported per run: time to open all sessions, OS threads while they are
+open, peak resident memory per session, and how long it takes for one
+checkout click in every session to reach its confirmation (total, p50, p99).
+
+Usage:
+    python benchmarks/sessions.py                # 1000 and 5000 sessions
+    python benchmarks/sessions.py 200 2000       # other session counts
+    python benchmarks/sessions.py --json out.json
+"""
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+SESSION_COUNTS = [1000, 5000]
+MODES = ["threads", "coroutines"]
+ORDER_IO = 0.05
+TIMEOUT = 300
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def session_info():
+    return SimpleNamespace(user_ip="127.0.0.1", user_language="en", user_agent=None, origin="", backend="bench")
+
+
+class Driver:
+    """
+    Stands in for the websocket backend: collects each session's button and confirmation.
+    """
+    def __init__(self, count: int):
+        self.count = count
+        self.lock = threading.Lock()
+        self.buttons = {}
+        self.clicked_at = {}
+        self.latencies = []
+        self.opened = threading.Event()
+        self.confirmed = threading.Event()
+
+    def on_task_command(self, session):
+        for command in session.get_task_commands():
+            spec = command.get("spec") or {}
+            with self.lock:
+                if spec.get("type") == "buttons":
+                    self.buttons[session] = spec["callback_id"]
+                    if len(self.buttons) == self.count:
+                        self.opened.set()
+                elif spec.get("content") == "Order confirmed":
+                    self.latencies.append(time.perf_counter() - self.clicked_at[session])
+                    if len(self.latencies) == self.count:
+                        self.confirmed.set()
+
+    def click_all(self):
+        for session, callback_id in list(self.buttons.items()):
+            self.clicked_at[session] = time.perf_counter()
+            session.send_client_event({"event": "callback", "task_id": callback_id, "data": 0})
+
+
+def thread_shopper():
+    from pywebio.output import put_buttons, put_text
+
+    def checkout():
+        time.sleep(ORDER_IO)
+        put_text("Order confirmed")
+
+    put_text("Modesta")
+    put_buttons(["Confirm Order"], onclick=lambda _: checkout())
+
+
+async def coroutine_shopper():
+    from pywebio.output import put_buttons, put_text
+
+    async def checkout(_):
+        await asyncio.sleep(ORDER_IO)
+        put_text("Order confirmed")
+
+    put_text("Modesta")
+    put_buttons(["Confirm Order"], onclick=checkout)
+
+
+def summarize(driver: Driver, opened_in: float, confirmed_in: float, threads: int, base_rss: int) -> dict:
+    latencies = sorted(driver.latencies)
+    return {
+        "open_s": round(opened_in, 3),
+        "threads": threads,
+        "rss_kb_per_session": round((peak_rss_bytes() - base_rss) / 1024 / driver.count, 1),
+        "click_all_s": round(confirmed_in, 3),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+    }
+
+
+def run_threads(count: int) -> dict:
+    from pywebio.session import register_session_implement
+    from pywebio.session.threadbased import ThreadBasedSession
+
+    register_session_implement(ThreadBasedSession)  # what start_server does for a plain function
+    driver = Driver(count)
+    base_rss = peak_rss_bytes()
+    start = time.perf_counter()
+    sessions = [ThreadBasedSession(thread_shopper, session_info(), on_task_command=driver.on_task_command)
+                for _ in range(count)]
+    if not driver.opened.wait(TIMEOUT):
+        raise RuntimeError("sessions did not open in time")
+    opened_in = time.perf_counter() - start
+    threads = threading.active_count()
+
+    start = time.perf_counter()
+    driver.click_all()
+    if not driver.confirmed.wait(TIMEOUT):
+        raise RuntimeError("orders were not confirmed in time")
+    result = summarize(driver, opened_in, time.perf_counter() - start, threads, base_rss)
+    for session in sessions:
+        session.close(nonblock=True)
+    return result
+
+
+async def run_coroutines(count: int) -> dict:
+    from pywebio.session import register_session_implement
+    from pywebio.session.coroutinebased import CoroutineBasedSession
+
+    register_session_implement(CoroutineBasedSession)
+    driver = Driver(count)
+    loop = asyncio.get_running_loop()
+    base_rss = peak_rss_bytes()
+    start = time.perf_counter()
+    sessions = [CoroutineBasedSession(coroutine_shopper, session_info(), on_task_command=driver.on_task_command)
+                for _ in range(count)]
+    await asyncio.wait_for(loop.run_in_executor(None, driver.opened.wait), TIMEOUT)
+    opened_in = time.perf_counter() - start
+    threads = threading.active_count() - 1  # not counting the executor thread used to wait
+
+    start = time.perf_counter()
+    driver.click_all()
+    await asyncio.wait_for(loop.run_in_executor(None, driver.confirmed.wait), TIMEOUT)
+    result = summarize(driver, opened_in, time.perf_counter() - start, threads, base_rss)
+    for session in sessions:
+        session.close()
+    return result
+
+
+def run_one(mode: str, count: int) -> dict:
+    """
+    Runs one mode and size in a fresh interpreter; a failure (e.g. no more threads) is reported, not raised.
+    """
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", mode, str(count)],
+                          capture_output=True, text=True, timeout=TIMEOUT * 3)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        error = (proc.stderr.strip().splitlines() or ["exit code %d" % proc.returncode])[-1]
+        return {"error": error}
+    return json.loads(lines[-1])
+
+
+def main(argv):
+    if argv[:1] == ["--run"]:
+        mode, count = argv[1], int(argv[2])
+        result = run_threads(count) if mode == "threads" else asyncio.run(run_coroutines(count))
+        print(json.dumps(result))
+        os._exit(0)  # don't wait for thread sessions to wind down
+
+    json_path = None
+    if "--json" in argv:
+        i = argv.index("--json")
+        json_path = argv[i + 1]
+        argv = argv[:i] + argv[i + 2:]
+    counts = [int(a) for a in argv] or SESSION_COUNTS
+
+    results = {}
+    print(f"  {'mode':<11} {'sessions':>8}  {'open s':>7}  {'threads':>7}  {'KB/sess':>8}"
+          f"  {'click s':>7}  {'p50 ms':>7}  {'p99 ms':>7}")
+    for count in counts:
+        for mode in MODES:
+            r = run_one(mode, count)
+            results[f"{mode}/{count}"] = r
+            if "error" in r:
+                print(f"  {mode:<11} {count:>8}  failed: {r['error']}")
+                continue
+            print(f"  {mode:<11} {count:>8}  {r['open_s']:>7.2f}  {r['threads']:>7}  {r['rss_kb_per_session']:>8.1f}"
+                  f"  {r['click_all_s']:>7.2f}  {r['p50_ms']:>7.1f}  {r['p99_ms']:>7.1f}")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {json_path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])